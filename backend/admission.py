@@ -0,0 +1,145 @@
+"""Admission control: bounded concurrency per route class with a short queue.
+
+Requests beyond a class's concurrency limit wait in a small queue for up to
+ADMISSION_QUEUE_TIMEOUT_SECONDS; when the queue is full (or the wait times
+out) the request is shed with 503 + Retry-After instead of piling up on the
+event loop. Limits are per worker process.
+"""
+import asyncio
+import json
+import os
+
+from metrics import Counter, Gauge
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "2"))
+
+# route class -> (default concurrency, default queue size)
+_DEFAULT_LIMITS = {
+    "auth": (8, 16),
+    "read": (48, 96),
+    "write": (24, 48),
+    "export": (2, 4),
+}
+
+AUTH_PATHS = {
+    "/login",
+    "/register",
+    "/logout",
+    "/forgot-password",
+    "/reset-password",
+    "/resend-confirmation",
+    "/check-email",
+}
+
+# POST endpoints that only read.
+BATCH_PATHS = {"/batch"}
+EXEMPT_PATHS = {"/health/live", "/health/ready", "/metrics", "/docs", "/openapi.json"}
+
+admission_in_flight = Gauge("taskflow_admission_in_flight", "Requests currently admitted, by route class.")
+admission_queue_depth = Gauge("taskflow_admission_queue_depth", "Requests waiting for admission, by route class.")
+admission_admitted = Counter("taskflow_admission_admitted_total", "Requests admitted, by route class.")
+admission_rejected = Counter("taskflow_admission_rejected_total", "Requests shed with 503, by route class and reason.")
+
+
+def classify(method: str, path: str) -> str | None:
+    if method == "OPTIONS" or path in EXEMPT_PATHS:
+        return None
+    if path in AUTH_PATHS:
+        return "auth"
+    if path.startswith("/export") or path.endswith("/export"):
+        return "export"
+    if method in {"GET", "HEAD"} or path in BATCH_PATHS:
+        return "read"
+    return "write"
+
+
+class AdmissionLimiter:
+    def __init__(self, route_class: str, concurrency: int, queue_size: int, queue_timeout: float):
+        self.route_class = route_class
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def acquire(self) -> str | None:
+        """Return None when admitted, otherwise the rejection reason."""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return None
+        if self.waiting >= self.queue_size:
+            return "queue_full"
+
+        self.waiting += 1
+        admission_queue_depth.set(self.waiting, route_class=self.route_class)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            return None
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        finally:
+            self.waiting -= 1
+            admission_queue_depth.set(self.waiting, route_class=self.route_class)
+
+    def release(self):
+        self._semaphore.release()
+
+
+def _limits_from_env() -> dict[str, AdmissionLimiter]:
+    limiters = {}
+    for route_class, (concurrency, queue_size) in _DEFAULT_LIMITS.items():
+        prefix = f"ADMISSION_{route_class.upper()}"
+        limiters[route_class] = AdmissionLimiter(
+            route_class,
+            concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+            queue_size=int(os.getenv(f"{prefix}_QUEUE", str(queue_size))),
+            queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        )
+    return limiters
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, limiters: dict[str, AdmissionLimiter] | None = None):
+        self.app = app
+        self.limiters = limiters if limiters is not None else _limits_from_env()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        route_class = classify(scope["method"], scope["path"])
+        limiter = self.limiters.get(route_class) if route_class else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await limiter.acquire()
+        if reason is not None:
+            admission_rejected.inc(route_class=route_class, reason=reason)
+            await _send_overloaded(send)
+            return
+
+        admission_admitted.inc(route_class=route_class)
+        admission_in_flight.inc(route_class=route_class)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_in_flight.dec(route_class=route_class)
+            limiter.release()
+
+
+async def _send_overloaded(send):
+    body = json.dumps({"detail": "Server is busy. Please retry shortly."}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(ADMISSION_RETRY_AFTER_SECONDS).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
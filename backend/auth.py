@@ -4,21 +4,35 @@ from fastapi import HTTPException, Header, Cookie
 from typing import Optional, Any
 import os
 from dotenv import load_dotenv
-import requests
-from supabase import create_client
 import time
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET") 
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 ACCESS_TOKEN_COOKIE = os.getenv("ACCESS_TOKEN_COOKIE", "access_token")
 JWKS_CACHE_TTL_SECONDS = int(os.getenv("JWKS_CACHE_TTL_SECONDS", "300"))
 JWKS_REQUEST_TIMEOUT_SECONDS = float(os.getenv("JWKS_REQUEST_TIMEOUT_SECONDS", "3"))
 _jwks_cache: dict[str, Any] = {"expires_at": 0.0, "data": None}
+_supabase_client = None
+
+
+def get_supabase():
+    """Shared Supabase client, built on first use.
+
+    The supabase/httpx/gotrue stack is imported here rather than at module
+    import so workers start serving without paying for it up front.
+    """
+    global _supabase_client
+    if _supabase_client is None:
+        from supabase import create_client
+
+        _supabase_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY or SUPABASE_KEY)
+    return _supabase_client
+
 
 def get_jwks():
     """Get public keys from Supabase with a short in-memory cache."""
@@ -26,6 +40,8 @@ def get_jwks():
     if _jwks_cache["data"] and now < _jwks_cache["expires_at"]:
         return _jwks_cache["data"]
 
+    import requests
+
     jwks_url = f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json"
     response = requests.get(jwks_url, timeout=JWKS_REQUEST_TIMEOUT_SECONDS)
     response.raise_for_status()
@@ -83,7 +99,7 @@ def verify_token(
 
 def create_user(email: str, password: str):
     """Admin function to create a user"""
-    response = supabase.auth.admin.create_user({
+    response = get_supabase().auth.admin.create_user({
         "email": email,
         "password": password,
         "email_confirm": True
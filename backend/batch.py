@@ -0,0 +1,204 @@
+"""POST /batch: run several read requests in one round trip.
+
+Only the read routes registered in BATCH_ROUTES can be batched. The token
+is verified once for the whole batch and each sub-request calls the route
+handler directly with that user id, so per-request HTTP, middleware and
+JWT work is paid once. Every route has a cost; batches over
+BATCH_MAX_REQUESTS items or BATCH_MAX_COST total are rejected up front.
+Sub-requests run concurrently, at most BATCH_CONCURRENCY at a time, each
+on its own pooled connection. Team membership is checked once per team up
+front and shared by that team's sub-requests.
+"""
+import asyncio
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable
+from urllib.parse import parse_qs, urlsplit
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+
+from auth import verify_token
+from metrics import Counter
+from models.models import BatchItem, BatchRequest
+from storage import storage
+import routes
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "10"))
+BATCH_MAX_COST = int(os.getenv("BATCH_MAX_COST", "20"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+batch_items = Counter("taskflow_batch_items_total", "Batched sub-requests, by route and status.")
+
+router = APIRouter()
+
+_UUID = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+
+
+@dataclass(frozen=True)
+class Param:
+    kind: type
+    default: object = None
+    ge: int | None = None
+    le: int | None = None
+
+
+@dataclass(frozen=True)
+class BatchRoute:
+    name: str
+    pattern: re.Pattern
+    handler: Callable
+    cost: int = 1
+    params: dict[str, Param] = field(default_factory=dict)
+
+
+def _route(name: str, path: str, handler: Callable, cost: int = 1, **params: Param) -> BatchRoute:
+    pattern = re.compile("^" + re.sub(r"\{(\w+)\}", rf"(?P<\1>{_UUID})", path) + "$")
+    return BatchRoute(name, pattern, handler, cost, params)
+
+
+# Query parameters and bounds mirror the Query(...) declarations of each route.
+BATCH_ROUTES = (
+    _route("me", "/users/me", routes.get_current_user),
+    _route("teams", "/teams", routes.get_user_teams),
+    _route("team_invites", "/users/me/team-invites", routes.get_my_team_invites),
+    _route(
+        "tasks", "/tasks", routes.get_tasks_for_user, cost=2,
+        limit=Param(int, 25, 1, 100),
+        offset=Param(int, 0, 0, routes.TASK_LIST_MAX_OFFSET),
+        include_archived=Param(bool, False),
+    ),
+    _route("task", "/tasks/{task_id}", routes.get_task, include_archived=Param(bool, False)),
+    _route("task_full", "/tasks/{task_id}/full", routes.get_task_full, cost=2,
+           comments_limit=Param(int, 50, 1, 200)),
+    _route(
+        "task_comments", "/tasks/{task_id}/comments", routes.get_task_comments,
+        include_archived=Param(bool, False),
+        limit=Param(int, 50, 1, 200),
+        before=Param(str),
+    ),
+    _route("task_graph", "/tasks/{task_id}/graph", routes.get_task_graph, cost=3,
+           upstream_depth=Param(int, 5, 0, 20),
+           downstream_depth=Param(int, 5, 0, 20)),
+    _route("team", "/teams/{team_id}", routes.get_team),
+    _route("team_members", "/teams/{team_id}/members", routes.get_team_members),
+    _route("team_analytics", "/teams/{team_id}/analytics", routes.get_team_analytics, cost=3),
+    _route("team_flow", "/teams/{team_id}/metrics/flow", routes.get_team_flow_metrics, cost=5,
+           window_days=Param(int, 90, 7, 730)),
+)
+
+
+def match_route(path: str) -> tuple[BatchRoute, dict[str, str]] | None:
+    for route in BATCH_ROUTES:
+        match = route.pattern.match(path)
+        if match:
+            return route, match.groupdict()
+    return None
+
+
+def parse_params(route: BatchRoute, query: str) -> dict:
+    raw = parse_qs(query, keep_blank_values=True)
+    unknown = set(raw) - set(route.params)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown query parameter: {sorted(unknown)[0]}")
+
+    values = {}
+    for name, param in route.params.items():
+        if name not in raw:
+            values[name] = param.default
+            continue
+        value = raw[name][-1]
+        if param.kind is bool:
+            lowered = value.strip().lower()
+            if lowered not in {"1", "true", "yes", "on", "0", "false", "no", "off"}:
+                raise HTTPException(status_code=422, detail=f"Invalid value for {name}")
+            values[name] = lowered in {"1", "true", "yes", "on"}
+        elif param.kind is int:
+            try:
+                number = int(value)
+            except ValueError:
+                raise HTTPException(status_code=422, detail=f"Invalid value for {name}")
+            if (param.ge is not None and number < param.ge) or (param.le is not None and number > param.le):
+                raise HTTPException(status_code=422, detail=f"Invalid value for {name}")
+            values[name] = number
+        else:
+            values[name] = value
+    return values
+
+
+async def resolve_memberships(planned: list, user_id: str, semaphore: asyncio.Semaphore) -> dict:
+    """Check the user's membership of each team the batch reads, once per team."""
+    team_ids = {path_params["team_id"] for _, route, path_params, _ in planned if route and "team_id" in path_params}
+
+    async def check(team_id: str) -> bool | None:
+        # On failure the sub-requests check (and report) it themselves.
+        try:
+            async with semaphore:
+                return await storage.teams.is_member(team_id, user_id)
+        except Exception as exc:
+            print(f"Batch membership check error ({team_id}): {exc}")
+            return None
+
+    members = await asyncio.gather(*(check(team_id) for team_id in team_ids))
+    return {(team_id, user_id): member for team_id, member in zip(team_ids, members) if member is not None}
+
+
+async def run_item(item: BatchItem, route: BatchRoute | None, path_params: dict, query: str,
+                   user_id: str, semaphore: asyncio.Semaphore) -> dict:
+    result = {"id": item.id, "path": item.path}
+    try:
+        if route is None:
+            raise HTTPException(status_code=404, detail="Route is not available in batch requests")
+        if item.method.upper() != "GET":
+            raise HTTPException(status_code=405, detail="Only GET requests can be batched")
+
+        params = parse_params(route, query)
+        async with semaphore:
+            payload = await route.handler(**path_params, user_id=user_id, **params)
+
+        # Cached handlers return a ready-made JSON Response.
+        if isinstance(payload, Response):
+            result.update(status=payload.status_code, body=json.loads(payload.body))
+        else:
+            result.update(status=200, body=jsonable_encoder(payload))
+    except HTTPException as exc:
+        result.update(status=exc.status_code, body={"detail": exc.detail})
+    except Exception as exc:
+        print(f"Batch item error ({item.path}): {exc}")
+        result.update(status=500, body={"detail": "Internal server error"})
+
+    batch_items.inc(route=route.name if route else "unknown", status=str(result["status"]))
+    return result
+
+
+@router.post("/batch")
+async def run_batch(batch: BatchRequest, user_id: str = Depends(verify_token)):
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"Batch is limited to {BATCH_MAX_REQUESTS} requests")
+
+    planned = []
+    total_cost = 0
+    for item in batch.requests:
+        url = urlsplit(item.path)
+        matched = match_route(url.path)
+        route, path_params = matched if matched else (None, {})
+        total_cost += route.cost if route else 1
+        planned.append((item, route, path_params, url.query))
+
+    if total_cost > BATCH_MAX_COST:
+        raise HTTPException(status_code=400, detail=f"Batch cost {total_cost} exceeds the limit of {BATCH_MAX_COST}")
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    token = routes.known_memberships.set(await resolve_memberships(planned, user_id, semaphore))
+    try:
+        responses = await asyncio.gather(*(
+            run_item(item, route, path_params, query, user_id, semaphore)
+            for item, route, path_params, query in planned
+        ))
+    finally:
+        routes.known_memberships.reset(token)
+    return {"responses": responses}
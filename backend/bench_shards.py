@@ -0,0 +1,85 @@
+"""Task write and list throughput across the configured team shards.
+
+Creates ``--users`` users with one team each, then every user inserts tasks
+into their team for ``--seconds``; teams land on random shards as in
+production. Afterwards it times the task list (every shard is read and
+merged) at offset 0 and at TASK_LIST_MAX_OFFSET.
+
+It writes to DATABASE_URL and SHARD_DATABASE_URLS, so point it at scratch
+databases, e.g. the ``shards`` profile of docker-compose.yml:
+
+    docker compose --profile shards run --rm backend-shards \
+        sh -c "python migrations.py && python bench_shards.py"
+    docker compose --profile shards run --rm -e SHARD_DATABASE_URLS= backend-shards \
+        sh -c "python migrations.py && python bench_shards.py"
+
+The second run keeps everything on shard 0 for comparison.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from db import SHARD_COUNT, close_pool, init_pool
+from routes import TASK_LIST_MAX_OFFSET
+from storage import storage
+
+
+def _task(team_id) -> dict:
+    return {
+        "title": "bench",
+        "description": None,
+        "status": "todo",
+        "priority": "low",
+        "team_id": team_id,
+        "due_date": None,
+        "assigned_to": None,
+        "recurrence": None,
+    }
+
+
+async def _timed_list(user_id, offset: int, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await storage.tasks.list_for_user(user_id, 25, offset)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+async def run(users: int, seconds: float, repeat: int):
+    await init_pool()
+    try:
+        members = []
+        for index in range(users):
+            user_id = str(uuid.uuid4())
+            await storage.users.upsert(user_id, f"bench-{user_id}@example.com", f"Bench {index}")
+            team = await storage.teams.create(user_id, f"Bench {index}")
+            members.append((user_id, team["id"]))
+
+        inserted = 0
+        stop = time.monotonic() + seconds
+
+        async def writer(user_id, team_id):
+            nonlocal inserted
+            while time.monotonic() < stop:
+                await storage.tasks.create(user_id, _task(team_id))
+                inserted += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(writer(user_id, team_id) for user_id, team_id in members))
+        elapsed = time.monotonic() - started
+        print(f"shards={SHARD_COUNT} writers={users} inserts/s={inserted / elapsed:.0f}")
+
+        user_id = members[0][0]
+        for offset in (0, TASK_LIST_MAX_OFFSET):
+            print(f"task list offset={offset}: {await _timed_list(user_id, offset, repeat):.1f} ms")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=24)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.seconds, args.repeat))
@@ -0,0 +1,135 @@
+"""Task list latency for a user in many large teams.
+
+Seeds ``--teams`` teams of ``--tasks`` tasks each, with ``--members`` other
+members per team, and adds one user to all of them as a plain member (so
+none of the tasks are theirs). It then times that user's task list and
+count (one page plus the total, as GET /tasks returns them) as served
+today, through task_visibility, against the queries used before migration
+0004, which decided visibility with
+``created_by = $1 OR team_id IN (<the user's teams>)``.
+
+It writes to DATABASE_URL (shard 0), so point it at a scratch database:
+
+    export DATABASE_URL=postgresql://postgres@localhost:5432/taskflow_bench
+    python migrations.py && python bench_visibility.py
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from db import close_pool, get_db, init_pool
+from routes import TASK_LIST_MAX_OFFSET
+from sharding import new_id
+from storage import storage
+
+OR_COUNT_QUERY = """
+    SELECT COUNT(*)
+    FROM tasks t
+    WHERE t.created_by = $1
+       OR t.team_id IN (
+            SELECT team_id FROM team_members WHERE user_id = $1
+       )
+"""
+
+OR_LIST_QUERY = """
+    SELECT
+        t.*,
+        u.name AS created_by_name,
+        te.name AS team_name,
+        au.name AS assigned_to_name
+    FROM tasks t
+    LEFT JOIN users u ON u.id = t.created_by
+    LEFT JOIN teams te ON te.id = t.team_id
+    LEFT JOIN team_members atm ON atm.id = t.assigned_to
+    LEFT JOIN users au ON au.id = atm.user_id
+    WHERE t.created_by = $1
+       OR t.team_id IN (
+            SELECT team_id FROM team_members WHERE user_id = $1
+       )
+    ORDER BY t.created_at DESC
+    LIMIT $2
+    OFFSET $3
+"""
+
+
+async def _seed(db, teams: int, tasks: int, members: int) -> str:
+    user_id = str(uuid.uuid4())
+    owner_ids = [uuid.uuid4() for _ in range(teams)]
+    other_ids = [uuid.uuid4() for _ in range(teams * members)]
+    team_ids = [new_id(0) for _ in range(teams)]
+    async with db.transaction():
+        await db.execute("""
+            INSERT INTO users (id, email, name)
+            SELECT id, 'bench-' || id || '@example.com', 'Bench'
+            FROM unnest($1::uuid[]) AS id
+        """, [uuid.UUID(user_id), *owner_ids, *other_ids])
+        await db.execute("""
+            INSERT INTO teams (id, name, owner_id)
+            SELECT id, 'Bench ' || n, owner_id
+            FROM unnest($1::uuid[], $2::uuid[]) WITH ORDINALITY AS s(id, owner_id, n)
+        """, team_ids, owner_ids)
+        await db.execute("""
+            INSERT INTO team_members (user_id, team_id, role)
+            SELECT user_id, team_id, role
+            FROM unnest($1::uuid[], $2::uuid[], $3::text[]) AS m(user_id, team_id, role)
+        """,
+            [*owner_ids, *[uuid.UUID(user_id)] * teams, *other_ids],
+            [*team_ids, *team_ids, *[team_ids[index // members] for index in range(len(other_ids))]],
+            ["admin"] * teams + ["member"] * (teams + len(other_ids)),
+        )
+    # One team per statement, to stay under the command timeout (the
+    # visibility triggers write a row per member for every task).
+    for team_id, owner_id in zip(team_ids, owner_ids):
+        await db.execute("""
+            INSERT INTO tasks (title, status, priority, team_id, created_by, created_at)
+            SELECT 'bench', 'todo', 'low', $1, $2, NOW() - make_interval(secs => i)
+            FROM generate_series(1, $3) AS i
+        """, team_id, owner_id, tasks)
+    await db.execute("ANALYZE")
+    return user_id
+
+
+async def _timed(call, repeat: int) -> float:
+    await call()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await call()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+async def run(teams: int, tasks: int, members: int, repeat: int):
+    await init_pool()
+    try:
+        db = await get_db()
+        try:
+            user_id = await _seed(db, teams, tasks, members)
+            print(f"teams={teams} tasks/team={tasks} members/team={members + 2} visible={teams * tasks}")
+
+            for offset in (0, TASK_LIST_MAX_OFFSET):
+
+                async def before():
+                    await db.fetchval(OR_COUNT_QUERY, user_id)
+                    await db.fetch(OR_LIST_QUERY, user_id, 25, offset)
+
+                async def after():
+                    await storage.tasks.list_for_user(user_id, 25, offset)
+
+                print(
+                    f"task list offset={offset}: "
+                    f"{await _timed(before, repeat):.1f} ms -> {await _timed(after, repeat):.1f} ms"
+                )
+        finally:
+            await db.close()
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--teams", type=int, default=40)
+    parser.add_argument("--tasks", type=int, default=2500)
+    parser.add_argument("--members", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.teams, args.tasks, args.members, args.repeat))
@@ -0,0 +1,184 @@
+"""Shared in-process response cache.
+
+Entries are JSON-encoded once and replayed as-is. Eviction is LRU within a
+byte budget plus a per-entry TTL. Each entry carries tags (``team:<id>``,
+``user:<id>``) and write handlers invalidate by tag. With
+CACHE_NOTIFY_ENABLED, invalidations are also broadcast to the other workers
+through Postgres LISTEN/NOTIFY. Tags are not shard-specific, so the NOTIFY
+always goes to shard 0, whatever shard the write went to, and each worker
+keeps a single LISTEN connection there. It is on by default whenever
+server.py runs more than one worker.
+
+Entries only ever save work after the access check: membership-gated
+routes check membership before reading the cache, so a removed member is
+refused at once even on a worker that missed the invalidation.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from db import connect, get_db
+from metrics import Counter, Gauge
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# server.py exports the worker count it starts; one worker needs no NOTIFY.
+_MULTI_WORKER = int(os.getenv("WEB_CONCURRENCY") or "1") > 1
+CACHE_NOTIFY_ENABLED = os.getenv(
+    "CACHE_NOTIFY_ENABLED", "true" if _MULTI_WORKER else "false"
+).strip().lower() in {"1", "true", "yes", "on"}
+CACHE_NOTIFY_CHANNEL = os.getenv("CACHE_NOTIFY_CHANNEL", "taskflow_cache")
+CACHE_LISTENER_CHECK_SECONDS = 5.0
+
+cache_hits = Counter("taskflow_cache_hits_total", "Response cache hits, by route.")
+cache_misses = Counter("taskflow_cache_misses_total", "Response cache misses, by route.")
+cache_evictions = Counter("taskflow_cache_evictions_total", "Response cache evictions, by reason.")
+cache_bytes = Gauge("taskflow_cache_bytes", "Bytes held by the response cache.")
+cache_entries = Gauge("taskflow_cache_entries", "Entries held by the response cache.")
+
+
+@dataclass
+class _Entry:
+    body: bytes
+    expires_at: float
+    tags: tuple[str, ...]
+
+
+def encode_json(payload) -> bytes:
+    # Same encoding FastAPI's JSONResponse uses.
+    return json.dumps(
+        jsonable_encoder(payload),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._tags: dict[str, set[tuple]] = {}
+        self._bytes = 0
+
+    def get(self, key: tuple) -> Response | None:
+        route = key[0]
+        entry = self._entries.get(key)
+        if entry is None or not CACHE_ENABLED:
+            cache_misses.inc(route=route)
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            cache_evictions.inc(reason="expired")
+            cache_misses.inc(route=route)
+            return None
+        self._entries.move_to_end(key)
+        cache_hits.inc(route=route)
+        return Response(content=entry.body, media_type="application/json")
+
+    def set(self, key: tuple, payload, tags=(), ttl_seconds: float | None = None) -> Response:
+        """Store ``payload`` under ``key`` and return it as a ready Response."""
+        body = encode_json(payload)
+        if CACHE_ENABLED and len(body) <= self.max_bytes:
+            self._remove(key)
+            entry = _Entry(body, time.monotonic() + (ttl_seconds or self.ttl_seconds), tuple(tags))
+            self._entries[key] = entry
+            self._bytes += len(body)
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                cache_evictions.inc(reason="memory")
+            self._report()
+        return Response(content=body, media_type="application/json")
+
+    def invalidate(self, *tags: str) -> int:
+        removed = 0
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                removed += 1
+        if removed:
+            cache_evictions.inc(removed, reason="invalidated")
+            self._report()
+        return removed
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+        self._bytes = 0
+        self._report()
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _report(self):
+        cache_bytes.set(self._bytes)
+        cache_entries.set(len(self._entries))
+
+
+response_cache = ResponseCache()
+
+
+def team_tag(team_id) -> str:
+    return f"team:{team_id}"
+
+
+def user_tag(user_id) -> str:
+    return f"user:{user_id}"
+
+
+async def invalidate(*tags: str):
+    """Drop tagged entries here and, if enabled, in every other worker
+    (through a NOTIFY on shard 0, where they all listen)."""
+    response_cache.invalidate(*tags)
+    if CACHE_NOTIFY_ENABLED and tags:
+        db = await get_db()
+        try:
+            await db.execute("SELECT pg_notify($1, $2)", CACHE_NOTIFY_CHANNEL, ",".join(tags))
+        finally:
+            await db.close()
+
+
+def _on_notify(_connection, _pid, _channel, payload: str):
+    response_cache.invalidate(*[tag for tag in payload.split(",") if tag])
+
+
+async def listen_for_invalidations():
+    """Keep a LISTEN connection to shard 0 open; clear the cache whenever it
+    drops, since invalidations may have been missed while disconnected."""
+    while True:
+        connection = None
+        try:
+            connection = await connect()
+            await connection.add_listener(CACHE_NOTIFY_CHANNEL, _on_notify)
+            while True:
+                await asyncio.sleep(CACHE_LISTENER_CHECK_SECONDS)
+                # A cheap round trip notices half-open connections too.
+                await connection.fetchval("SELECT 1")
+        except asyncio.CancelledError:
+            if connection is not None:
+                await connection.close()
+            raise
+        except Exception as e:
+            print(f"Cache invalidation listener error: {e}")
+        response_cache.clear()
+        await asyncio.sleep(CACHE_LISTENER_CHECK_SECONDS)
@@ -1,116 +1,284 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
+import asyncio
 import asyncpg
+import itertools
 import os
+import time
+
+from metrics import Gauge
 
 load_dotenv()
 
-async def get_db():
-    return await asyncpg.connect(os.environ["DATABASE_URL"], ssl="require")
+DATABASE_SSL = os.getenv("DATABASE_SSL", "require")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MAX_INACTIVE_SECONDS = float(os.getenv("DB_POOL_MAX_INACTIVE_SECONDS", "300"))
+DB_COMMAND_TIMEOUT_SECONDS = float(os.getenv("DB_COMMAND_TIMEOUT_SECONDS", "30"))
+# Background jobs (maintenance.py) hold a connection across their batches
+# and pauses, so they borrow from a separate pool of this size per shard
+# and never take connections from requests.
+DB_MAINTENANCE_POOL_SIZE = int(os.getenv("DB_MAINTENANCE_POOL_SIZE", "2"))
+
+# Optional streaming replicas for get_db(read_only=True). A replica is used
+# only while its measured lag is within REPLICA_MAX_LAG_SECONDS, and a
+# session is kept on the primary for REPLICA_PIN_SECONDS after its own
+# writes (see pin_primary) so it reads what it just wrote.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "2"))
+REPLICA_PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+
+# Team shards: DATABASE_URL is shard 0 (the home shard, which also keeps
+# users' own rows and idempotency keys), SHARD_DATABASE_URLS are shards 1..N-1.
+# Replicas above only serve shard 0. See sharding.py for placement.
+SHARD_DATABASE_URLS = [url.strip() for url in os.getenv("SHARD_DATABASE_URLS", "").split(",") if url.strip()]
+SHARD_COUNT = 1 + len(SHARD_DATABASE_URLS)
+
+# One pool per worker process. It is created from the app lifespan, i.e. after
+# the server has spawned/forked the worker, never at import time.
+_pool: asyncpg.Pool | None = None
+_pool_init = None
+_shard_pools: list[asyncpg.Pool] = []
+_maintenance_pools: list[asyncpg.Pool] = []
+_borrowed: ContextVar[list["PooledConnection"] | None] = ContextVar("db_borrowed", default=None)
+_read_primary: ContextVar[bool] = ContextVar("db_read_primary", default=False)
+
+replica_lag = Gauge("taskflow_replica_lag_seconds", "Replay lag of each read replica (-1 when unreachable).")
+replica_in_rotation = Gauge("taskflow_replica_in_rotation", "1 while a replica is within the lag limit, by replica.")
+
+
+class Replica:
+    def __init__(self, name: str, dsn: str):
+        self.name = name
+        self.dsn = dsn
+        self.pool: asyncpg.Pool | None = None
+        self.lag: float | None = None
+
+    @property
+    def usable(self) -> bool:
+        return self.pool is not None and self.lag is not None and self.lag <= REPLICA_MAX_LAG_SECONDS
+
+
+_replicas = [Replica(f"replica{index}", dsn) for index, dsn in enumerate(DATABASE_REPLICA_URLS)]
+_replica_turn = itertools.count()
+_pinned_until: dict[str, float] = {}
+
+# $1 is the primary's current WAL position, read just before. Zero on a
+# primary or a standby that has replayed up to it, otherwise seconds since
+# the last replayed transaction (NULL if it has replayed none yet). A standby
+# whose WAL receiver is down stops replaying, so it falls out of rotation as
+# soon as the primary writes, even though its own receive and replay
+# positions still match.
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_replay_lsn() >= $1::text::pg_lsn THEN 0
+        ELSE EXTRACT(EPOCH FROM clock_timestamp() - pg_last_xact_replay_timestamp())
+    END::float8
+"""
+
+
+class PooledConnection:
+    """Connection borrowed from the worker pool; close() hands it back."""
+
+    def __init__(self, pool: asyncpg.Pool, connection: asyncpg.Connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    async def close(self):
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        borrowed = _borrowed.get()
+        if borrowed and self in borrowed:
+            borrowed.remove(self)
+        await self._pool.release(connection)
+
+
+async def _create_pool(
+    dsn: str,
+    init=None,
+    min_size: int = DB_POOL_MIN_SIZE,
+    max_size: int = DB_POOL_MAX_SIZE,
+) -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        dsn,
+        ssl=DATABASE_SSL,
+        min_size=min_size,
+        max_size=max_size,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_SECONDS,
+        command_timeout=DB_COMMAND_TIMEOUT_SECONDS,
+        init=init,
+    )
+
+
+async def init_pool(init=None) -> asyncpg.Pool:
+    """Create the worker pool; ``init`` runs on every new connection.
+
+    Shard, maintenance and replica pools are opened here too. A replica
+    that cannot be reached is left out of rotation and retried by
+    monitor_replicas(); a shard that cannot be reached fails startup.
+    """
+    global _pool, _pool_init
+    if _pool is None:
+        _pool_init = init
+        _pool = await _create_pool(os.environ["DATABASE_URL"], init)
+        _shard_pools[:] = await asyncio.gather(*(_create_pool(dsn, init) for dsn in SHARD_DATABASE_URLS))
+        # min_size=0: connections are only opened while a job runs.
+        _maintenance_pools[:] = await asyncio.gather(*(
+            _create_pool(shard_url(shard), min_size=0, max_size=DB_MAINTENANCE_POOL_SIZE)
+            for shard in range(SHARD_COUNT)
+        ))
+        await asyncio.gather(*(_open_replica(replica) for replica in _replicas))
+    return _pool
+
+
+async def _open_replica(replica: Replica):
+    try:
+        replica.pool = await _create_pool(replica.dsn, _pool_init)
+    except (OSError, asyncpg.PostgresError) as e:
+        print(f"Replica {replica.name} unavailable: {e}")
+        return
+    await _check_replica(replica, await _primary_lsn())
+
+
+async def _primary_lsn() -> str | None:
+    try:
+        return await _pool.fetchval("SELECT pg_current_wal_lsn()::text", timeout=REPLICA_LAG_CHECK_SECONDS)
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        print(f"Primary WAL position check failed: {e}")
+        return None
+
+
+async def _check_replica(replica: Replica, primary_lsn: str | None):
+    if primary_lsn is None:
+        # Nothing to measure against; keep the last reading.
+        return
+    try:
+        replica.lag = await replica.pool.fetchval(REPLICA_LAG_QUERY, primary_lsn, timeout=REPLICA_LAG_CHECK_SECONDS)
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        if replica.lag is not None:
+            print(f"Replica {replica.name} lag check failed: {e}")
+        replica.lag = None
+    replica_lag.set(-1 if replica.lag is None else replica.lag, replica=replica.name)
+    replica_in_rotation.set(1 if replica.usable else 0, replica=replica.name)
+
+
+async def monitor_replicas():
+    """Refresh replica lag every REPLICA_LAG_CHECK_SECONDS (runs per worker),
+    measured against the primary's WAL position."""
+    while True:
+        await asyncio.sleep(REPLICA_LAG_CHECK_SECONDS)
+        primary_lsn = await _primary_lsn() if _replicas else None
+        for replica in _replicas:
+            if replica.pool is None:
+                await _open_replica(replica)
+            else:
+                await _check_replica(replica, primary_lsn)
+        now = time.monotonic()
+        for session, until in list(_pinned_until.items()):
+            if until <= now:
+                del _pinned_until[session]
+
+
+def replicas_enabled() -> bool:
+    return bool(_replicas)
+
+
+def pin_primary(session: str):
+    """Send this session's reads to the primary for REPLICA_PIN_SECONDS."""
+    _pinned_until[session] = time.monotonic() + REPLICA_PIN_SECONDS
+
+
+def is_pinned(session: str) -> bool:
+    return _pinned_until.get(session, 0) > time.monotonic()
+
+
+def _pick_replica() -> Replica | None:
+    usable = [replica for replica in _replicas if replica.usable]
+    if not usable:
+        return None
+    return usable[next(_replica_turn) % len(usable)]
+
+
+async def close_pool():
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
+    shard_pools, _shard_pools[:] = list(_shard_pools), []
+    maintenance_pools, _maintenance_pools[:] = list(_maintenance_pools), []
+    for shard_pool in shard_pools + maintenance_pools:
+        await shard_pool.close()
+    for replica in _replicas:
+        replica_pool, replica.pool = replica.pool, None
+        replica.lag = None
+        if replica_pool is not None:
+            await replica_pool.close()
+
+
+def shard_url(shard: int) -> str:
+    return os.environ["DATABASE_URL"] if shard == 0 else SHARD_DATABASE_URLS[shard - 1]
+
+
+async def connect(shard: int = 0):
+    return await asyncpg.connect(shard_url(shard), ssl=DATABASE_SSL)
+
+
+async def get_db(read_only: bool = False, shard: int = 0):
+    """Borrow a pooled connection to ``shard``.
+
+    ``read_only`` routes may be served by a replica, unless the current
+    request is pinned to the primary or no replica is within the lag limit.
+    """
+    if _pool is None:
+        # Scripts and one-off jobs run without the app lifespan.
+        return await connect(shard)
+
+    pool = _shard_pools[shard - 1] if shard else _pool
+    connection = None
+    replica = _pick_replica() if read_only and shard == 0 and not _read_primary.get() else None
+    if replica is not None:
+        try:
+            connection = PooledConnection(replica.pool, await replica.pool.acquire())
+        except (OSError, asyncpg.PostgresError) as e:
+            print(f"Replica {replica.name} acquire failed, using primary: {e}")
+            replica.lag = None
+
+    if connection is None:
+        connection = PooledConnection(pool, await pool.acquire())
+    borrowed = _borrowed.get()
+    if borrowed is not None:
+        borrowed.append(connection)
+    return connection
+
+
+async def get_maintenance_db(shard: int = 0):
+    """Borrow a connection to ``shard`` from the maintenance pool, for
+    background jobs that keep it across batches."""
+    if _pool is None:
+        return await connect(shard)
+    pool = _maintenance_pools[shard]
+    return PooledConnection(pool, await pool.acquire())
+
 
+@asynccontextmanager
+async def request_connections(read_primary: bool = False):
+    """Return connections a request forgot to close (e.g. on an error path).
 
-async def init_db():
-    db = await get_db()
+    ``read_primary`` keeps the request's read-only queries on the primary.
+    """
+    token = _borrowed.set([])
+    primary_token = _read_primary.set(read_primary)
     try:
-        await db.execute("""
-            DO $$
-            BEGIN
-                IF EXISTS (
-                    SELECT 1
-                    FROM information_schema.columns
-                    WHERE table_name = 'tasks'
-                      AND column_name = 'team_id'
-                      AND is_nullable = 'NO'
-                ) THEN
-                    ALTER TABLE tasks ALTER COLUMN team_id DROP NOT NULL;
-                END IF;
-            END $$;
-        """)
-
-        # Legacy schema fix: allow duplicate team names by removing unique
-        # constraints/indexes that enforce uniqueness on teams.name.
-        await db.execute("""
-            DO $$
-            DECLARE
-                name_attnum SMALLINT;
-                rec RECORD;
-            BEGIN
-                SELECT a.attnum
-                INTO name_attnum
-                FROM pg_attribute a
-                WHERE a.attrelid = 'teams'::regclass
-                  AND a.attname = 'name'
-                  AND a.attnum > 0
-                  AND NOT a.attisdropped;
-
-                IF name_attnum IS NOT NULL THEN
-                    FOR rec IN
-                        SELECT c.conname
-                        FROM pg_constraint c
-                        WHERE c.conrelid = 'teams'::regclass
-                          AND c.contype = 'u'
-                          AND c.conkey = ARRAY[name_attnum]
-                    LOOP
-                        EXECUTE format('ALTER TABLE teams DROP CONSTRAINT %I', rec.conname);
-                    END LOOP;
-
-                    FOR rec IN
-                        SELECT i.relname AS index_name
-                        FROM pg_index ix
-                        JOIN pg_class i ON i.oid = ix.indexrelid
-                        JOIN pg_class t ON t.oid = ix.indrelid
-                        WHERE t.oid = 'teams'::regclass
-                          AND ix.indisunique
-                          AND ix.indkey = ARRAY[name_attnum]::int2vector
-                    LOOP
-                        EXECUTE format('DROP INDEX IF EXISTS %I', rec.index_name);
-                    END LOOP;
-                END IF;
-            END $$;
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS task_comments (
-                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                task_id UUID NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
-                user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                content TEXT NOT NULL CHECK (length(trim(content)) > 0),
-                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            )
-        """)
-
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_task_comments_task_id_created_at
-            ON task_comments (task_id, created_at DESC)
-        """)
-
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_task_comments_user_id
-            ON task_comments (user_id)
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS team_invites (
-                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                team_id UUID NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
-                invited_user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                invited_by UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                role TEXT NOT NULL CHECK (role IN ('member', 'admin')),
-                status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'accepted', 'declined')),
-                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                responded_at TIMESTAMPTZ
-            )
-        """)
-
-        await db.execute("""
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_team_invites_pending_unique
-            ON team_invites (team_id, invited_user_id)
-            WHERE status = 'pending'
-        """)
-
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_team_invites_user_status
-            ON team_invites (invited_user_id, status, created_at DESC)
-        """)
+        yield
     finally:
-        await db.close()
+        for connection in list(_borrowed.get() or []):
+            await connection.close()
+        _read_primary.reset(primary_token)
+        _borrowed.reset(token)
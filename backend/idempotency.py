@@ -0,0 +1,157 @@
+"""Idempotency-Key support for POST endpoints.
+
+A request carrying an ``Idempotency-Key`` header first claims the key
+(per user) in idempotency_keys together with a hash of the route and body.
+The claimant runs the handler and stores the encoded response; retries with
+the same key and body are replayed from that row without touching the
+domain tables. Concurrent duplicates wait up to IDEMPOTENCY_WAIT_SECONDS
+for the first request to finish, then get 409. A key reused with a
+different body gets 422. Failed requests release their claim so the client
+can retry. Keys expire after IDEMPOTENCY_TTL_SECONDS; a claim left behind
+by a crashed worker can be taken over after IDEMPOTENCY_LOCK_SECONDS.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from cache import encode_json
+from db import get_db
+from metrics import Counter
+from storage import storage
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "5"))
+IDEMPOTENCY_POLL_SECONDS = 0.1
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+idempotency_requests = Counter("taskflow_idempotency_requests_total", "POST requests with an Idempotency-Key, by outcome.")
+
+# Claims the key, or returns the stored row when someone else holds it.
+# Expired rows and abandoned claims are taken over in place.
+CLAIM_QUERY = """
+    WITH claim AS (
+        INSERT INTO idempotency_keys AS k (user_id, key, request_hash)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (user_id, key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash,
+            status_code = NULL,
+            response = NULL,
+            created_at = NOW()
+        WHERE k.created_at < NOW() - make_interval(secs => $4)
+           OR (k.response IS NULL AND k.created_at < NOW() - make_interval(secs => $5))
+        RETURNING 1
+    )
+    SELECT TRUE AS claimed, NULL::bytea AS request_hash, NULL::smallint AS status_code, NULL::bytea AS response
+    FROM claim
+    UNION ALL
+    SELECT FALSE, request_hash, status_code, response
+    FROM idempotency_keys
+    WHERE user_id = $1
+      AND key = $2
+      AND NOT EXISTS (SELECT 1 FROM claim)
+"""
+
+
+def request_hash(route: str, payload) -> bytes:
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{route}\n{body}".encode()).digest()
+
+
+def _replay(row) -> Response:
+    return Response(
+        content=bytes(row["response"]),
+        status_code=row["status_code"],
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def _claim(user_id: str, key: str, digest: bytes):
+    """Return None once the key is ours, otherwise the replayed Response."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        db = await get_db()
+        try:
+            row = await db.fetchrow(CLAIM_QUERY, user_id, key, digest,
+                                    IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_LOCK_SECONDS)
+        finally:
+            await db.close()
+
+        if row is not None:
+            if row["claimed"]:
+                return None
+            if bytes(row["request_hash"]) != digest:
+                idempotency_requests.inc(outcome="mismatch")
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key was already used with a different request"
+                )
+            if row["response"] is not None:
+                idempotency_requests.inc(outcome="replayed")
+                return _replay(row)
+
+        # In flight elsewhere (or released between our statements).
+        if time.monotonic() >= deadline:
+            idempotency_requests.inc(outcome="conflict")
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress"
+            )
+        await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+
+async def run_idempotent(key: str | None, user_id: str, route: str, payload, handler):
+    """Run ``handler()`` at most once per (user, key); replay it otherwise."""
+    if key is None:
+        return await handler()
+
+    key = key.strip()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key header")
+    if not storage.uses_database:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is not supported by this storage backend")
+
+    replayed = await _claim(user_id, key, request_hash(route, payload))
+    if replayed is not None:
+        return replayed
+
+    try:
+        result = await handler()
+    except Exception:
+        db = await get_db()
+        try:
+            await db.execute("""
+                DELETE FROM idempotency_keys
+                WHERE user_id = $1
+                  AND key = $2
+                  AND response IS NULL
+            """, user_id, key)
+        finally:
+            await db.close()
+        raise
+
+    if isinstance(result, Response):
+        status_code, body = result.status_code, result.body
+    else:
+        status_code, body = 200, encode_json(result)
+
+    db = await get_db()
+    try:
+        await db.execute("""
+            UPDATE idempotency_keys
+            SET status_code = $3, response = $4
+            WHERE user_id = $1
+              AND key = $2
+        """, user_id, key, status_code, body)
+    finally:
+        await db.close()
+
+    idempotency_requests.inc(outcome="stored")
+    return Response(content=body, status_code=status_code, media_type="application/json")
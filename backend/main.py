@@ -1,14 +1,42 @@
+import time
+
+_BOOT_STARTED = time.perf_counter()
+
+import asyncio
+import hashlib
 import os
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+import metrics
+from admission import BATCH_PATHS, AdmissionMiddleware
+from auth import ACCESS_TOKEN_COOKIE, get_jwks
+from batch import router as batch_router
+from cache import CACHE_NOTIFY_ENABLED, listen_for_invalidations
+from db import (
+    REPLICA_PIN_SECONDS,
+    close_pool,
+    init_pool,
+    is_pinned,
+    monitor_replicas,
+    pin_primary,
+    replicas_enabled,
+    request_connections,
+)
+from maintenance import start_jobs, stop_jobs
+from migrations import ensure_schema
+from outbox import OUTBOX_WORKER_ENABLED, invite_worker
+from routes import COOKIE_DOMAIN, COOKIE_SAMESITE, COOKIE_SECURE, router as tasks_router
+from storage import storage
+from storage.postgres import prepare_hot_statements
 
-from db import init_db
-from routes import router as tasks_router
+REPLICA_PIN_COOKIE = os.getenv("REPLICA_PIN_COOKIE", "db_primary_until")
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
 
 
 def _parse_bool(value: str, default: bool) -> bool:
@@ -29,11 +57,131 @@ def _parse_allowed_origins() -> list[str]:
     return ["http://localhost:3000", "http://127.0.0.1:3000"]
 
 
+def _pin_cookie_header() -> tuple[bytes, bytes]:
+    response = Response()
+    response.set_cookie(
+        key=REPLICA_PIN_COOKIE,
+        value=str(int(time.time() + REPLICA_PIN_SECONDS)),
+        httponly=True,
+        secure=COOKIE_SECURE,
+        samesite=COOKIE_SAMESITE,
+        domain=COOKIE_DOMAIN,
+        path="/",
+        max_age=int(REPLICA_PIN_SECONDS) + 1,
+    )
+    return next(header for header in response.raw_headers if header[0] == b"set-cookie")
+
+
+class DatabaseConnectionMiddleware:
+    """Hand pooled connections back even when a handler exits early.
+
+    With read replicas configured it also gives read-your-writes: a
+    successful write pins the caller's session (keyed by a hash of its
+    token) to the primary for REPLICA_PIN_SECONDS in this worker, and a
+    short-lived cookie carries the pin to the other workers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not replicas_enabled():
+            async with request_connections():
+                await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        token = request.headers.get("authorization") or request.cookies.get(ACCESS_TOKEN_COOKIE)
+        session = hashlib.sha256(token.encode()).hexdigest() if token else None
+        pinned_until = request.cookies.get(REPLICA_PIN_COOKIE, "")
+        pinned = (session is not None and is_pinned(session)) or (
+            pinned_until.isdigit() and int(pinned_until) > time.time()
+        )
+        is_write = scope["method"] not in READ_METHODS and scope["path"] not in BATCH_PATHS
+
+        async def send_with_pin(message):
+            # Pin before the response goes out so the client's next read
+            # cannot overtake it.
+            if is_write and message["type"] == "http.response.start" and message["status"] < 400:
+                if session is not None:
+                    pin_primary(session)
+                message["headers"] = [*message.get("headers", []), _pin_cookie_header()]
+            await send(message)
+
+        async with request_connections(read_primary=pinned):
+            await self.app(scope, receive, send_with_pin)
+
+
+startup_phases: dict[str, float] = {}
+
+
+@contextmanager
+def _startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_phases[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def _prefetch_jwks():
+    with _startup_phase("jwks"):
+        try:
+            await asyncio.to_thread(get_jwks)
+        except Exception as e:
+            # Not fatal: verify_token fetches the keys on first use.
+            print(f"JWKS prefetch failed: {e}")
+
+
+async def _open_pool():
+    # Runs once per worker process, so every worker owns its own pool. The
+    # pool opens DB_POOL_MIN_SIZE connections and prepares the hot
+    # statements on each before create_pool returns.
+    with _startup_phase("pool"):
+        await init_pool(init=prepare_hot_statements)
+
+
 @asynccontextmanager
-async def lifespan(_: FastAPI):
-    # Keep a minimum startup schema check; for strict prod use managed migrations.
-    await init_db()
-    yield
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    startup_phases["imports"] = round((_LIFESPAN_READY - _BOOT_STARTED) * 1000, 1)
+    if storage.uses_database:
+        # One version query when the schema is current; otherwise the first
+        # worker to take the migration lock applies pending migrations.
+        with _startup_phase("schema"):
+            await ensure_schema()
+        await asyncio.gather(_prefetch_jwks(), _open_pool())
+    else:
+        # No database: no migrations, pool or background workers.
+        await _prefetch_jwks()
+    startup_phases["total"] = round((time.perf_counter() - _BOOT_STARTED) * 1000, 1)
+    print(
+        f"Startup [pid {os.getpid()}] "
+        + " ".join(f"{name}={ms}ms" for name, ms in startup_phases.items())
+    )
+    if storage.uses_database:
+        if OUTBOX_WORKER_ENABLED:
+            invite_worker.start()
+        start_jobs()
+    listen = CACHE_NOTIFY_ENABLED and storage.uses_database
+    cache_listener = asyncio.create_task(listen_for_invalidations()) if listen else None
+    replica_monitor = asyncio.create_task(monitor_replicas()) if replicas_enabled() else None
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        # Fail readiness first so load balancers stop routing here.
+        app.state.ready = False
+        for background in (cache_listener, replica_monitor):
+            if background is not None:
+                background.cancel()
+                await asyncio.gather(background, return_exceptions=True)
+        await invite_worker.stop()
+        await stop_jobs()
+        await close_pool()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -41,14 +189,18 @@ app = FastAPI(lifespan=lifespan)
 allow_origins = _parse_allowed_origins()
 allow_credentials = _parse_bool(os.getenv("CORS_ALLOW_CREDENTIALS", "true"), True)
 
+# Added before CORS so shed (503) responses still carry CORS headers.
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allow_origins,
     allow_credentials=allow_credentials,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "Idempotency-Key"],
+    expose_headers=["Idempotent-Replayed"],
 )
 app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.add_middleware(DatabaseConnectionMiddleware)
 
 
 @app.exception_handler(Exception)
@@ -61,10 +213,31 @@ async def unhandled_exception_handler(_: Request, exc: Exception):
     )
 
 
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready", "startup_ms": startup_phases}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 app.include_router(tasks_router)
+app.include_router(batch_router)
+
+_LIFESPAN_READY = time.perf_counter()
 
 
 if __name__ == "__main__":
+    # Single-process dev server; use `python server.py` in production.
     uvicorn.run(
         "main:app",
         host=os.getenv("HOST", "127.0.0.1"),
@@ -0,0 +1,757 @@
+"""Background maintenance jobs.
+
+TaskArchiver moves done tasks older than ARCHIVE_AFTER_DAYS (and their
+comments) into tasks_archive, ARCHIVE_BATCH_SIZE rows per transaction with a
+short pause between batches so row locks are held only briefly.
+
+Purger works through deletion_jobs: a deleted team or task is hidden from
+reads at once, and its comments, tasks, invites and memberships are removed
+PURGE_BATCH_SIZE rows at a time with PURGE_BATCH_PAUSE_SECONDS between
+batches. Progress is kept on the job row and exported on /metrics.
+
+CounterRepair recomputes team_task_counters one team at a time and fixes
+any drift from the trigger-maintained values. VisibilityRepair does the
+same for task_visibility, diffing each team's rows against its tasks and
+members.
+
+IdempotencyKeyPurger deletes idempotency_keys rows older than
+IDEMPOTENCY_TTL_SECONDS in batches.
+
+RankRebalancer respaces a board column once any of its rank keys has grown
+past RANK_MAX_LENGTH, one column per transaction, keeping the order.
+
+UserReplicationRetry copies users rows still in user_replication_queue (a
+shard was unreachable when they were written) to the other shards.
+
+Jobs run inside each API worker by default and work through every shard in
+turn; a session advisory lock (per shard) makes sure only one worker does a
+given job on a shard at a time. ``python maintenance.py``
+runs them on their own; ``python maintenance.py repair-counters`` and
+``python maintenance.py repair-visibility`` run one repair pass and exit.
+"""
+import asyncio
+import os
+import sys
+
+from db import SHARD_COUNT, get_maintenance_db, init_pool
+from idempotency import IDEMPOTENCY_TTL_SECONDS
+from metrics import Counter, Gauge
+from ranking import RANK_MAX_LENGTH, spread
+from sharding import replicate_users
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+ARCHIVE_BATCH_PAUSE_SECONDS = float(os.getenv("ARCHIVE_BATCH_PAUSE_SECONDS", "0.2"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "600"))
+
+PURGE_ENABLED = os.getenv("PURGE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_BATCH_PAUSE_SECONDS = float(os.getenv("PURGE_BATCH_PAUSE_SECONDS", "0.1"))
+PURGE_INTERVAL_SECONDS = float(os.getenv("PURGE_INTERVAL_SECONDS", "30"))
+
+COUNTER_REPAIR_ENABLED = os.getenv("COUNTER_REPAIR_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+COUNTER_REPAIR_INTERVAL_SECONDS = float(os.getenv("COUNTER_REPAIR_INTERVAL_SECONDS", "86400"))
+COUNTER_REPAIR_PAUSE_SECONDS = float(os.getenv("COUNTER_REPAIR_PAUSE_SECONDS", "0.05"))
+
+VISIBILITY_REPAIR_ENABLED = os.getenv("VISIBILITY_REPAIR_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+VISIBILITY_REPAIR_INTERVAL_SECONDS = float(os.getenv("VISIBILITY_REPAIR_INTERVAL_SECONDS", "86400"))
+VISIBILITY_REPAIR_PAUSE_SECONDS = float(os.getenv("VISIBILITY_REPAIR_PAUSE_SECONDS", "0.05"))
+
+IDEMPOTENCY_PURGE_ENABLED = os.getenv("IDEMPOTENCY_PURGE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+IDEMPOTENCY_PURGE_BATCH_SIZE = int(os.getenv("IDEMPOTENCY_PURGE_BATCH_SIZE", "1000"))
+IDEMPOTENCY_PURGE_PAUSE_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_PAUSE_SECONDS", "0.05"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "3600"))
+
+RANK_REBALANCE_ENABLED = os.getenv("RANK_REBALANCE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+RANK_REBALANCE_INTERVAL_SECONDS = float(os.getenv("RANK_REBALANCE_INTERVAL_SECONDS", "300"))
+RANK_REBALANCE_PAUSE_SECONDS = float(os.getenv("RANK_REBALANCE_PAUSE_SECONDS", "0.1"))
+
+USER_REPLICATION_ENABLED = os.getenv("USER_REPLICATION_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+USER_REPLICATION_BATCH_SIZE = int(os.getenv("USER_REPLICATION_BATCH_SIZE", "500"))
+USER_REPLICATION_INTERVAL_SECONDS = float(os.getenv("USER_REPLICATION_INTERVAL_SECONDS", "30"))
+USER_REPLICATION_RETRY_SECONDS = float(os.getenv("USER_REPLICATION_RETRY_SECONDS", "60"))
+
+VISIBILITY_REPAIR_LOCK_ID = 720_114_034
+ARCHIVE_LOCK_ID = 720_114_035
+PURGE_LOCK_ID = 720_114_036
+COUNTER_REPAIR_LOCK_ID = 720_114_037
+IDEMPOTENCY_PURGE_LOCK_ID = 720_114_043
+RANK_REBALANCE_LOCK_ID = 720_114_047
+USER_REPLICATION_LOCK_ID = 720_114_045
+
+tasks_archived = Counter("taskflow_tasks_archived_total", "Done tasks moved to tasks_archive.")
+purge_rows_deleted = Counter("taskflow_purge_rows_deleted_total", "Rows removed by the purger, by job kind and step.")
+purge_jobs_finished = Counter("taskflow_purge_jobs_finished_total", "Deletion jobs completed, by kind.")
+purge_jobs_open = Gauge("taskflow_purge_jobs_open", "Deletion jobs not yet finished.")
+counters_repaired = Counter("taskflow_counter_repairs_total", "Teams whose task counters had drifted and were rebuilt.")
+visibility_rows_repaired = Counter("taskflow_visibility_rows_repaired_total", "task_visibility rows fixed by the repair, by change.")
+idempotency_keys_purged = Counter("taskflow_idempotency_keys_purged_total", "Expired idempotency keys removed.")
+columns_rebalanced = Counter("taskflow_rank_columns_rebalanced_total", "Board columns whose rank keys were respaced.")
+users_replicated = Counter("taskflow_user_replication_retries_total", "Queued users rows retried by the replication job, by outcome.")
+
+
+class PeriodicJob:
+    """Runs ``run_batch`` until it reports no work, then sleeps ``interval``."""
+
+    name = "job"
+    lock_id = 0
+
+    def __init__(self, interval_seconds: float, pause_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.pause_seconds = pause_seconds
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def wake(self):
+        """Skip the rest of the current interval."""
+        self._wake.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def run_forever(self):
+        while True:
+            self._wake.clear()
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{self.name} error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> int:
+        """Process batches on every shard until none is left; return the rows handled."""
+        total = 0
+        for shard in range(SHARD_COUNT):
+            total += await self._run_shard(shard)
+        return total
+
+    async def _run_shard(self, shard: int) -> int:
+        # From the maintenance pool: the connection is kept across batches
+        # and pauses, as the advisory lock is tied to it.
+        db = await get_maintenance_db(shard=shard)
+        try:
+            if not await db.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_id):
+                return 0
+            try:
+                total = 0
+                while True:
+                    handled = await self.run_batch(db, shard)
+                    total += handled
+                    if not handled:
+                        return total
+                    await asyncio.sleep(self.pause_seconds)
+            finally:
+                await db.execute("SELECT pg_advisory_unlock($1)", self.lock_id)
+        finally:
+            await db.close()
+
+    async def run_batch(self, db, shard: int) -> int:
+        raise NotImplementedError
+
+
+class TaskArchiver(PeriodicJob):
+    name = "Task archiver"
+    lock_id = ARCHIVE_LOCK_ID
+
+    def __init__(
+        self,
+        after_days: int = ARCHIVE_AFTER_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        interval_seconds: float = ARCHIVE_INTERVAL_SECONDS,
+        pause_seconds: float = ARCHIVE_BATCH_PAUSE_SECONDS,
+    ):
+        super().__init__(interval_seconds, pause_seconds)
+        self.after_days = after_days
+        self.batch_size = batch_size
+
+    async def run_batch(self, db, shard: int) -> int:
+        async with db.transaction():
+            # Archived tasks stay in team_task_counters.
+            await db.execute("SET LOCAL taskflow.archiving = 'on'")
+            moved = await self._archive(db)
+        if moved:
+            tasks_archived.inc(moved)
+        return moved
+
+    async def _archive(self, db) -> int:
+        # Deleting the task cascades to its comments, visibility rows,
+        # dependencies and stored occurrences.
+        return await db.fetchval("""
+            WITH batch AS (
+                SELECT id
+                FROM tasks
+                WHERE status = 'done'
+                  AND completed_at < NOW() - make_interval(days => $1)
+                  AND deleted_at IS NULL
+                  AND NOT EXISTS (
+                      SELECT 1 FROM teams d
+                      WHERE d.id = tasks.team_id AND d.deleted_at IS NOT NULL
+                  )
+                ORDER BY completed_at
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            ),
+            archived AS (
+                INSERT INTO tasks_archive (id, team_id, created_by, created_at, completed_at, data, comments)
+                SELECT
+                    t.id,
+                    t.team_id,
+                    t.created_by,
+                    t.created_at,
+                    t.completed_at,
+                    to_jsonb(t),
+                    COALESCE((
+                        SELECT jsonb_agg(to_jsonb(c) ORDER BY c.created_at)
+                        FROM task_comments c
+                        WHERE c.task_id = t.id
+                    ), '[]'::jsonb)
+                FROM tasks t
+                JOIN batch b ON b.id = t.id
+                ON CONFLICT (id) DO UPDATE SET
+                    data = EXCLUDED.data,
+                    comments = EXCLUDED.comments,
+                    archived_at = NOW()
+                RETURNING id
+            ),
+            removed AS (
+                DELETE FROM tasks t
+                USING archived a
+                WHERE t.id = a.id
+                RETURNING t.id
+            )
+            SELECT COUNT(*) FROM removed
+        """, self.after_days, self.batch_size)
+
+
+# kind -> ordered (step, statement) pairs. Each statement deletes at most
+# $2 rows belonging to target $1; a step is done once it deletes nothing.
+# Children go first so no single statement cascades into a large set; the
+# last step removes the target row itself.
+_PURGE_STEPS = {
+    "team": [
+        ("comments", """
+            DELETE FROM task_comments
+            WHERE id IN (
+                SELECT c.id
+                FROM tasks t
+                JOIN task_comments c ON c.task_id = t.id
+                WHERE t.team_id = $1
+                LIMIT $2
+            )
+        """),
+        ("visibility", """
+            DELETE FROM task_visibility
+            WHERE (user_id, task_id) IN (
+                SELECT v.user_id, v.task_id
+                FROM tasks t
+                JOIN task_visibility v ON v.task_id = t.id
+                WHERE t.team_id = $1
+                LIMIT $2
+            )
+        """),
+        ("dependencies", """
+            DELETE FROM task_dependencies
+            WHERE (task_id, blocked_by) IN (
+                SELECT task_id, blocked_by
+                FROM task_dependencies
+                WHERE team_id = $1
+                LIMIT $2
+            )
+        """),
+        ("occurrences", """
+            DELETE FROM task_occurrences
+            WHERE (task_id, occurs_at) IN (
+                SELECT o.task_id, o.occurs_at
+                FROM tasks t
+                JOIN task_occurrences o ON o.task_id = t.id
+                WHERE t.team_id = $1
+                LIMIT $2
+            )
+        """),
+        ("tasks", """
+            DELETE FROM tasks
+            WHERE id IN (SELECT id FROM tasks WHERE team_id = $1 LIMIT $2)
+        """),
+        ("status_events", """
+            DELETE FROM task_status_events
+            WHERE id IN (SELECT id FROM task_status_events WHERE team_id = $1 LIMIT $2)
+        """),
+        ("archived_tasks", """
+            DELETE FROM tasks_archive
+            WHERE id IN (SELECT id FROM tasks_archive WHERE team_id = $1 LIMIT $2)
+        """),
+        ("invites", """
+            DELETE FROM team_invites
+            WHERE id IN (SELECT id FROM team_invites WHERE team_id = $1 LIMIT $2)
+        """),
+        ("members", """
+            DELETE FROM team_members
+            WHERE id IN (SELECT id FROM team_members WHERE team_id = $1 LIMIT $2)
+        """),
+        ("counters", """
+            DELETE FROM team_task_counters
+            WHERE (team_id, assigned_to, status, priority) IN (
+                SELECT team_id, assigned_to, status, priority
+                FROM team_task_counters
+                WHERE team_id = $1
+                LIMIT $2
+            )
+        """),
+        ("team", """
+            DELETE FROM teams
+            WHERE id = $1 AND deleted_at IS NOT NULL
+        """),
+    ],
+    "task": [
+        ("comments", """
+            DELETE FROM task_comments
+            WHERE id IN (SELECT id FROM task_comments WHERE task_id = $1 LIMIT $2)
+        """),
+        ("dependencies", """
+            DELETE FROM task_dependencies
+            WHERE (task_id, blocked_by) IN (
+                SELECT task_id, blocked_by FROM task_dependencies WHERE task_id = $1
+                UNION ALL
+                SELECT task_id, blocked_by FROM task_dependencies WHERE blocked_by = $1
+                LIMIT $2
+            )
+        """),
+        ("occurrences", """
+            DELETE FROM task_occurrences
+            WHERE (task_id, occurs_at) IN (
+                SELECT task_id, occurs_at FROM task_occurrences WHERE task_id = $1 LIMIT $2
+            )
+        """),
+        ("task", """
+            DELETE FROM tasks
+            WHERE id = $1 AND deleted_at IS NOT NULL
+        """),
+    ],
+}
+
+
+def _deleted_count(status: str) -> int:
+    # asyncpg returns the command tag, e.g. "DELETE 500".
+    return int(status.split()[-1])
+
+
+class Purger(PeriodicJob):
+    name = "Purger"
+    lock_id = PURGE_LOCK_ID
+
+    def __init__(
+        self,
+        batch_size: int = PURGE_BATCH_SIZE,
+        interval_seconds: float = PURGE_INTERVAL_SECONDS,
+        pause_seconds: float = PURGE_BATCH_PAUSE_SECONDS,
+    ):
+        super().__init__(interval_seconds, pause_seconds)
+        self.batch_size = batch_size
+
+    async def run_batch(self, db, shard: int) -> int:
+        """Run one bounded delete for the oldest open job."""
+        job = await db.fetchrow("""
+            SELECT id, kind, target_id, step
+            FROM deletion_jobs
+            WHERE status <> 'done'
+            ORDER BY id
+            LIMIT 1
+        """)
+        if job is None:
+            purge_jobs_open.set(0, shard=shard)
+            return 0
+
+        steps = _PURGE_STEPS[job["kind"]]
+        names = [name for name, _ in steps]
+        start = names.index(job["step"]) if job["step"] in names else 0
+        for name, statement in steps[start:]:
+            args = (job["target_id"],) if name == names[-1] else (job["target_id"], self.batch_size)
+            deleted = _deleted_count(await db.execute(statement, *args))
+            if not deleted:
+                continue
+            await db.execute("""
+                UPDATE deletion_jobs
+                SET status = 'running', step = $2, rows_deleted = rows_deleted + $3, updated_at = NOW()
+                WHERE id = $1
+            """, job["id"], name, deleted)
+            purge_rows_deleted.inc(deleted, kind=job["kind"], step=name)
+            if name != names[-1]:
+                return deleted
+
+        await db.execute("""
+            UPDATE deletion_jobs
+            SET status = 'done', step = NULL, updated_at = NOW(), finished_at = NOW()
+            WHERE id = $1
+        """, job["id"])
+        purge_jobs_finished.inc(kind=job["kind"])
+        purge_jobs_open.set(await db.fetchval("SELECT COUNT(*) FROM deletion_jobs WHERE status <> 'done'"), shard=shard)
+        return 1
+
+
+_NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
+
+async def rebuild_team_counters(db, team_id) -> bool:
+    """Recompute one team's task counters; return True if they had drifted."""
+    async with db.transaction():
+        # The counter trigger takes the same per-team lock (0016), so no task
+        # write of this team lands between the count and the swap, while
+        # other teams' writes carry on.
+        await db.execute("SELECT lock_team_writes($1)", team_id)
+        drifted = await db.fetchval("""
+            WITH fresh AS (
+                SELECT assigned_to, status, priority, COUNT(*) AS task_count
+                FROM (
+                    SELECT COALESCE(t.assigned_to, $2::uuid) AS assigned_to, t.status, t.priority
+                    FROM tasks t
+                    WHERE t.team_id = $1
+                      AND t.deleted_at IS NULL
+                    UNION ALL
+                    SELECT COALESCE((a.data->>'assigned_to')::uuid, $2::uuid),
+                           a.data->>'status',
+                           a.data->>'priority'
+                    FROM tasks_archive a
+                    WHERE a.team_id = $1
+                ) AS counted
+                GROUP BY assigned_to, status, priority
+            ),
+            stored AS (
+                SELECT assigned_to, status, priority, task_count
+                FROM team_task_counters
+                WHERE team_id = $1
+                  AND task_count <> 0
+            )
+            SELECT EXISTS (
+                SELECT 1
+                FROM fresh f
+                FULL JOIN stored s USING (assigned_to, status, priority)
+                WHERE f.task_count IS DISTINCT FROM s.task_count
+            )
+        """, team_id, _NIL_UUID)
+        if not drifted:
+            return False
+
+        await db.execute("DELETE FROM team_task_counters WHERE team_id = $1", team_id)
+        await db.execute("""
+            INSERT INTO team_task_counters (team_id, assigned_to, status, priority, task_count)
+            SELECT $1, assigned_to, status, priority, COUNT(*)
+            FROM (
+                SELECT COALESCE(t.assigned_to, $2::uuid) AS assigned_to, t.status, t.priority
+                FROM tasks t
+                WHERE t.team_id = $1
+                  AND t.deleted_at IS NULL
+                UNION ALL
+                SELECT COALESCE((a.data->>'assigned_to')::uuid, $2::uuid),
+                       a.data->>'status',
+                       a.data->>'priority'
+                FROM tasks_archive a
+                WHERE a.team_id = $1
+            ) AS counted
+            GROUP BY assigned_to, status, priority
+        """, team_id, _NIL_UUID)
+    counters_repaired.inc()
+    return True
+
+
+# Who may see each task of team $1: its creator and every member.
+_EXPECTED_VISIBILITY = """
+    SELECT t.created_by AS user_id, t.id AS task_id, t.created_at, t.team_id
+    FROM tasks t
+    WHERE t.team_id = $1
+      AND t.deleted_at IS NULL
+      AND t.created_by IS NOT NULL
+    UNION
+    SELECT tm.user_id, t.id, t.created_at, t.team_id
+    FROM tasks t
+    JOIN team_members tm ON tm.team_id = t.team_id
+    WHERE t.team_id = $1
+      AND t.deleted_at IS NULL
+"""
+
+
+async def rebuild_team_visibility(db, team_id) -> tuple[int, int]:
+    """Fix one team's task_visibility rows; return (added, removed)."""
+    async with db.transaction():
+        # The same lock the visibility triggers take, so no task or
+        # membership write of this team lands between the diff and the fix.
+        await db.execute("SELECT lock_team_writes($1)", team_id)
+        row = await db.fetchrow(f"""
+            WITH expected AS ({_EXPECTED_VISIBILITY}),
+            removed AS (
+                DELETE FROM task_visibility v
+                USING tasks t
+                WHERE v.task_id = t.id
+                  AND t.team_id = $1
+                  AND NOT EXISTS (
+                      SELECT 1
+                      FROM expected e
+                      WHERE e.user_id = v.user_id
+                        AND e.task_id = v.task_id
+                  )
+                RETURNING 1
+            ),
+            added AS (
+                INSERT INTO task_visibility (user_id, task_id, created_at, team_id)
+                SELECT user_id, task_id, created_at, team_id
+                FROM expected
+                ON CONFLICT DO NOTHING
+                RETURNING 1
+            )
+            SELECT
+                (SELECT COUNT(*) FROM added) AS added,
+                (SELECT COUNT(*) FROM removed) AS removed
+        """, team_id)
+    if row["added"]:
+        visibility_rows_repaired.inc(row["added"], change="added")
+    if row["removed"]:
+        visibility_rows_repaired.inc(row["removed"], change="removed")
+    return row["added"], row["removed"]
+
+
+class TeamRepair(PeriodicJob):
+    """Runs ``repair`` for one live team per batch, in id order."""
+
+    def __init__(self, interval_seconds: float, pause_seconds: float):
+        super().__init__(interval_seconds, pause_seconds)
+        self._after = {}  # shard -> last team id checked
+
+    async def run_batch(self, db, shard: int) -> int:
+        """Check the next team in id order; 0 once every team is done."""
+        team_id = await db.fetchval("""
+            SELECT id
+            FROM teams
+            WHERE deleted_at IS NULL
+              AND ($1::uuid IS NULL OR id > $1::uuid)
+            ORDER BY id
+            LIMIT 1
+        """, self._after.get(shard))
+        if team_id is None:
+            self._after.pop(shard, None)
+            return 0
+        await self.repair(db, team_id)
+        self._after[shard] = team_id
+        return 1
+
+    async def repair(self, db, team_id):
+        raise NotImplementedError
+
+
+class CounterRepair(TeamRepair):
+    name = "Counter repair"
+    lock_id = COUNTER_REPAIR_LOCK_ID
+
+    def __init__(
+        self,
+        interval_seconds: float = COUNTER_REPAIR_INTERVAL_SECONDS,
+        pause_seconds: float = COUNTER_REPAIR_PAUSE_SECONDS,
+    ):
+        super().__init__(interval_seconds, pause_seconds)
+
+    async def repair(self, db, team_id):
+        if await rebuild_team_counters(db, team_id):
+            print(f"Rebuilt drifted task counters for team {team_id}")
+
+
+class VisibilityRepair(TeamRepair):
+    name = "Visibility repair"
+    lock_id = VISIBILITY_REPAIR_LOCK_ID
+
+    def __init__(
+        self,
+        interval_seconds: float = VISIBILITY_REPAIR_INTERVAL_SECONDS,
+        pause_seconds: float = VISIBILITY_REPAIR_PAUSE_SECONDS,
+    ):
+        super().__init__(interval_seconds, pause_seconds)
+
+    async def repair(self, db, team_id):
+        added, removed = await rebuild_team_visibility(db, team_id)
+        if added or removed:
+            print(f"Fixed task visibility for team {team_id}: {added} added, {removed} removed")
+
+
+class IdempotencyKeyPurger(PeriodicJob):
+    name = "Idempotency key purger"
+    lock_id = IDEMPOTENCY_PURGE_LOCK_ID
+
+    def __init__(
+        self,
+        ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+        batch_size: int = IDEMPOTENCY_PURGE_BATCH_SIZE,
+        interval_seconds: float = IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+        pause_seconds: float = IDEMPOTENCY_PURGE_PAUSE_SECONDS,
+    ):
+        super().__init__(interval_seconds, pause_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.batch_size = batch_size
+
+    async def run_batch(self, db, shard: int) -> int:
+        deleted = _deleted_count(await db.execute("""
+            DELETE FROM idempotency_keys
+            WHERE (user_id, key) IN (
+                SELECT user_id, key
+                FROM idempotency_keys
+                WHERE created_at < NOW() - make_interval(secs => $1)
+                ORDER BY created_at
+                LIMIT $2
+            )
+        """, self.ttl_seconds, self.batch_size))
+        if deleted:
+            idempotency_keys_purged.inc(deleted)
+        return deleted
+
+
+class RankRebalancer(PeriodicJob):
+    name = "Rank rebalancer"
+    lock_id = RANK_REBALANCE_LOCK_ID
+
+    def __init__(
+        self,
+        max_length: int = RANK_MAX_LENGTH,
+        interval_seconds: float = RANK_REBALANCE_INTERVAL_SECONDS,
+        pause_seconds: float = RANK_REBALANCE_PAUSE_SECONDS,
+    ):
+        super().__init__(interval_seconds, pause_seconds)
+        self.max_length = max_length
+
+    async def run_batch(self, db, shard: int) -> int:
+        """Respace one column with an over-long key; 0 when there is none."""
+        # Longest key first, read off idx_tasks_rank_length.
+        column = await db.fetchrow("""
+            SELECT team_id, status
+            FROM tasks
+            WHERE rank IS NOT NULL
+              AND length(rank) > $1
+            ORDER BY length(rank) DESC
+            LIMIT 1
+        """, self.max_length)
+        if column is None:
+            return 0
+
+        async with db.transaction():
+            # Keys are rewritten in place, so uniqueness is checked at commit.
+            await db.execute("SET CONSTRAINTS tasks_team_status_rank_key DEFERRED")
+            ids = await db.fetch("""
+                SELECT id
+                FROM tasks
+                WHERE team_id = $1
+                  AND status = $2
+                  AND rank IS NOT NULL
+                ORDER BY rank
+                FOR UPDATE
+            """, column["team_id"], column["status"])
+            ids = [row["id"] for row in ids]
+            await db.execute("""
+                UPDATE tasks t
+                SET rank = respaced.rank
+                FROM unnest($1::uuid[], $2::text[]) AS respaced(id, rank)
+                WHERE t.id = respaced.id
+            """, ids, spread(len(ids)))
+        columns_rebalanced.inc()
+        print(f"Respaced {len(ids)} rank(s) in team {column['team_id']} column {column['status']}")
+        return 1
+
+
+class UserReplicationRetry(PeriodicJob):
+    name = "User replication retry"
+    lock_id = USER_REPLICATION_LOCK_ID
+
+    def __init__(
+        self,
+        batch_size: int = USER_REPLICATION_BATCH_SIZE,
+        retry_seconds: float = USER_REPLICATION_RETRY_SECONDS,
+        interval_seconds: float = USER_REPLICATION_INTERVAL_SECONDS,
+    ):
+        super().__init__(interval_seconds, 0)
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+
+    async def run_batch(self, db, shard: int) -> int:
+        """Copy one batch of due queued users; 0 when none is due."""
+        # Pushed back first, so a failed copy waits retry_seconds; a copy
+        # that succeeds deletes the rows.
+        user_ids = await db.fetch("""
+            UPDATE user_replication_queue
+            SET attempts = attempts + 1,
+                next_attempt_at = NOW() + make_interval(secs => $2)
+            WHERE user_id IN (
+                SELECT user_id
+                FROM user_replication_queue
+                WHERE next_attempt_at <= NOW()
+                ORDER BY next_attempt_at
+                LIMIT $1
+            )
+            RETURNING user_id
+        """, self.batch_size, self.retry_seconds)
+        if not user_ids:
+            return 0
+        copied = await replicate_users([row["user_id"] for row in user_ids], source=shard, db=db)
+        users_replicated.inc(len(user_ids), outcome="copied" if copied else "failed")
+        return len(user_ids)
+
+
+task_archiver = TaskArchiver()
+purger = Purger()
+counter_repair = CounterRepair()
+visibility_repair = VisibilityRepair()
+idempotency_key_purger = IdempotencyKeyPurger()
+rank_rebalancer = RankRebalancer()
+user_replication_retry = UserReplicationRetry()
+
+
+def start_jobs():
+    if ARCHIVE_ENABLED:
+        task_archiver.start()
+    if PURGE_ENABLED:
+        purger.start()
+    if COUNTER_REPAIR_ENABLED:
+        counter_repair.start()
+    if VISIBILITY_REPAIR_ENABLED:
+        visibility_repair.start()
+    if IDEMPOTENCY_PURGE_ENABLED:
+        idempotency_key_purger.start()
+    if RANK_REBALANCE_ENABLED:
+        rank_rebalancer.start()
+    if USER_REPLICATION_ENABLED:
+        user_replication_retry.start()
+
+
+async def stop_jobs():
+    await task_archiver.stop()
+    await purger.stop()
+    await counter_repair.stop()
+    await visibility_repair.stop()
+    await idempotency_key_purger.stop()
+    await rank_rebalancer.stop()
+    await user_replication_retry.stop()
+
+
+async def _main(argv: list[str]):
+    await init_pool()
+    if argv[:1] == ["repair-counters"]:
+        print(f"Checked {await counter_repair.run_once()} team(s)")
+        return
+    if argv[:1] == ["repair-visibility"]:
+        print(f"Checked {await visibility_repair.run_once()} team(s)")
+        return
+    start_jobs()
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
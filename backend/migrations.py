@@ -0,0 +1,185 @@
+"""Versioned schema migrations.
+
+Files in ``sql/migrations/`` are named ``NNNN_description.sql`` and applied in
+version order. Each applied file is recorded in ``schema_migrations`` with a
+checksum so edits to an already-applied migration are caught. A file whose
+first line is ``-- migrate:no-transaction`` is run statement by statement
+outside a transaction, which ``CREATE INDEX CONCURRENTLY`` requires; such
+files are split on trailing semicolons, so keep DO blocks out of them.
+
+Every shard (see db.SHARD_DATABASE_URLS) carries the full schema and is
+migrated in turn; 0000 creates the base tables, so an empty database can
+be migrated from scratch.
+
+Usage: ``python migrations.py`` applies pending migrations,
+``python migrations.py status`` lists them.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import asyncpg
+
+from db import SHARD_COUNT, connect
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "sql" / "migrations"
+NO_TRANSACTION_MARKER = "-- migrate:no-transaction"
+# Arbitrary, but fixed: every worker and the CLI must agree on it.
+MIGRATION_LOCK_ID = 720_114_026
+MIGRATION_LOCK_POLL_SECONDS = 0.5
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").strip().lower() in {"1", "true", "yes", "on"}
+
+_FILENAME_PATTERN = re.compile(r"^(\d+)_([A-Za-z0-9_-]+)\.sql$")
+_STATEMENT_END = re.compile(r";[ \t]*$", re.MULTILINE)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self) -> list[str]:
+        statements = []
+        for chunk in _STATEMENT_END.split(self.sql):
+            code = [line for line in chunk.splitlines() if line.strip() and not line.strip().startswith("--")]
+            if code:
+                statements.append(chunk.strip())
+        return statements
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> list[Migration]:
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        match = _FILENAME_PATTERN.match(path.name)
+        if not match:
+            raise RuntimeError(f"Unexpected migration file name: {path.name}")
+        migrations.append(Migration(int(match.group(1)), match.group(2), path.read_text(encoding="utf-8")))
+
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError("Duplicate migration versions in sql/migrations/")
+    return sorted(migrations, key=lambda migration: migration.version)
+
+
+async def current_version(db) -> int:
+    try:
+        return await db.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def _acquire_lock(db):
+    # Poll instead of blocking in pg_advisory_lock: a waiting session holds a
+    # snapshot, which would stall CREATE INDEX CONCURRENTLY in the migrator.
+    while not await db.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATION_LOCK_ID):
+        await asyncio.sleep(MIGRATION_LOCK_POLL_SECONDS)
+
+
+async def _apply(db, migration: Migration):
+    if migration.transactional:
+        async with db.transaction():
+            await db.execute(migration.sql)
+            await db.execute("""
+                INSERT INTO schema_migrations (version, name, checksum)
+                VALUES ($1, $2, $3)
+            """, migration.version, migration.name, migration.checksum)
+        return
+
+    # Non-transactional files must be idempotent: a failure part-way leaves
+    # the earlier statements applied and the whole file is retried next run.
+    for statement in migration.statements():
+        await db.execute(statement)
+    await db.execute("""
+        INSERT INTO schema_migrations (version, name, checksum)
+        VALUES ($1, $2, $3)
+    """, migration.version, migration.name, migration.checksum)
+
+
+async def migrate(db, migrations: list[Migration] | None = None) -> list[int]:
+    """Apply pending migrations under an advisory lock; return the versions applied."""
+    migrations = load_migrations() if migrations is None else migrations
+    await _acquire_lock(db)
+    try:
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """)
+        applied = {
+            row["version"]: row["checksum"]
+            for row in await db.fetch("SELECT version, checksum FROM schema_migrations")
+        }
+
+        for migration in migrations:
+            checksum = applied.get(migration.version)
+            if checksum is not None and checksum != migration.checksum:
+                raise RuntimeError(
+                    f"Migration {migration.version:04d}_{migration.name} was modified after it was applied"
+                )
+
+        done = []
+        for migration in migrations:
+            if migration.version in applied:
+                continue
+            print(f"Applying migration {migration.version:04d}_{migration.name}")
+            await _apply(db, migration)
+            done.append(migration.version)
+        return done
+    finally:
+        await db.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+
+async def ensure_schema():
+    """Boot-path check: a single version query per shard when the schema is current."""
+    migrations = load_migrations()
+    latest = migrations[-1].version if migrations else 0
+
+    for shard in range(SHARD_COUNT):
+        db = await connect(shard)
+        try:
+            if await current_version(db) >= latest:
+                continue
+            if not MIGRATE_ON_STARTUP:
+                raise RuntimeError(f"Database schema of shard {shard} is behind; run `python migrations.py`.")
+            await migrate(db, migrations)
+        finally:
+            await db.close()
+
+
+async def _main(argv: list[str]):
+    for shard in range(SHARD_COUNT):
+        if SHARD_COUNT > 1:
+            print(f"Shard {shard}:")
+        db = await connect(shard)
+        try:
+            if argv[:1] == ["status"]:
+                applied = await db.fetch("SELECT version FROM schema_migrations") if await current_version(db) else []
+                applied_versions = {row["version"] for row in applied}
+                for migration in load_migrations():
+                    state = "applied" if migration.version in applied_versions else "pending"
+                    print(f"{migration.version:04d}_{migration.name}: {state}")
+                continue
+            applied = await migrate(db)
+            print(f"Applied {len(applied)} migration(s)")
+        finally:
+            await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
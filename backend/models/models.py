@@ -28,6 +28,7 @@ class TaskCreate(BaseModel):
     team_id: Optional[UUID] = None
     due_date: Optional[datetime] = None
     assigned_to: Optional[UUID] = None
+    recurrence: Optional[str] = None  # e.g. FREQ=WEEKLY;BYDAY=MO,TH
         
 class TaskUpdate(BaseModel):
     title: Optional[str] = None
@@ -36,6 +37,21 @@ class TaskUpdate(BaseModel):
     priority: Optional[PriorityLevel] = None
     due_date: Optional[datetime] = None
     assigned_to: Optional[UUID] = None
+    recurrence: Optional[str] = None
+
+class OccurrenceUpdate(BaseModel):
+    status: Optional[StatusLevel] = None
+    title: Optional[str] = None
+    due_date: Optional[datetime] = None
+    skipped: Optional[bool] = None
+
+class TaskMove(BaseModel):
+    status: Optional[StatusLevel] = None
+    before_id: Optional[UUID] = None  # task directly above
+    after_id: Optional[UUID] = None  # task directly below
+
+class TaskDependencyCreate(BaseModel):
+    blocked_by: UUID
 
 class Task(BaseModel):
     id: UUID
@@ -48,6 +64,8 @@ class Task(BaseModel):
     assigned_to: Optional[UUID] = None
     created_at: datetime
     due_date: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    recurrence: Optional[str] = None
     
 # Team Member Models
 class TeamMemberCreate(BaseModel):
@@ -55,6 +73,11 @@ class TeamMemberCreate(BaseModel):
     email: Optional[str] = None
     role: TeamRole = TeamRole.MEMBER
 
+class TeamMemberBulkCreate(BaseModel):
+    emails: list[str] = []
+    user_ids: list[UUID] = []
+    role: TeamRole = TeamRole.MEMBER
+
 class TeamMember(BaseModel):
     id: UUID
     user_id: UUID  
@@ -111,3 +134,12 @@ class ResendConfirmationRequest(BaseModel):
 class UserProfileUpdateRequest(BaseModel):
     name: str
    
+
+# Batch Models
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+
+class BatchRequest(BaseModel):
+    requests: list[BatchItem]
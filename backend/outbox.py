@@ -0,0 +1,279 @@
+"""Background dispatch of invite emails from the invite_outbox table.
+
+add_team_member writes the invite and its outbox row in one statement; this
+worker claims due rows in batches (FOR UPDATE SKIP LOCKED, so several
+workers can share the table), calls the auth provider with bounded
+concurrency, links the provisioned user to the invite, and reschedules
+failures with exponential backoff.
+
+Each shard has its own invite_outbox (invites live with their team), so
+every run polls all shards. Runs inside each API worker by default
+(OUTBOX_WORKER_ENABLED) or on its own with ``python outbox.py``.
+"""
+import asyncio
+import os
+from typing import Callable
+
+from auth import get_supabase
+from db import SHARD_COUNT, get_db, init_pool
+from metrics import Counter
+from sharding import queue_replication, replicate_users
+
+OUTBOX_WORKER_ENABLED = os.getenv("OUTBOX_WORKER_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "10"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+# A claimed row becomes due again after this long if its worker dies mid-send.
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+
+outbox_sent = Counter("taskflow_outbox_sent_total", "Invite emails dispatched.")
+outbox_failed = Counter("taskflow_outbox_failed_total", "Invite email attempts that failed, by outcome.")
+
+
+class PermanentInviteError(Exception):
+    """The invite cannot succeed on retry."""
+
+
+def display_name_from_email(email: str) -> str:
+    return (email.split("@")[0] or "User").replace(".", " ").replace("_", " ").strip().title() or "User"
+
+
+def supabase_invite(email: str, redirect_to: str) -> str | None:
+    """Send the invite; return the auth user id, or None if already registered."""
+    try:
+        response = get_supabase().auth.admin.invite_user_by_email(email, {"redirect_to": redirect_to})
+    except Exception as e:
+        error_message = str(e).lower()
+        if "already registered" in error_message:
+            return None
+        if "invalid email" in error_message:
+            raise PermanentInviteError(str(e)) from e
+        raise
+    invited_user = getattr(response, "user", None)
+    if invited_user is None:
+        raise RuntimeError("Invite response did not include a user")
+    return str(invited_user.id)
+
+
+class InviteOutboxWorker:
+    def __init__(
+        self,
+        inviter: Callable[[str, str], str | None] = supabase_invite,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        concurrency: int = OUTBOX_CONCURRENCY,
+        poll_seconds: float = OUTBOX_POLL_SECONDS,
+    ):
+        self.inviter = inviter
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def wake(self):
+        """Skip the rest of the poll interval (called after new rows commit)."""
+        self._wake.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def run_forever(self):
+        while True:
+            # Cleared before the run so a wake() during it is not lost.
+            self._wake.clear()
+            try:
+                processed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Invite outbox error: {e}")
+                processed = 0
+            if processed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> int:
+        """Process one batch per shard; returns the largest batch size."""
+        # Shared, so self.concurrency bounds auth provider calls across shards.
+        semaphore = asyncio.Semaphore(self.concurrency)
+        processed = await asyncio.gather(*(self._run_shard(shard, semaphore) for shard in range(SHARD_COUNT)))
+        return max(processed)
+
+    async def _run_shard(self, shard: int, semaphore: asyncio.Semaphore) -> int:
+        db = await get_db(shard=shard)
+        try:
+            rows = await db.fetch("""
+                UPDATE invite_outbox o
+                SET attempts = o.attempts + 1,
+                    next_attempt_at = NOW() + make_interval(secs => $2)
+                WHERE o.id IN (
+                    SELECT id
+                    FROM invite_outbox
+                    WHERE status = 'pending'
+                      AND next_attempt_at <= NOW()
+                    ORDER BY next_attempt_at
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING o.id, o.invite_id, o.email, o.redirect_to, o.attempts
+            """, self.batch_size, OUTBOX_LEASE_SECONDS)
+        finally:
+            await db.close()
+
+        if not rows:
+            return 0
+
+        async def dispatch(row):
+            async with semaphore:
+                try:
+                    return row, await asyncio.to_thread(self.inviter, row["email"], row["redirect_to"]), None
+                except Exception as e:
+                    return row, None, e
+
+        results = await asyncio.gather(*(dispatch(row) for row in rows))
+        await self._record(results, shard)
+        return len(rows)
+
+    async def _record(self, results, shard: int = 0):
+        sent_ids, sent_user_ids, sent_names = [], [], []
+        existing_ids = []
+        failed_ids, failed_errors, failed_delays, failed_final = [], [], [], []
+
+        for row, user_id, error in results:
+            if error is None and user_id is not None:
+                sent_ids.append(row["id"])
+                sent_user_ids.append(user_id)
+                sent_names.append(display_name_from_email(row["email"]))
+            elif error is None:
+                existing_ids.append(row["id"])
+            else:
+                final = isinstance(error, PermanentInviteError) or row["attempts"] >= OUTBOX_MAX_ATTEMPTS
+                delay = min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (row["attempts"] - 1))
+                failed_ids.append(row["id"])
+                failed_errors.append(str(error)[:500])
+                failed_delays.append(delay)
+                failed_final.append(final)
+
+        db = await get_db(shard=shard)
+        try:
+            if sent_ids:
+                async with db.transaction():
+                    await db.execute("""
+                        WITH done AS (
+                            SELECT d.outbox_id, d.user_id, d.name, o.email, o.invite_id
+                            FROM unnest($1::bigint[], $2::uuid[], $3::text[]) AS d(outbox_id, user_id, name)
+                            JOIN invite_outbox o ON o.id = d.outbox_id
+                        ),
+                        provisioned AS (
+                            INSERT INTO users (id, email, name)
+                            SELECT user_id, email, name FROM done
+                            ON CONFLICT (id) DO UPDATE SET
+                                email = EXCLUDED.email
+                        ),
+                        linked AS (
+                            UPDATE team_invites ti
+                            SET invited_user_id = d.user_id
+                            FROM done d
+                            WHERE ti.id = d.invite_id
+                              AND ti.invited_user_id IS NULL
+                              AND NOT EXISTS (
+                                  SELECT 1
+                                  FROM team_invites other
+                                  WHERE other.team_id = ti.team_id
+                                    AND other.invited_user_id = d.user_id
+                                    AND other.status = 'pending'
+                              )
+                        )
+                        UPDATE invite_outbox o
+                        SET status = 'sent', sent_at = NOW(), last_error = NULL
+                        FROM done d
+                        WHERE o.id = d.outbox_id
+                    """, sent_ids, sent_user_ids, sent_names)
+                    await queue_replication(db, sent_user_ids)
+                outbox_sent.inc(len(sent_ids))
+
+            if existing_ids:
+                # Already registered with the auth provider: link the invite to
+                # the app user, or fail permanently if there is none.
+                unmatched = await db.fetch("""
+                    WITH matched AS (
+                        SELECT o.id AS outbox_id, o.invite_id, u.id AS user_id
+                        FROM invite_outbox o
+                        JOIN users u ON LOWER(u.email) = o.email
+                        WHERE o.id = ANY($1::bigint[])
+                    ),
+                    linked AS (
+                        UPDATE team_invites ti
+                        SET invited_user_id = m.user_id
+                        FROM matched m
+                        WHERE ti.id = m.invite_id
+                          AND ti.invited_user_id IS NULL
+                          AND NOT EXISTS (
+                              SELECT 1
+                              FROM team_invites other
+                              WHERE other.team_id = ti.team_id
+                                AND other.invited_user_id = m.user_id
+                                AND other.status = 'pending'
+                          )
+                    ),
+                    sent AS (
+                        UPDATE invite_outbox o
+                        SET status = 'sent', sent_at = NOW(), last_error = NULL
+                        FROM matched m
+                        WHERE o.id = m.outbox_id
+                    )
+                    SELECT id
+                    FROM unnest($1::bigint[]) AS id
+                    WHERE id NOT IN (SELECT outbox_id FROM matched)
+                """, existing_ids)
+                outbox_sent.inc(len(existing_ids) - len(unmatched))
+                for row in unmatched:
+                    failed_ids.append(row["id"])
+                    failed_errors.append("User exists in auth but not in app users table")
+                    failed_delays.append(0)
+                    failed_final.append(True)
+
+            if failed_ids:
+                await db.execute("""
+                    UPDATE invite_outbox o
+                    SET status = CASE WHEN f.final THEN 'failed' ELSE 'pending' END,
+                        last_error = f.error,
+                        next_attempt_at = NOW() + make_interval(secs => f.delay)
+                    FROM unnest($1::bigint[], $2::text[], $3::float8[], $4::bool[])
+                        AS f(outbox_id, error, delay, final)
+                    WHERE o.id = f.outbox_id
+                """, failed_ids, failed_errors, failed_delays, failed_final)
+                for final in failed_final:
+                    outbox_failed.inc(outcome="failed" if final else "retry")
+        finally:
+            await db.close()
+        # After the connection is back, as replicate_users borrows its own.
+        await replicate_users(sent_user_ids, source=shard)
+
+
+invite_worker = InviteOutboxWorker()
+
+
+async def _main():
+    await init_pool()
+    await invite_worker.run_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,59 @@
+"""Fractional rank keys for manual task order within a board column.
+
+A key is a base-62 fraction written as a string ("V" is 0.5): keys sort
+byte-wise (the rank column uses the "C" collation) and there is always a
+key between two different ones, so a move rewrites only the moved task.
+Keys never end in "0", which keeps every fraction to a single spelling.
+
+Keys grow by about one character per six moves into the same gap; the
+rank rebalancer in maintenance.py respaces a column once any key is longer
+than RANK_MAX_LENGTH.
+"""
+import os
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+RANK_MAX_LENGTH = int(os.getenv("RANK_MAX_LENGTH", "32"))
+
+_BASE = len(DIGITS)
+
+
+def _midpoint(low: str, high: str | None) -> str:
+    """Shortest key strictly between ``low`` ("" is 0) and ``high`` (None is 1)."""
+    if high is not None:
+        # Copy the shared prefix (a missing low digit counts as "0").
+        n = 0
+        while n < len(high) and (low[n] if n < len(low) else "0") == high[n]:
+            n += 1
+        if n:
+            return high[:n] + _midpoint(low[n:], high[n:])
+
+    low_digit = DIGITS.index(low[0]) if low else 0
+    high_digit = DIGITS.index(high[0]) if high is not None else _BASE
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    if high is not None and len(high) > 1:
+        return high[0]
+    return DIGITS[low_digit] + _midpoint(low[1:], None)
+
+
+def key_between(before: str | None, after: str | None) -> str:
+    """Key sorting after ``before`` and before ``after`` (None: column end)."""
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"rank {before!r} does not sort before {after!r}")
+    return _midpoint(before or "", after)
+
+
+def spread(count: int) -> list[str]:
+    """``count`` evenly spaced keys, in order, as short as possible."""
+    width = 1
+    while _BASE ** width <= count:
+        width += 1
+    step = _BASE ** width // (count + 1)
+    keys = []
+    for position in range(1, count + 1):
+        value, digits = position * step, []
+        for _ in range(width):
+            value, digit = divmod(value, _BASE)
+            digits.append(DIGITS[digit])
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
@@ -0,0 +1,262 @@
+"""Recurring tasks: one tasks row per series, occurrences expanded on read.
+
+A series is a task with a ``recurrence`` rule, a subset of RFC 5545 RRULE:
+
+    FREQ=DAILY|WEEKLY|MONTHLY[;INTERVAL=n][;BYDAY=MO,WE,...][;COUNT=n|;UNTIL=...]
+
+anchored at the task's due date (BYDAY is for WEEKLY only). Monthly series
+on the 29th-31st fall on the last day of shorter months. Occurrences are
+computed in UTC and never stored; task_occurrences keeps only the ones
+that were completed, edited, moved or skipped, keyed by their original
+slot. tasks.recurrence_ends_at holds the last slot of a bounded series
+(series_end), so the calendar can leave ended series out.
+
+Occurrence n is a closed-form function of n, so a window is expanded by
+bisecting for its first and last index and generating just that range;
+the result is cached per (rule, start, window) in RECURRENCE_CACHE_SIZE
+entries, as the calendar asks for the same few windows over and over.
+"""
+import bisect
+import calendar
+import os
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+RECURRENCE_CACHE_SIZE = int(os.getenv("RECURRENCE_CACHE_SIZE", "4096"))
+RECURRENCE_MAX_WINDOW_DAYS = int(os.getenv("RECURRENCE_MAX_WINDOW_DAYS", "400"))
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+_FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+
+
+@dataclass(frozen=True)
+class Rule:
+    freq: str
+    interval: int = 1
+    weekdays: tuple[int, ...] = ()
+    count: int | None = None
+    until: datetime | None = None
+
+    def __str__(self) -> str:
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.weekdays:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in self.weekdays))
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until:%Y%m%dT%H%M%SZ}")
+        return ";".join(parts)
+
+
+def utc(moment: datetime) -> datetime:
+    """Naive datetimes are UTC, as timestamptz reads them."""
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+
+def _parse_until(value: str) -> datetime:
+    for layout in ("%Y%m%dT%H%M%SZ", "%Y%m%dT%H%M%S", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, layout).replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    raise ValueError("UNTIL must look like 20261231 or 20261231T235959Z")
+
+
+@lru_cache(maxsize=RECURRENCE_CACHE_SIZE)
+def parse_rule(text: str) -> Rule:
+    """Parse and validate a rule; ``str()`` of the result is its canonical form."""
+    fields = {}
+    for part in text.strip().upper().split(";"):
+        name, _, value = part.partition("=")
+        if not value or name in fields:
+            raise ValueError(f"bad part {part!r}")
+        fields[name] = value
+
+    freq = fields.pop("FREQ", None)
+    if freq not in _FREQUENCIES:
+        raise ValueError("FREQ must be DAILY, WEEKLY or MONTHLY")
+    try:
+        interval = int(fields.pop("INTERVAL", "1"))
+        count = int(fields["COUNT"]) if "COUNT" in fields else None
+    except ValueError:
+        raise ValueError("INTERVAL and COUNT must be whole numbers")
+    fields.pop("COUNT", None)
+    if not 1 <= interval <= 1000:
+        raise ValueError("INTERVAL must be between 1 and 1000")
+    if count is not None and count < 1:
+        raise ValueError("COUNT must be at least 1")
+
+    weekdays = ()
+    if "BYDAY" in fields:
+        if freq != "WEEKLY":
+            raise ValueError("BYDAY is only supported with FREQ=WEEKLY")
+        names = fields.pop("BYDAY").split(",")
+        if not set(names) <= set(WEEKDAYS):
+            raise ValueError("BYDAY takes MO, TU, WE, TH, FR, SA or SU")
+        weekdays = tuple(sorted({WEEKDAYS.index(name) for name in names}))
+
+    until = _parse_until(fields.pop("UNTIL")) if "UNTIL" in fields else None
+    if count is not None and until is not None:
+        raise ValueError("COUNT and UNTIL cannot be combined")
+    if fields:
+        raise ValueError(f"unsupported part {sorted(fields)[0]}")
+    return Rule(freq, interval, weekdays, count, until)
+
+
+def _nth(rule: Rule, dtstart: datetime, n: int) -> datetime:
+    """Occurrence ``n`` (from 0), ignoring COUNT and UNTIL."""
+    if rule.freq == "DAILY":
+        return dtstart + timedelta(days=n * rule.interval)
+    if rule.freq == "WEEKLY":
+        if not rule.weekdays:
+            return dtstart + timedelta(weeks=n * rule.interval)
+        # Slot 0 is the first listed weekday on or after dtstart's.
+        week, slot = divmod(n + bisect.bisect_left(rule.weekdays, dtstart.weekday()), len(rule.weekdays))
+        monday = dtstart - timedelta(days=dtstart.weekday())
+        return monday + timedelta(weeks=week * rule.interval, days=rule.weekdays[slot])
+    months = dtstart.month - 1 + n * rule.interval
+    year, month = dtstart.year + months // 12, months % 12 + 1
+    return dtstart.replace(year=year, month=month, day=min(dtstart.day, calendar.monthrange(year, month)[1]))
+
+
+def _first_index(rule: Rule, dtstart: datetime, moment: datetime) -> int:
+    """Lowest n whose occurrence is at or after ``moment``."""
+    def before(n: int) -> bool:
+        try:
+            return _nth(rule, dtstart, n) < moment
+        except (OverflowError, ValueError):
+            return False
+
+    high = 1
+    while before(high):
+        high *= 2
+    low = 0
+    while low < high:
+        middle = (low + high) // 2
+        if before(middle):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+@lru_cache(maxsize=RECURRENCE_CACHE_SIZE)
+def occurrences(rule: str, dtstart: datetime, start: datetime, end: datetime) -> tuple[datetime, ...]:
+    """Occurrences of the series in [start, end), in order."""
+    parsed = parse_rule(rule)
+    if parsed.until is not None:
+        end = min(end, parsed.until + timedelta(microseconds=1))
+    if start >= end:
+        return ()
+    first = _first_index(parsed, dtstart, max(start, dtstart))
+    stop = _first_index(parsed, dtstart, end)
+    if parsed.count is not None:
+        stop = min(stop, parsed.count)
+    return tuple(_nth(parsed, dtstart, n) for n in range(first, stop))
+
+
+def is_occurrence(rule: str, dtstart: datetime, moment: datetime) -> bool:
+    return bool(occurrences(rule, dtstart, moment, moment + timedelta(microseconds=1)))
+
+
+def series_end(rule: str | None, dtstart: datetime | None) -> datetime | None:
+    """Last occurrence of the series; None if it never ends or is no series."""
+    if rule is None or dtstart is None:
+        return None
+    parsed, dtstart = parse_rule(rule), utc(dtstart)
+    try:
+        if parsed.count is not None:
+            return _nth(parsed, dtstart, parsed.count - 1)
+        if parsed.until is not None:
+            last = _first_index(parsed, dtstart, parsed.until + timedelta(microseconds=1)) - 1
+            return _nth(parsed, dtstart, max(last, 0))
+    except (OverflowError, ValueError):
+        pass
+    return None
+
+
+def carry_over(old_rule: str, old_start: datetime, new_rule: str | None, new_start: datetime | None,
+               slots: Iterable[datetime]) -> dict[datetime, datetime]:
+    """New slot of each stored slot after a series was rescheduled.
+
+    Moving the due date keeps occurrence n as occurrence n; slots that fall
+    past the end of the series, and all slots of a series whose rule changed
+    or that stopped recurring, are left out.
+    """
+    if new_rule != old_rule or new_start is None:
+        return {}
+    parsed, old_start, new_start = parse_rule(old_rule), utc(old_start), utc(new_start)
+    moved = {}
+    for slot in slots:
+        n = _first_index(parsed, old_start, slot)
+        if parsed.count is not None and n >= parsed.count:
+            continue
+        try:
+            if _nth(parsed, old_start, n) != slot:
+                continue
+            new_slot = _nth(parsed, new_start, n)
+        except (OverflowError, ValueError):
+            continue
+        if parsed.until is None or new_slot <= parsed.until:
+            moved[slot] = new_slot
+    return moved
+
+
+def _occurrence(task: Mapping, slot: datetime, exception: Mapping | None) -> dict:
+    item = {**task, "occurs_at": slot, "due_date": slot, "status": "todo", "completed_at": None}
+    if exception is not None:
+        item["status"] = exception["status"]
+        item["completed_at"] = exception["completed_at"]
+        if exception["title"] is not None:
+            item["title"] = exception["title"]
+        if exception["due_date"] is not None:
+            item["due_date"] = exception["due_date"]
+    return item
+
+
+def calendar_items(tasks: Iterable[Mapping], exceptions: Iterable[Mapping],
+                   start: datetime, end: datetime) -> list[dict]:
+    """Tasks and occurrences due in [start, end), by due date.
+
+    ``tasks`` are one-off tasks due in the window plus every series that
+    starts before its end; ``exceptions`` are their task_occurrences rows
+    with a slot or due date in the window. One-off tasks get occurs_at None.
+    """
+    overrides = defaultdict(dict)
+    for exception in exceptions:
+        overrides[exception["task_id"]][exception["occurs_at"]] = exception
+
+    items = []
+    for task in tasks:
+        if task["recurrence"] is None:
+            items.append({**task, "occurs_at": None})
+            continue
+        series = overrides.get(task["id"], {})
+        dtstart = utc(task["due_date"])
+        # A finished series has no occurrences after it was completed.
+        ended = task["completed_at"] if task["status"] == "done" and task["completed_at"] else None
+        slots = list(occurrences(task["recurrence"], dtstart, start, min(end, ended) if ended else end))
+        # Occurrences moved into the window from a slot outside it.
+        slots += [
+            slot for slot, exception in series.items()
+            if not start <= slot < end
+            and exception["due_date"] is not None
+            and start <= exception["due_date"] < end
+            and (ended is None or slot < ended)
+            and is_occurrence(task["recurrence"], dtstart, slot)
+        ]
+        for slot in slots:
+            exception = series.get(slot)
+            if exception is not None and exception["skipped"]:
+                continue
+            item = _occurrence(task, slot, exception)
+            if start <= item["due_date"] < end:
+                items.append(item)
+
+    items.sort(key=lambda item: (item["due_date"], str(item["id"])))
+    return items
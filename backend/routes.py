@@ -1,36 +1,44 @@
-from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response, Cookie
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response, Cookie
+import asyncio
+import base64
+import json
 import os
-import asyncpg
 import re
 import time
-from db import get_db
-from auth import verify_token
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from idempotency import run_idempotent
+from auth import get_supabase, verify_token
+from cache import invalidate, response_cache, team_tag, user_tag
+from maintenance import purger
+from outbox import invite_worker
+from recurrence import RECURRENCE_MAX_WINDOW_DAYS, calendar_items, is_occurrence, parse_rule, utc
+from storage import storage
+from task_graph import GRAPH_MAX_NODES, critical_path
 from models.models import (
+    PriorityLevel,
+    StatusLevel,
     Task,
     TeamMember,
     TeamMemberCreate,
+    TeamMemberBulkCreate,
     CommentCreate,
     UserCreate,
     TaskCreate,
     TeamCreate,
     UserLogin,
     TaskUpdate,
+    TaskMove,
+    TaskDependencyCreate,
+    OccurrenceUpdate,
     ForgotPasswordRequest,
     ResetPasswordRequest,
     ResendConfirmationRequest,
     UserProfileUpdateRequest,
 )
-from supabase import create_client
 
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_ROLE_KEY"),
-)
-
 router = APIRouter()
 ACCESS_TOKEN_COOKIE = os.getenv("ACCESS_TOKEN_COOKIE", "access_token")
 APP_ENV = os.getenv("APP_ENV", "development").strip().lower()
@@ -46,18 +54,32 @@ LOGIN_RATE_LIMIT = int(os.getenv("LOGIN_RATE_LIMIT", "10"))
 REGISTER_RATE_LIMIT = int(os.getenv("REGISTER_RATE_LIMIT", "6"))
 FORGOT_PASSWORD_RATE_LIMIT = int(os.getenv("FORGOT_PASSWORD_RATE_LIMIT", "5"))
 INVITE_RATE_LIMIT = int(os.getenv("INVITE_RATE_LIMIT", "20"))
+BULK_INVITE_RATE_LIMIT = int(os.getenv("BULK_INVITE_RATE_LIMIT", "5"))
+BULK_INVITE_MAX_ENTRIES = int(os.getenv("BULK_INVITE_MAX_ENTRIES", "500"))
+CHECK_EMAIL_RATE_LIMIT = int(os.getenv("CHECK_EMAIL_RATE_LIMIT", "30"))
+EMAIL_EXISTS_TTL_SECONDS = float(os.getenv("EMAIL_EXISTS_TTL_SECONDS", "300"))
+EMAIL_MISSING_TTL_SECONDS = float(os.getenv("EMAIL_MISSING_TTL_SECONDS", "5"))
+EMAIL_CHECK_CACHE_SIZE = int(os.getenv("EMAIL_CHECK_CACHE_SIZE", "10000"))
+FLOW_METRICS_CACHE_SECONDS = float(os.getenv("FLOW_METRICS_CACHE_SECONDS", "300"))
+# With shards, every shard returns limit + offset rows for the merge, so deep
+# pages are refused rather than read.
+TASK_LIST_MAX_OFFSET = int(os.getenv("TASK_LIST_MAX_OFFSET", "1000"))
 MAX_LOGIN_FAILURES = int(os.getenv("MAX_LOGIN_FAILURES", "5"))
 LOGIN_LOCKOUT_SECONDS = int(os.getenv("LOGIN_LOCKOUT_SECONDS", "300"))
 
-_rate_limit_buckets: dict[str, list[float]] = {}
+# key -> (timestamps, expires_at), least recently hit first
+_rate_limit_buckets: dict[str, tuple[list[float], float]] = {}
 _login_failures: dict[str, list[float]] = {}
 _login_lockouts: dict[str, float] = {}
+# email -> (exists, expires_at), oldest first
+_email_checks: dict[str, tuple[bool, float]] = {}
 
 
-def get_client_ip(x_forwarded_for: str | None) -> str:
-    if not x_forwarded_for:
-        return "unknown"
-    return x_forwarded_for.split(",")[0].strip() or "unknown"
+def get_client_ip(request: Request) -> str:
+    # The connection peer. Behind a proxy uvicorn has already replaced it
+    # with the X-Forwarded-For client when the proxy is in
+    # FORWARDED_ALLOW_IPS; anyone else's header is ignored.
+    return request.client.host if request.client else "unknown"
 
 
 def normalize_email(value: str) -> str:
@@ -78,12 +100,43 @@ def normalize_name(value: str, field_name: str = "Name") -> str:
 
 def enforce_rate_limit(key: str, limit: int, window_seconds: int, message: str) -> None:
     now = time.time()
-    bucket = _rate_limit_buckets.get(key, [])
+    # Buckets not hit for a whole window are empty; drop them from the front.
+    while _rate_limit_buckets:
+        oldest = next(iter(_rate_limit_buckets))
+        if _rate_limit_buckets[oldest][1] > now:
+            break
+        del _rate_limit_buckets[oldest]
+
+    bucket, _ = _rate_limit_buckets.pop(key, ([], 0.0))
     bucket = [timestamp for timestamp in bucket if now - timestamp < window_seconds]
     if len(bucket) >= limit:
+        # Re-inserted at the back, so its expiry must not be earlier than
+        # the others' for the eviction above to stop at the first live one.
+        _rate_limit_buckets[key] = (bucket, now + window_seconds)
         raise HTTPException(status_code=429, detail=message)
     bucket.append(now)
-    _rate_limit_buckets[key] = bucket
+    _rate_limit_buckets[key] = (bucket, now + window_seconds)
+
+
+async def email_exists(email: str) -> bool:
+    """storage.users.email_exists behind a per-worker TTL cache.
+
+    Taken emails stay taken, so hits are kept for EMAIL_EXISTS_TTL_SECONDS;
+    free ones can be registered at any moment and expire after
+    EMAIL_MISSING_TTL_SECONDS.
+    """
+    now = time.monotonic()
+    cached = _email_checks.get(email)
+    if cached and now < cached[1]:
+        return cached[0]
+
+    exists = await storage.users.email_exists(email)
+    _email_checks.pop(email, None)
+    if len(_email_checks) >= EMAIL_CHECK_CACHE_SIZE:
+        _email_checks.pop(next(iter(_email_checks)))
+    ttl = EMAIL_EXISTS_TTL_SECONDS if exists else EMAIL_MISSING_TTL_SECONDS
+    _email_checks[email] = (exists, now + ttl)
+    return exists
 
 
 def enforce_login_lockout(identity_key: str) -> None:
@@ -125,191 +178,185 @@ def validate_password_strength(password: str) -> None:
         )
 
 
+_FIRST_COMMENT_CURSOR = (datetime.max.replace(tzinfo=timezone.utc), uuid.UUID(int=(1 << 128) - 1))
+
+# (team_id, user_id) -> is member, resolved once up front by POST /batch so
+# its sub-requests for the same team do not each query membership.
+known_memberships: ContextVar[dict[tuple[str, str], bool] | None] = ContextVar("known_memberships", default=None)
+
+
+async def is_team_member(team_id: str, user_id: str) -> bool:
+    known = known_memberships.get()
+    if known is not None and (team_id, user_id) in known:
+        return known[(team_id, user_id)]
+    return await storage.teams.is_member(team_id, user_id)
+
+
+def normalize_recurrence(value: str) -> str:
+    try:
+        return str(parse_rule(value))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid recurrence rule: {e}")
+
+
+def _calendar_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_comment_cursor(row) -> str:
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_comment_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, comment_id = raw.split("|", 1)
+        created_at = datetime.fromisoformat(created_at)
+        if created_at.tzinfo is None:
+            raise ValueError("cursor timestamp has no timezone")
+        return created_at, uuid.UUID(comment_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid comments cursor")
+
+
+def comments_page(rows, limit: int) -> dict:
+    next_cursor = encode_comment_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"comments": rows[:limit], "next_cursor": next_cursor}
+
+
 # ========================= TASKS =========================
 
 @router.get("/tasks")
 async def get_tasks_for_user(
     user_id: str = Depends(verify_token),
     limit: int = Query(default=25, ge=1, le=100),
-    offset: int = Query(default=0, ge=0),
+    offset: int = Query(default=0, ge=0, le=TASK_LIST_MAX_OFFSET),
+    include_archived: bool = Query(default=False),
 ):
-    db = await get_db()
-
-    total = await db.fetchval("""
-        SELECT COUNT(*)
-        FROM tasks t
-        WHERE t.created_by = $1
-           OR t.team_id IN (
-                SELECT team_id FROM team_members WHERE user_id = $1
-           )
-    """, user_id)
-
-    rows = await db.fetch("""
-        SELECT
-            t.*,
-            u.name AS created_by_name,
-            te.name AS team_name,
-            au.name AS assigned_to_name
-        FROM tasks t
-        LEFT JOIN users u ON u.id = t.created_by
-        LEFT JOIN teams te ON te.id = t.team_id
-        LEFT JOIN team_members atm ON atm.id = t.assigned_to
-        LEFT JOIN users au ON au.id = atm.user_id
-        WHERE t.created_by = $1
-           OR t.team_id IN (
-                SELECT team_id FROM team_members WHERE user_id = $1
-           )
-        ORDER BY t.created_at DESC
-        LIMIT $2
-        OFFSET $3
-    """, user_id, limit, offset)
-
-    await db.close()
-    return {"tasks": rows, "total": total, "limit": limit, "offset": offset}
+    rows, total = await storage.tasks.list_for_user(user_id, limit, offset, include_archived)
+    return {"tasks": rows, "total": total, "limit": limit, "offset": offset, "max_offset": TASK_LIST_MAX_OFFSET}
+
+
+@router.get("/users/me/calendar")
+async def get_my_calendar(
+    user_id: str = Depends(verify_token),
+    start: datetime = Query(...),
+    end: datetime = Query(...),
+):
+    """Tasks due in [start, end), with recurring tasks expanded into their
+    occurrences for the window (naive times are UTC)."""
+    start, end = utc(start), utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if end - start > timedelta(days=RECURRENCE_MAX_WINDOW_DAYS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"The calendar window can span at most {RECURRENCE_MAX_WINDOW_DAYS} days"
+        )
+
+    tasks, exceptions = await storage.tasks.calendar(user_id, start, end)
+    payload = {"start": start, "end": end, "items": calendar_items(tasks, exceptions, start, end)}
+    # A year of daily occurrences is hundreds of flat items; encoding them
+    # directly is over ten times faster than the generic jsonable_encoder.
+    return Response(
+        content=json.dumps(payload, default=_calendar_json, ensure_ascii=False, separators=(",", ":")),
+        media_type="application/json",
+    )
 
 
 @router.post("/tasks")
-async def create_task(task: TaskCreate, user_id: str = Depends(verify_token)):
-    db = await get_db()
+async def create_task(task: TaskCreate, user_id: str = Depends(verify_token),
+                      idempotency_key: str | None = Header(default=None)):
+    return await run_idempotent(idempotency_key, user_id, "POST /tasks", task,
+                                lambda: insert_task(task, user_id))
+
+
+async def insert_task(task: TaskCreate, user_id: str):
     title = normalize_name(task.title, field_name="Title")
     description = None
     if task.description is not None:
         cleaned_description = task.description.strip()
         description = cleaned_description if cleaned_description else None
 
-    if task.team_id is not None:
-        # Check if the user is a member of the team
-        is_member = await db.fetchval("""
-            SELECT EXISTS (
-                SELECT 1
-                FROM team_members
-                WHERE team_id = $1
-                  AND user_id = $2
-            )
-        """, task.team_id, user_id)
-
-        if not is_member:
-            await db.close()
-            raise HTTPException(
-                status_code=403,
-                detail="You are not a member of this team"
-            )
-    elif task.assigned_to is not None:
-        await db.close()
+    if task.team_id is None and task.assigned_to is not None:
         raise HTTPException(
             status_code=400,
             detail="Cannot assign a personal task without a team."
         )
 
-    # Insert task without assigned_to
-    row = await db.fetchrow("""
-        INSERT INTO tasks (
-            title,
-            description,
-            status,
-            priority,
-            team_id,
-            due_date,
-            created_by,
-            assigned_to
+    recurrence = normalize_recurrence(task.recurrence) if task.recurrence is not None else None
+    if recurrence is not None and task.due_date is None:
+        raise HTTPException(status_code=400, detail="Recurring tasks need a due date")
+
+    row = await storage.tasks.create(user_id, {
+        "title": title,
+        "description": description,
+        "status": task.status.value,
+        "priority": task.priority.value,
+        "team_id": task.team_id,
+        "due_date": task.due_date,
+        "assigned_to": task.assigned_to,
+        "recurrence": recurrence,
+    })
+
+    if not row:
+        raise HTTPException(
+            status_code=403,
+            detail="You are not a member of this team"
         )
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-        RETURNING *
-    """,
-        title,
-        description,
-        task.status.value,
-        task.priority.value,
-        task.team_id,
-        task.due_date,
-        user_id,
-        task.assigned_to
-    )
 
-    await db.close()
     return {"task": row}
 
 
 @router.put("/tasks/{task_id}")
 async def update_task(task_id: str, task: TaskUpdate, user_id: str = Depends(verify_token)):
-    db = await get_db()
-
     provided_fields = getattr(task, "model_fields_set", set())
     if not provided_fields:
         provided_fields = getattr(task, "__fields_set__", set())
 
     if not provided_fields:
-        await db.close()
         raise HTTPException(status_code=400, detail="No fields provided for update")
 
     if "assigned_to" in provided_fields and task.assigned_to is not None:
-        assignee_is_member = await db.fetchval("""
-            SELECT EXISTS (
-                SELECT 1
-                FROM tasks t
-                JOIN team_members tm ON tm.team_id = t.team_id
-                WHERE t.id = $1
-                  AND tm.id = $2
-            )
-        """, task_id, task.assigned_to)
-
-        if not assignee_is_member:
-            await db.close()
+        if not await storage.tasks.assignee_in_team(task_id, task.assigned_to):
             raise HTTPException(
                 status_code=400,
                 detail="Assigned member must belong to the task's team"
             )
 
-    set_clauses = []
-    args = []
+    changes = {}
 
     if "title" in provided_fields:
-        args.append(normalize_name(task.title or "", field_name="Title") if task.title is not None else None)
-        set_clauses.append(f"title = ${len(args)}")
+        changes["title"] = normalize_name(task.title or "", field_name="Title") if task.title is not None else None
     if "description" in provided_fields:
         cleaned_description = task.description.strip() if task.description is not None else None
-        args.append(cleaned_description if cleaned_description else None)
-        set_clauses.append(f"description = ${len(args)}")
+        changes["description"] = cleaned_description if cleaned_description else None
     if "status" in provided_fields:
-        args.append(task.status.value if task.status else None)
-        set_clauses.append(f"status = ${len(args)}")
+        changes["status"] = task.status.value if task.status else None
     if "priority" in provided_fields:
-        args.append(task.priority.value if task.priority else None)
-        set_clauses.append(f"priority = ${len(args)}")
+        changes["priority"] = task.priority.value if task.priority else None
     if "due_date" in provided_fields:
-        args.append(task.due_date)
-        set_clauses.append(f"due_date = ${len(args)}")
+        changes["due_date"] = task.due_date
     if "assigned_to" in provided_fields:
-        args.append(task.assigned_to)
-        set_clauses.append(f"assigned_to = ${len(args)}")
-
-    args.extend([task_id, user_id])
-    task_id_idx = len(args) - 1
-    user_id_idx = len(args)
-
-    query = f"""
-        UPDATE tasks
-        SET {", ".join(set_clauses)}
-        WHERE id = ${task_id_idx}
-          AND (
-              created_by = ${user_id_idx}
-              OR team_id IN (
-                    SELECT team_id FROM team_members WHERE user_id = ${user_id_idx}
-              )
-          )
-        RETURNING *
-    """
+        changes["assigned_to"] = task.assigned_to
+    if "recurrence" in provided_fields:
+        changes["recurrence"] = normalize_recurrence(task.recurrence) if task.recurrence is not None else None
 
-    try:
-        row = await db.fetchrow(query, *args)
-    except asyncpg.ForeignKeyViolationError:
-        await db.close()
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid assignee. Use a team member ID from /teams/{team_id}/members."
-        )
+    if "recurrence" in provided_fields or ("due_date" in provided_fields and task.due_date is None):
+        # The due date anchors a series, so a recurring task must keep one.
+        current = await storage.tasks.get(task_id, user_id)
+        if current is not None:
+            recurrence = changes.get("recurrence", current["recurrence"])
+            due_date = changes.get("due_date", current["due_date"])
+            if recurrence is not None and due_date is None:
+                raise HTTPException(status_code=400, detail="Recurring tasks need a due date")
 
-    await db.close()
+    row = await storage.tasks.update(task_id, user_id, changes)
 
     if not row:
         raise HTTPException(
@@ -320,55 +367,76 @@ async def update_task(task_id: str, task: TaskUpdate, user_id: str = Depends(ver
     return {"task": row}
 
 
-@router.delete("/tasks/{task_id}")
-async def delete_task(task_id: str, user_id: str = Depends(verify_token)):
-    db = await get_db()
-
-    row = await db.fetchrow("""
-        DELETE FROM tasks
-        WHERE id = $1
-          AND (
-              created_by = $2
-              OR team_id IN (
-                  SELECT team_id FROM team_members WHERE user_id = $2
-              )
-          )
-        RETURNING *
-    """, task_id, user_id)
-
-    await db.close()
+@router.put("/tasks/{task_id}/occurrences/{occurs_at}")
+async def update_task_occurrence(task_id: str, occurs_at: datetime, payload: OccurrenceUpdate,
+                                 user_id: str = Depends(verify_token)):
+    """Complete, edit, move or skip one occurrence of a recurring task.
+
+    ``occurs_at`` is the occurrence's original slot, as returned by the
+    calendar; only occurrences changed here are stored.
+    """
+    provided_fields = getattr(payload, "model_fields_set", set())
+    if not provided_fields:
+        provided_fields = getattr(payload, "__fields_set__", set())
+
+    if not provided_fields:
+        raise HTTPException(status_code=400, detail="No fields provided for update")
+
+    task = await storage.tasks.get(task_id, user_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found or you don't have permission")
+    if task["recurrence"] is None:
+        raise HTTPException(status_code=400, detail="Task is not recurring")
+    occurs_at = utc(occurs_at)
+    if not is_occurrence(task["recurrence"], utc(task["due_date"]), occurs_at):
+        raise HTTPException(status_code=404, detail="Occurrence not found")
+
+    changes = {}
+    if "status" in provided_fields:
+        if payload.status is None:
+            raise HTTPException(status_code=400, detail="status cannot be null")
+        changes["status"] = payload.status.value
+    if "title" in provided_fields:
+        changes["title"] = normalize_name(payload.title, field_name="Title") if payload.title is not None else None
+    if "due_date" in provided_fields:
+        changes["due_date"] = utc(payload.due_date) if payload.due_date is not None else None
+    if "skipped" in provided_fields:
+        changes["skipped"] = bool(payload.skipped)
+
+    row = await storage.tasks.save_occurrence(task["id"], occurs_at, changes)
+    return {"occurrence": row}
+
+
+@router.post("/tasks/{task_id}/move")
+async def move_task(task_id: str, payload: TaskMove, user_id: str = Depends(verify_token)):
+    """Place a team task between two neighbours of a board column.
+
+    Only the moved task is written; neighbours that are gone or sit in
+    another column answer 409 so the client reloads the column.
+    """
+    status = payload.status.value if payload.status else None
+    row = await storage.tasks.move(task_id, user_id, status, payload.before_id, payload.after_id)
 
     if not row:
         raise HTTPException(status_code=404, detail="Task not found or you don't have permission")
 
+    return {"task": row}
+
+
+@router.delete("/tasks/{task_id}")
+async def delete_task(task_id: str, user_id: str = Depends(verify_token)):
+    if not await storage.tasks.delete(task_id, user_id):
+        raise HTTPException(status_code=404, detail="Task not found or you don't have permission")
+
+    purger.wake()
+
     return {"detail": "Task deleted successfully"}
 
 
 @router.get("/tasks/{task_id}")
-async def get_task(task_id: str, user_id: str = Depends(verify_token)):
-    db = await get_db()
-
-    row = await db.fetchrow("""
-        SELECT
-            t.*,
-            u.name AS created_by_name,
-            te.name AS team_name,
-            au.name AS assigned_to_name
-        FROM tasks t
-        LEFT JOIN users u ON u.id = t.created_by
-        LEFT JOIN teams te ON te.id = t.team_id
-        LEFT JOIN team_members atm ON atm.id = t.assigned_to
-        LEFT JOIN users au ON au.id = atm.user_id
-        WHERE t.id = $1
-          AND (
-              t.created_by = $2
-              OR t.team_id IN (
-                    SELECT team_id FROM team_members WHERE user_id = $2
-              )
-          )
-    """, task_id, user_id)
-
-    await db.close()
+async def get_task(task_id: str, user_id: str = Depends(verify_token),
+                   include_archived: bool = Query(default=False)):
+    row = await storage.tasks.get(task_id, user_id, include_archived)
 
     if not row:
         raise HTTPException(status_code=404, detail="Task not found")
@@ -376,158 +444,145 @@ async def get_task(task_id: str, user_id: str = Depends(verify_token)):
     return {"task": row}
 
 
+@router.get("/tasks/{task_id}/full")
+async def get_task_full(task_id: str, user_id: str = Depends(verify_token),
+                        comments_limit: int = Query(default=50, ge=1, le=200)):
+    """Task, first page of comments and team roster for the task drawer.
+
+    The task lookup is the access check; all three are read on one pooled
+    connection.
+    """
+    full = await storage.tasks.get_full(task_id, user_id, _FIRST_COMMENT_CURSOR, comments_limit + 1)
+    if not full:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    task, comments, members = full
+    return {"task": task, **comments_page(comments, comments_limit), "members": members}
+
+
+# ========================= DEPENDENCIES =========================
+
+@router.post("/tasks/{task_id}/dependencies")
+async def add_task_dependency(task_id: str, payload: TaskDependencyCreate, user_id: str = Depends(verify_token)):
+    dependency = await storage.dependencies.add(task_id, payload.blocked_by, user_id)
+
+    if not dependency:
+        raise HTTPException(status_code=404, detail="Task not found or you don't have permission")
+
+    return {"dependency": dependency}
+
+
+@router.delete("/tasks/{task_id}/dependencies/{blocked_by}")
+async def remove_task_dependency(task_id: str, blocked_by: str, user_id: str = Depends(verify_token)):
+    if not await storage.dependencies.remove(task_id, blocked_by, user_id):
+        raise HTTPException(status_code=404, detail="Dependency not found or you don't have permission")
+
+    return {"detail": "Dependency removed successfully"}
+
+
+@router.get("/tasks/{task_id}/graph")
+async def get_task_graph(
+    task_id: str,
+    user_id: str = Depends(verify_token),
+    upstream_depth: int = Query(default=5, ge=0, le=20),
+    downstream_depth: int = Query(default=5, ge=0, le=20),
+):
+    """What blocks a task (upstream), what it blocks (downstream) and its
+    critical path: the longest chain of open blockers ending at the task.
+
+    Each direction keeps its GRAPH_MAX_NODES nearest tasks; ``truncated``
+    says whether any were cut, in which case the critical path only covers
+    the part returned.
+    """
+    graph = await storage.dependencies.graph(task_id, user_id, upstream_depth, downstream_depth, GRAPH_MAX_NODES)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    nodes, edges, truncated = graph
+    root_id = next(node["id"] for node in nodes if node["direction"] == "root")
+    upstream = {node["id"]: node for node in nodes if node["direction"] != "downstream"}
+    path = critical_path(root_id, upstream, [(edge["task_id"], edge["blocked_by"]) for edge in edges])
+
+    return {
+        "task_id": root_id,
+        "nodes": nodes,
+        "edges": edges,
+        "critical_path": path,
+        "truncated": truncated,
+    }
+
+
 # ========================= COMMENTS =========================
 
 @router.get("/tasks/{task_id}/comments")
-async def get_task_comments(task_id: str, user_id: str = Depends(verify_token)):
-    db = await get_db()
-
-    has_access = await db.fetchval("""
-        SELECT EXISTS (
-            SELECT 1
-            FROM tasks t
-            WHERE t.id = $1
-              AND (
-                    t.created_by = $2
-                    OR t.team_id IN (
-                        SELECT team_id FROM team_members WHERE user_id = $2
-                    )
-              )
-        )
-    """, task_id, user_id)
+async def get_task_comments(task_id: str, user_id: str = Depends(verify_token),
+                            include_archived: bool = Query(default=False),
+                            limit: int = Query(default=50, ge=1, le=200),
+                            before: str | None = Query(default=None)):
+    cursor = decode_comment_cursor(before) if before else _FIRST_COMMENT_CURSOR
+
+    rows = await storage.comments.list_for_task(task_id, user_id, cursor, limit + 1, include_archived)
 
-    if not has_access:
-        await db.close()
+    if rows is None:
         raise HTTPException(status_code=403, detail="Task not found or you don't have access")
 
-    try:
-        rows = await db.fetch("""
-            SELECT
-                c.*,
-                u.name AS author_name,
-                u.email AS author_email
-            FROM task_comments c
-            JOIN users u ON u.id = c.user_id
-            WHERE c.task_id = $1
-            ORDER BY c.created_at DESC
-        """, task_id)
-    except asyncpg.UndefinedTableError:
-        await db.close()
-        raise HTTPException(status_code=500, detail="Comments table is missing. Restart backend to initialize schema.")
-
-    await db.close()
-    return {"comments": rows}
+    return comments_page(rows, limit)
 
 
 @router.post("/tasks/{task_id}/comments")
-async def create_task_comment(task_id: str, payload: CommentCreate, user_id: str = Depends(verify_token)):
-    db = await get_db()
+async def create_task_comment(task_id: str, payload: CommentCreate, user_id: str = Depends(verify_token),
+                              idempotency_key: str | None = Header(default=None)):
+    return await run_idempotent(idempotency_key, user_id, f"POST /tasks/{task_id}/comments", payload,
+                                lambda: insert_task_comment(task_id, payload, user_id))
+
 
+async def insert_task_comment(task_id: str, payload: CommentCreate, user_id: str):
     content = payload.content.strip()
     if not content:
-        await db.close()
         raise HTTPException(status_code=400, detail="Comment content cannot be empty")
     if len(content) > 5000:
-        await db.close()
         raise HTTPException(status_code=400, detail="Comment is too long")
 
-    has_access = await db.fetchval("""
-        SELECT EXISTS (
-            SELECT 1
-            FROM tasks t
-            WHERE t.id = $1
-              AND (
-                    t.created_by = $2
-                    OR t.team_id IN (
-                        SELECT team_id FROM team_members WHERE user_id = $2
-                    )
-              )
-        )
-    """, task_id, user_id)
+    comment = await storage.comments.create(task_id, user_id, content)
 
-    if not has_access:
-        await db.close()
+    if not comment:
         raise HTTPException(status_code=403, detail="Task not found or you don't have access")
 
-    try:
-        row = await db.fetchrow("""
-            INSERT INTO task_comments (task_id, user_id, content)
-            VALUES ($1, $2, $3)
-            RETURNING *
-        """, task_id, user_id, content)
-    except asyncpg.UndefinedTableError:
-        await db.close()
-        raise HTTPException(status_code=500, detail="Comments table is missing. Restart backend to initialize schema.")
-
-    comment = await db.fetchrow("""
-        SELECT
-            c.*,
-            u.name AS author_name,
-            u.email AS author_email
-        FROM task_comments c
-        JOIN users u ON u.id = c.user_id
-        WHERE c.id = $1
-    """, row["id"])
-
-    await db.close()
     return {"comment": comment}
 
 
 @router.delete("/comments/{comment_id}")
 async def delete_task_comment(comment_id: str, user_id: str = Depends(verify_token)):
-    db = await get_db()
-
-    try:
-        row = await db.fetchrow("""
-            DELETE FROM task_comments c
-            WHERE c.id = $1
-              AND c.user_id = $2
-            RETURNING c.*
-        """, comment_id, user_id)
-    except asyncpg.UndefinedTableError:
-        await db.close()
-        raise HTTPException(status_code=500, detail="Comments table is missing. Restart backend to initialize schema.")
-
-    await db.close()
-
-    if not row:
+    if not await storage.comments.delete(comment_id, user_id):
         raise HTTPException(status_code=404, detail="Comment not found or you don't have permission")
 
     return {"detail": "Comment deleted successfully"}
 
 
-
 # ========================= TEAM MEMBERS =========================
 
 @router.get("/teams/{team_id}/members")
 async def get_team_members(team_id: str, user_id: str = Depends(verify_token)):
-    db = await get_db()
-
-    has_access = await db.fetchval("""
-        SELECT EXISTS (
-            SELECT 1
-            FROM team_members
-            WHERE team_id = $1
-              AND user_id = $2
-        )
-    """, team_id, user_id)
-
-    if not has_access:
-        await db.close()
+    # Membership is checked before the cache (shared by the team's members)
+    # so a removed member is refused even where the entry is still cached.
+    if not await is_team_member(team_id, user_id):
         raise HTTPException(
             status_code=403,
             detail="Team not found or you don't have access"
         )
 
-    rows = await db.fetch("""
-        SELECT tm.*, u.name, u.email
-        FROM team_members tm
-        JOIN users u ON tm.user_id = u.id
-        WHERE tm.team_id = $1
-    """, team_id)
+    cache_key = ("team_members", team_id)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    rows = await storage.members.list_for_team(team_id)
+
+    tags = [team_tag(team_id), *(user_tag(row["user_id"]) for row in rows)]
+    return response_cache.set(cache_key, {"members": rows}, tags)
 
-    await db.close()
-    return {"members": rows}
+
+_INVITE_CHECK_COLUMNS = {"is_admin", "target_id", "already_member", "pending_invite"}
 
 
 @router.post("/teams/{team_id}/members")
@@ -539,221 +594,169 @@ async def add_team_member(team_id: str, member: TeamMemberCreate,
         window_seconds=AUTH_WINDOW_SECONDS,
         message="Too many invites in a short period. Please wait and try again.",
     )
-    db = await get_db()
-
-    admin_check = await db.fetchrow("""
-        SELECT 1 FROM team_members
-        WHERE team_id = $1 AND user_id = $2 AND role = 'admin'
-    """, team_id, user_id)
-
-    if not admin_check:
-        await db.close()
-        raise HTTPException(
-            status_code=403,
-            detail="You don't have permission to add members"
-        )
 
     target_user_id = member.user_id
     normalized_email = normalize_email(member.email) if member.email else None
-    invite_email_sent = False
-
-    if target_user_id is None and normalized_email:
-        target_user = await db.fetchrow("""
-            SELECT id, email, name
-            FROM users
-            WHERE LOWER(email) = $1
-        """, normalized_email)
-        if target_user:
-            target_user_id = target_user["id"]
-        else:
-            redirect_to = f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')}/login"
-            try:
-                invite_response = supabase.auth.admin.invite_user_by_email(
-                    normalized_email,
-                    {"redirect_to": redirect_to},
-                )
-                invited_user = getattr(invite_response, "user", None)
-                if invited_user is None:
-                    await db.close()
-                    raise HTTPException(status_code=500, detail="Failed to send invite email")
-
-                invited_name = (normalized_email.split("@")[0] or "User").replace(".", " ").replace("_", " ").strip().title()
-                created_user = await db.fetchrow("""
-                    INSERT INTO users (id, email, name)
-                    VALUES ($1, $2, $3)
-                    ON CONFLICT (id) DO UPDATE SET
-                        email = EXCLUDED.email
-                    RETURNING id
-                """, invited_user.id, normalized_email, invited_name or "User")
-                target_user_id = created_user["id"]
-                invite_email_sent = True
-            except HTTPException:
-                raise
-            except Exception as e:
-                error_message = str(e).lower()
-                if "already registered" in error_message:
-                    existing_user_id = await db.fetchval("""
-                        SELECT id
-                        FROM users
-                        WHERE LOWER(email) = $1
-                    """, normalized_email)
-                    if not existing_user_id:
-                        await db.close()
-                        raise HTTPException(status_code=404, detail="User exists in auth but not in app users table")
-                    target_user_id = existing_user_id
-                else:
-                    await db.close()
-                    raise HTTPException(status_code=500, detail="Failed to invite user by email")
-
-    if target_user_id is None:
-        await db.close()
+    if target_user_id is None and normalized_email is None:
         raise HTTPException(
             status_code=400,
             detail="Provide a valid user_id or email for the member"
         )
 
-    target_user = await db.fetchrow("""
-        SELECT id, email, name
-        FROM users
-        WHERE id = $1
-    """, target_user_id)
+    redirect_to = f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')}/login"
 
-    if not target_user:
-        await db.close()
-        raise HTTPException(status_code=404, detail="User not found")
+    # The invite email itself is sent by the outbox worker.
+    row = await storage.invites.create(
+        team_id, user_id, target_user_id, normalized_email, member.role.value, redirect_to
+    )
 
-    if str(target_user_id) == user_id:
-        await db.close()
+    if not row["is_admin"]:
+        raise HTTPException(
+            status_code=403,
+            detail="You don't have permission to add members"
+        )
+    if row["target_id"] is None and target_user_id is not None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if row["target_id"] is not None and str(row["target_id"]) == user_id:
         raise HTTPException(status_code=400, detail="You cannot invite yourself")
+    if row["already_member"]:
+        raise HTTPException(status_code=409, detail="User is already a team member")
+    if row["pending_invite"]:
+        raise HTTPException(status_code=409, detail="An invite is already pending for this user")
 
-    already_member = await db.fetchval("""
-        SELECT EXISTS (
-            SELECT 1
-            FROM team_members
-            WHERE team_id = $1
-              AND user_id = $2
+    invite = {key: value for key, value in row.items() if key not in _INVITE_CHECK_COLUMNS}
+    detail = "Invite created. User must accept before joining the team."
+    if invite["invited_user_id"] is None:
+        invite_worker.wake()
+        detail = "Invite email queued. User must accept before joining the team."
+    return {"invite": invite, "detail": detail}
+
+
+@router.post("/teams/{team_id}/members/bulk")
+async def add_team_members_bulk(team_id: str, payload: TeamMemberBulkCreate,
+                                user_id: str = Depends(verify_token)):
+    """Invite many users/emails at once; returns a status per entry.
+
+    Existing users are resolved with one lookup, members and pending invites
+    are filtered in one query and the invites go in with one multi-row
+    insert, which also checks that the caller is a team admin. Emails
+    without an account are provisioned by the outbox worker, whose
+    OUTBOX_CONCURRENCY bounds the calls to the auth provider.
+    """
+    enforce_rate_limit(
+        key=f"bulk-invite:{user_id}",
+        limit=BULK_INVITE_RATE_LIMIT,
+        window_seconds=AUTH_WINDOW_SECONDS,
+        message="Too many bulk invites in a short period. Please wait and try again.",
+    )
+    if len(payload.emails) + len(payload.user_ids) > BULK_INVITE_MAX_ENTRIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A bulk invite can contain at most {BULK_INVITE_MAX_ENTRIES} entries"
         )
-    """, team_id, target_user_id)
 
-    if already_member:
-        await db.close()
-        raise HTTPException(status_code=409, detail="User is already a team member")
+    entries = [{"user_id": str(target), "status": None} for target in payload.user_ids]
+    for raw_email in payload.emails:
+        email = raw_email.strip().lower()
+        entries.append({"email": email, "status": None if EMAIL_PATTERN.match(email) else "invalid_email"})
+
+    requested_ids = list({entry["user_id"] for entry in entries if "user_id" in entry})
+    requested_emails = list({entry["email"] for entry in entries if "email" in entry and entry["status"] is None})
+    redirect_to = f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')}/login"
+
+    users = await storage.users.find(requested_ids, requested_emails)
+    ids_by_email = {row["email"]: str(row["id"]) for row in users}
+    known_ids = {str(row["id"]) for row in users}
+
+    # Resolve every entry to a user id (or a bare email) first.
+    for entry in entries:
+        if entry["status"] is not None:
+            continue
+        if "user_id" in entry:
+            entry["target"] = entry["user_id"] if entry["user_id"] in known_ids else None
+            if entry["target"] is None:
+                entry["status"] = "not_found"
+        else:
+            entry["target"] = ids_by_email.get(entry["email"])
+        if entry.get("target") == user_id:
+            entry["status"] = "self"
+
+    target_ids = list({entry["target"] for entry in entries if entry["status"] is None and entry["target"]})
+    new_emails = list({entry["email"] for entry in entries if entry["status"] is None and not entry["target"]})
+
+    blocked_reasons = {}
+    for row in await storage.members.blocked(team_id, target_ids, new_emails):
+        key = str(row["user_id"]) if row["user_id"] else row["email"]
+        blocked_reasons.setdefault(key, row["reason"])
+
+    seen = set()
+    invite_user_ids, invite_emails = [], []
+    for entry in entries:
+        if entry["status"] is not None:
+            continue
+        key = entry["target"] or entry["email"]
+        if key in blocked_reasons:
+            entry["status"] = blocked_reasons[key]
+        elif key in seen:
+            entry["status"] = "duplicate"
+        else:
+            seen.add(key)
+            invite_user_ids.append(entry["target"])
+            invite_emails.append(None if entry["target"] else entry["email"])
 
-    pending_invite = await db.fetchval("""
-        SELECT EXISTS (
-            SELECT 1
-            FROM team_invites
-            WHERE team_id = $1
-              AND invited_user_id = $2
-              AND status = 'pending'
+    invites = await storage.invites.create_many(
+        team_id, user_id, payload.role.value, invite_user_ids, invite_emails, redirect_to
+    )
+    if invites is None:
+        raise HTTPException(
+            status_code=403,
+            detail="You don't have permission to add members"
         )
-    """, team_id, target_user_id)
 
-    if pending_invite:
-        await db.close()
-        raise HTTPException(status_code=409, detail="An invite is already pending for this user")
-
-    try:
-        row = await db.fetchrow("""
-            INSERT INTO team_invites (team_id, invited_user_id, invited_by, role)
-            VALUES ($1, $2, $3, $4)
-            RETURNING *
-        """, team_id, target_user_id, user_id, member.role.value)
-    except asyncpg.UndefinedTableError:
-        await db.close()
-        raise HTTPException(status_code=500, detail="Invites table is missing. Restart backend to initialize schema.")
-
-    await db.close()
-    detail = "Invite created. User must accept before joining the team."
-    if invite_email_sent:
-        detail = "Invite email sent. User must accept before joining the team."
-    return {"invite": row, "detail": detail}
+    invite_ids = {}
+    for row in invites:
+        key = str(row["invited_user_id"]) if row["invited_user_id"] else row["invited_email"]
+        invite_ids[key] = row["id"]
+
+    results = []
+    for entry in entries:
+        result = {key: entry[key] for key in ("user_id", "email") if key in entry}
+        if entry["status"] is None:
+            key = entry["target"] or entry["email"]
+            invite_id = invite_ids.get(key)
+            if invite_id is None:
+                # Lost a race with a concurrent invite for the same target.
+                entry["status"] = "already_invited"
+            else:
+                entry["status"] = "invited" if entry["target"] else "invite_queued"
+                result["invite_id"] = invite_id
+        result["status"] = entry["status"]
+        results.append(result)
+
+    if any(result["status"] == "invite_queued" for result in results):
+        invite_worker.wake()
+    return {"results": results}
 
 
 @router.get("/users/me/team-invites")
 async def get_my_team_invites(user_id: str = Depends(verify_token)):
-    db = await get_db()
-
-    try:
-        rows = await db.fetch("""
-            SELECT
-                ti.*,
-                t.name AS team_name,
-                u.name AS invited_by_name,
-                u.email AS invited_by_email
-            FROM team_invites ti
-            JOIN teams t ON t.id = ti.team_id
-            JOIN users u ON u.id = ti.invited_by
-            WHERE ti.invited_user_id = $1
-              AND ti.status = 'pending'
-            ORDER BY ti.created_at DESC
-        """, user_id)
-    except asyncpg.UndefinedTableError:
-        await db.close()
-        raise HTTPException(status_code=500, detail="Invites table is missing. Restart backend to initialize schema.")
-
-    await db.close()
-    return {"invites": rows}
+    return {"invites": await storage.invites.list_for_user(user_id)}
 
 
 @router.post("/users/me/team-invites/{invite_id}/accept")
 async def accept_team_invite(invite_id: str, user_id: str = Depends(verify_token)):
-    db = await get_db()
-
-    try:
-        invite = await db.fetchrow("""
-            UPDATE team_invites
-            SET status = 'accepted', responded_at = NOW()
-            WHERE id = $1
-              AND invited_user_id = $2
-              AND status = 'pending'
-            RETURNING *
-        """, invite_id, user_id)
-    except asyncpg.UndefinedTableError:
-        await db.close()
-        raise HTTPException(status_code=500, detail="Invites table is missing. Restart backend to initialize schema.")
+    invite = await storage.invites.accept(invite_id, user_id)
 
     if not invite:
-        await db.close()
         raise HTTPException(status_code=404, detail="Invite not found")
 
-    existing_member = await db.fetchval("""
-        SELECT EXISTS (
-            SELECT 1
-            FROM team_members
-            WHERE team_id = $1
-              AND user_id = $2
-        )
-    """, invite["team_id"], user_id)
-
-    if not existing_member:
-        await db.execute("""
-            INSERT INTO team_members (user_id, team_id, role)
-            VALUES ($1, $2, $3)
-        """, user_id, invite["team_id"], invite["role"])
-
-    await db.close()
+    await invalidate(team_tag(invite["team_id"]), user_tag(user_id))
     return {"detail": "Invite accepted"}
 
 
 @router.post("/users/me/team-invites/{invite_id}/decline")
 async def decline_team_invite(invite_id: str, user_id: str = Depends(verify_token)):
-    db = await get_db()
-
-    try:
-        invite = await db.fetchrow("""
-            UPDATE team_invites
-            SET status = 'declined', responded_at = NOW()
-            WHERE id = $1
-              AND invited_user_id = $2
-              AND status = 'pending'
-            RETURNING *
-        """, invite_id, user_id)
-    except asyncpg.UndefinedTableError:
-        await db.close()
-        raise HTTPException(status_code=500, detail="Invites table is missing. Restart backend to initialize schema.")
-
-    await db.close()
+    invite = await storage.invites.decline(invite_id, user_id)
 
     if not invite:
         raise HTTPException(status_code=404, detail="Invite not found")
@@ -764,182 +767,218 @@ async def decline_team_invite(invite_id: str, user_id: str = Depends(verify_toke
 @router.delete("/teams/{team_id}/members/{member_id}")
 async def remove_team_member(team_id: str, member_id: str,
                              user_id: str = Depends(verify_token)):
-    db = await get_db()
-
-    admin_check = await db.fetchrow("""
-        SELECT 1 FROM team_members
-        WHERE team_id = $1 AND user_id = $2 AND role = 'admin'
-    """, team_id, user_id)
-
-    if not admin_check:
-        await db.close()
+    if not await storage.teams.is_member(team_id, user_id, admin=True):
         raise HTTPException(
             status_code=403,
             detail="You don't have permission to remove members"
         )
 
-    row = await db.fetchrow("""
-        DELETE FROM team_members
-        WHERE id = $1 AND team_id = $2
-        RETURNING *
-    """, member_id, team_id)
-
-    await db.close()
+    row = await storage.members.remove(team_id, member_id)
 
     if not row:
         raise HTTPException(status_code=404, detail="Member not found")
 
+    await invalidate(team_tag(team_id), user_tag(row["user_id"]))
     return {"detail": "Member removed successfully"}
 
 
 # ========================= TEAMS =========================
 
 @router.post("/teams")
-async def create_team(team: TeamCreate, user_id: str = Depends(verify_token)):
+async def create_team(team: TeamCreate, user_id: str = Depends(verify_token),
+                      idempotency_key: str | None = Header(default=None)):
     """Create a new team and add the creator as admin"""
-    db = await get_db()
-    team_name = normalize_name(team.name, field_name="Team name")
+    return await run_idempotent(idempotency_key, user_id, "POST /teams", team,
+                                lambda: insert_team(team, user_id))
 
-    try:
-        team = await db.fetchrow("""
-            INSERT INTO teams (name,owner_id)
-            VALUES ($1,$2)
-            RETURNING *
-        """, team_name, user_id)
 
-        await db.fetchrow("""
-            INSERT INTO team_members (user_id, team_id, role)
-            VALUES ($1, $2, 'admin')
-        """, user_id, team["id"])
+async def insert_team(team: TeamCreate, user_id: str):
+    team_name = normalize_name(team.name, field_name="Team name")
 
-        await db.close()
+    team = await storage.teams.create(user_id, team_name)
+    await invalidate(user_tag(user_id))
 
-        return {
-            "team": {
-                "id": team["id"],
-                "name": team["name"],
-                "created_at": team["created_at"]
-            }
+    return {
+        "team": {
+            "id": team["id"],
+            "name": team["name"],
+            "created_at": team["created_at"]
         }
-
-    except Exception as e:
-        await db.close()
-        print(f"Create team error: {e}")
-        raise HTTPException(status_code=500, detail="Failed to create team")
+    }
 
 
 @router.get("/teams")
 async def get_user_teams(user_id: str = Depends(verify_token)):
     """Get all teams the current user is a member of"""
-    db = await get_db()
+    cache_key = ("teams", user_id)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    rows = await db.fetch("""
-        SELECT t.id, t.name, t.created_at, tm.role
-        FROM teams t
-        JOIN team_members tm ON t.id = tm.team_id
-        WHERE tm.user_id = $1
-        ORDER BY t.name
-    """, user_id)
-
-    await db.close()
-    return {"teams": rows}
+    rows = await storage.teams.list_for_user(user_id)
+    tags = [user_tag(user_id), *(team_tag(row["id"]) for row in rows)]
+    return response_cache.set(cache_key, {"teams": rows}, tags)
 
 
 @router.get("/teams/{team_id}")
 async def get_team(team_id: str, user_id: str = Depends(verify_token)):
-    db = await get_db()
+    if not await is_team_member(team_id, user_id):
+        raise HTTPException(
+            status_code=403,
+            detail="You don't have access to this team"
+        )
 
-    is_member = await db.fetchval("""
-        SELECT EXISTS(
-            SELECT 1 FROM team_members
-            WHERE team_id = $1 AND user_id = $2
+    cache_key = ("team", team_id)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    team = await storage.teams.get(team_id)
+
+    if not team:
+        raise HTTPException(status_code=404, detail="Team not found")
+
+    return response_cache.set(cache_key, {"team": team}, [team_tag(team_id)])
+
+
+@router.get("/teams/{team_id}/analytics")
+async def get_team_analytics(team_id: str, user_id: str = Depends(verify_token)):
+    """Status totals and per-assignee workload from team_task_counters.
+
+    Counts include archived tasks; overdue is counted live from the partial
+    idx_tasks_open_due index since it depends on the clock.
+    """
+    if not await is_team_member(team_id, user_id):
+        raise HTTPException(
+            status_code=403,
+            detail="You don't have access to this team"
         )
-    """, team_id, user_id)
 
-    if not is_member:
-        await db.close()
+    totals, workload = await storage.teams.analytics(team_id)
+
+    status_totals = {status.value: 0 for status in StatusLevel}
+    priority_totals = {priority.value: 0 for priority in PriorityLevel}
+    for row in totals:
+        status_totals[row["status"]] = status_totals.get(row["status"], 0) + row["task_count"]
+        priority_totals[row["priority"]] = priority_totals.get(row["priority"], 0) + row["task_count"]
+
+    return {
+        "team_id": team_id,
+        "total": sum(status_totals.values()),
+        "status_totals": status_totals,
+        "priority_totals": priority_totals,
+        "workload": workload,
+    }
+
+
+@router.get("/teams/{team_id}/columns/{status}")
+async def get_team_column(
+    team_id: str,
+    status: StatusLevel,
+    user_id: str = Depends(verify_token),
+    limit: int = Query(default=50, ge=1, le=200),
+    after: str | None = Query(default=None),
+):
+    """Team tasks of one board column in manual order, paged by rank."""
+    if not await is_team_member(team_id, user_id):
         raise HTTPException(
             status_code=403,
             detail="You don't have access to this team"
         )
 
-    team = await db.fetchrow("""
-        SELECT * FROM teams WHERE id = $1
-    """, team_id)
+    rows = await storage.tasks.column(team_id, status.value, after or "", limit)
 
-    await db.close()
+    return {
+        "tasks": rows,
+        "next_cursor": rows[-1]["rank"] if len(rows) == limit else None,
+    }
 
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
 
-    return {"team": team}
+@router.get("/teams/{team_id}/metrics/flow")
+async def get_team_flow_metrics(
+    team_id: str,
+    user_id: str = Depends(verify_token),
+    window_days: int = Query(default=90, ge=7, le=730),
+):
+    """Cycle/lead time percentiles, weekly throughput and cumulative flow
+    from task_status_events. Shared by all members and cached per team and
+    window for FLOW_METRICS_CACHE_SECONDS.
+    """
+    if not await is_team_member(team_id, user_id):
+        raise HTTPException(
+            status_code=403,
+            detail="You don't have access to this team"
+        )
+
+    cache_key = ("team_flow", team_id, window_days)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    durations, throughput, flow = await storage.teams.flow(
+        team_id, window_days, [status.value for status in StatusLevel]
+    )
+
+    def percentiles(count, values):
+        values = values or [None, None, None]
+        return {
+            "count": count,
+            "p50": values[0],
+            "p85": values[1],
+            "p95": values[2],
+        }
+
+    cumulative_flow = {}
+    for row in flow:
+        day = cumulative_flow.setdefault(row["day"], {"day": row["day"], **{status.value: 0 for status in StatusLevel}})
+        day[row["status"]] = row["task_count"]
+
+    payload = {
+        "team_id": team_id,
+        "window_days": window_days,
+        "cycle_time_hours": percentiles(durations["cycle_count"], durations["cycle_percentiles"]),
+        "lead_time_hours": percentiles(durations["lead_count"], durations["lead_percentiles"]),
+        "throughput": throughput,
+        "cumulative_flow": list(cumulative_flow.values()),
+    }
+    return response_cache.set(cache_key, payload, [team_tag(team_id)], ttl_seconds=FLOW_METRICS_CACHE_SECONDS)
 
 
 @router.put("/teams/{team_id}")
 async def update_team(team_id: str, team: TeamCreate,
                       user_id: str = Depends(verify_token)):
     """Update team name (admin only)"""
-    db = await get_db()
-
-    is_admin = await db.fetchval("""
-        SELECT EXISTS(
-            SELECT 1 FROM team_members
-            WHERE team_id = $1 AND user_id = $2 AND role = 'admin'
-        )
-    """, team_id, user_id)
-
-    if not is_admin:
-        await db.close()
+    if not await storage.teams.is_member(team_id, user_id, admin=True):
         raise HTTPException(
             status_code=403,
             detail="Only admins can update team"
         )
 
-    updated_team = await db.fetchrow("""
-        UPDATE teams
-        SET name = $1
-        WHERE id = $2
-        RETURNING *
-    """, normalize_name(team.name, field_name="Team name"), team_id)
-
-    await db.close()
+    updated_team = await storage.teams.rename(team_id, normalize_name(team.name, field_name="Team name"))
 
     if not updated_team:
         raise HTTPException(status_code=404, detail="Team not found")
 
+    await invalidate(team_tag(team_id))
     return {"team": updated_team}
 
 
 @router.delete("/teams/{team_id}")
 async def delete_team(team_id: str, user_id: str = Depends(verify_token)):
     """Delete team (admin only)"""
-    db = await get_db()
-
-    is_admin = await db.fetchval("""
-        SELECT EXISTS(
-            SELECT 1 FROM team_members
-            WHERE team_id = $1 AND user_id = $2 AND role = 'admin'
-        )
-    """, team_id, user_id)
-
-    if not is_admin:
-        await db.close()
+    if not await storage.teams.is_member(team_id, user_id, admin=True):
         raise HTTPException(
             status_code=403,
             detail="Only admins can delete team"
         )
 
-    deleted = await db.fetchrow("""
-        DELETE FROM teams
-        WHERE id = $1
-        RETURNING *
-    """, team_id)
-
-    await db.close()
-
-    if not deleted:
+    # Hidden now; the purger removes its rows in batches.
+    if not await storage.teams.delete(team_id, user_id):
         raise HTTPException(status_code=404, detail="Team not found")
 
+    await invalidate(team_tag(team_id))
+    purger.wake()
+
     return {"detail": "Team deleted successfully"}
 
 
@@ -947,40 +986,29 @@ async def delete_team(team_id: str, user_id: str = Depends(verify_token)):
 
 @router.get("/users/me")
 async def get_current_user(user_id: str = Depends(verify_token)):
-    db = await get_db()
+    cache_key = ("me", user_id)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    user = await db.fetchrow("""
-        SELECT id, email, name, created_at
-        FROM users
-        WHERE id = $1
-    """, user_id)
-
-    await db.close()
+    user = await storage.users.get(user_id)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return {"user": user}
+    return response_cache.set(cache_key, {"user": user}, [user_tag(user_id)])
 
 
 @router.put("/users/me")
 async def update_user_profile(payload: UserProfileUpdateRequest, user_id: str = Depends(verify_token)):
-    db = await get_db()
-
     new_name = normalize_name(payload.name)
 
-    user = await db.fetchrow("""
-        UPDATE users
-        SET name = $1
-        WHERE id = $2
-        RETURNING id, email, name, created_at
-    """, new_name, user_id)
-
-    await db.close()
+    user = await storage.users.rename(user_id, new_name)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    await invalidate(user_tag(user_id))
     return {"user": user}
 
 
@@ -993,7 +1021,7 @@ async def create_user(user: UserCreate, x_forwarded_for: str | None = Header(def
     validate_password_strength(user.password)
 
     try:
-        auth_user = supabase.auth.sign_up({
+        auth_user = await asyncio.to_thread(get_supabase().auth.sign_up, {
             "email": email,
             "password": user.password,
             "options": {
@@ -1008,17 +1036,9 @@ async def create_user(user: UserCreate, x_forwarded_for: str | None = Header(def
 
         user_id = auth_user.user.id
 
-        db = await get_db()
-        row = await db.fetchrow("""
-            INSERT INTO users (id, email, name)
-            VALUES ($1, $2, $3)
-            ON CONFLICT (id) DO UPDATE SET
-                email = EXCLUDED.email,
-                name = EXCLUDED.name
-            RETURNING *
-        """, user_id, email, name)
-
-        await db.close()
+        row = await storage.users.upsert(user_id, email, name)
+        await invalidate(user_tag(user_id))
+        _email_checks.pop(email, None)
 
         return {
             "id": row["id"],
@@ -1046,18 +1066,21 @@ async def create_user(user: UserCreate, x_forwarded_for: str | None = Header(def
 
 
 @router.get("/check-email")
-async def check_email_exists(email: str = Query(..., min_length=3)):
+async def check_email_exists(
+    request: Request,
+    email: str = Query(..., min_length=3),
+):
+    client_ip = get_client_ip(request)
+    enforce_rate_limit(
+        key=f"check-email:{client_ip}",
+        limit=CHECK_EMAIL_RATE_LIMIT,
+        window_seconds=AUTH_WINDOW_SECONDS,
+        message="Too many email checks. Please try again later.",
+    )
+
     normalized_email = normalize_email(email)
 
-    db = await get_db()
-    exists = await db.fetchval("""
-        SELECT EXISTS (
-            SELECT 1
-            FROM users
-            WHERE LOWER(email) = $1
-        )
-    """, normalized_email)
-    await db.close()
+    exists = await email_exists(normalized_email)
 
     return {"available": not exists}
 
@@ -1066,9 +1089,9 @@ async def check_email_exists(email: str = Query(..., min_length=3)):
 async def login_user(
     user: UserLogin,
     response: Response,
-    x_forwarded_for: str | None = Header(default=None),
+    request: Request,
 ):
-    client_ip = get_client_ip(x_forwarded_for)
+    client_ip = get_client_ip(request)
     enforce_rate_limit(
         key=f"login:{client_ip}",
         limit=LOGIN_RATE_LIMIT,
@@ -1081,7 +1104,7 @@ async def login_user(
     enforce_login_lockout(login_identity_key)
 
     try:
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await asyncio.to_thread(get_supabase().auth.sign_in_with_password, {
             "email": email,
             "password": user.password
         })
@@ -1131,9 +1154,9 @@ async def login_user(
 @router.post("/forgot-password")
 async def forgot_password(
     payload: ForgotPasswordRequest,
-    x_forwarded_for: str | None = Header(default=None),
+    request: Request,
 ):
-    client_ip = get_client_ip(x_forwarded_for)
+    client_ip = get_client_ip(request)
     enforce_rate_limit(
         key=f"forgot-password:{client_ip}",
         limit=FORGOT_PASSWORD_RATE_LIMIT,
@@ -1144,10 +1167,11 @@ async def forgot_password(
     email = normalize_email(payload.email)
     redirect_to = f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')}/reset-password"
     try:
-        if hasattr(supabase.auth, "reset_password_for_email"):
-            supabase.auth.reset_password_for_email(email, {"redirect_to": redirect_to})
+        auth_client = get_supabase().auth
+        if hasattr(auth_client, "reset_password_for_email"):
+            await asyncio.to_thread(auth_client.reset_password_for_email, email, {"redirect_to": redirect_to})
         else:
-            supabase.auth.reset_password_email(email)
+            await asyncio.to_thread(auth_client.reset_password_email, email)
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to send reset email")
 
@@ -1166,11 +1190,13 @@ async def reset_password(
 
     token = authorization.replace("Bearer ", "")
     try:
-        user_response = supabase.auth.get_user(token)
+        auth_client = get_supabase().auth
+        user_response = await asyncio.to_thread(auth_client.get_user, token)
         if user_response.user is None:
             raise HTTPException(status_code=401, detail="Invalid or expired reset token")
 
-        supabase.auth.admin.update_user_by_id(
+        await asyncio.to_thread(
+            auth_client.admin.update_user_by_id,
             user_response.user.id,
             {"password": payload.new_password}
         )
@@ -1185,9 +1211,9 @@ async def reset_password(
 @router.post("/resend-confirmation")
 async def resend_confirmation(
     payload: ResendConfirmationRequest,
-    x_forwarded_for: str | None = Header(default=None),
+    request: Request,
 ):
-    client_ip = get_client_ip(x_forwarded_for)
+    client_ip = get_client_ip(request)
     enforce_rate_limit(
         key=f"resend-confirmation:{client_ip}",
         limit=FORGOT_PASSWORD_RATE_LIMIT,
@@ -1197,8 +1223,9 @@ async def resend_confirmation(
 
     email = normalize_email(payload.email)
     try:
-        if hasattr(supabase.auth, "resend"):
-            supabase.auth.resend({
+        auth_client = get_supabase().auth
+        if hasattr(auth_client, "resend"):
+            await asyncio.to_thread(auth_client.resend, {
                 "type": "signup",
                 "email": email
             })
@@ -1222,7 +1249,7 @@ async def logout_user(
     
     try:
         if token:
-            supabase.auth.sign_out(token)
+            await asyncio.to_thread(get_supabase().auth.sign_out, token)
         response.delete_cookie(
             key=ACCESS_TOKEN_COOKIE,
             domain=COOKIE_DOMAIN,
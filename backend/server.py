@@ -0,0 +1,50 @@
+"""Production entrypoint: multi-worker uvicorn on uvloop + httptools.
+
+Each worker is a separate process that imports ``main:app`` and runs its own
+lifespan, so the DB pool and in-process caches are created per worker.
+"""
+import os
+
+import uvicorn
+
+
+def _int_env(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    return int(raw)
+
+
+def default_workers() -> int:
+    return max(1, os.cpu_count() or 1)
+
+
+def main():
+    max_requests = _int_env("MAX_REQUESTS_PER_WORKER", 10000)
+    graceful_timeout = _int_env("GRACEFUL_SHUTDOWN_SECONDS", 30)
+    workers = _int_env("WEB_CONCURRENCY", default_workers())
+    # Workers inherit the environment; cache.py turns cross-worker
+    # invalidation on by default when there is more than one.
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=_int_env("PORT", 8000),
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        backlog=_int_env("SERVER_BACKLOG", 2048),
+        timeout_keep_alive=_int_env("KEEP_ALIVE_SECONDS", 75),
+        # A worker exits after this many requests and the supervisor
+        # replaces it; 0 disables recycling.
+        limit_max_requests=max_requests or None,
+        timeout_graceful_shutdown=graceful_timeout or None,
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        access_log=os.getenv("ACCESS_LOG", "false").strip().lower() in {"1", "true", "yes", "on"},
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Team-based sharding across SHARD_COUNT Postgres databases.
+
+A team lives on one shard together with its members, invites, tasks and
+comments; personal tasks (no team) live on a shard picked from their
+creator's id. New rows get ids from new_id(shard), which stores the shard
+number in the last byte of the UUID, so /tasks/{id}, /comments/{id} and
+/users/me/team-invites/{id} route straight to their shard without a
+directory, and adding shards later never moves existing rows.
+
+Rows written before sharding was switched on stay on shard 0. While
+SHARD_LEGACY_FALLBACK is on, an id whose byte names another shard is looked
+up there first and then on shard 0; the answer is cached per worker.
+
+users rows are copied to every shard (replicate_users), because every table
+references them and reads join their names. Writers queue the rows in the
+same transaction (queue_replication) and copy them right after commit;
+maintenance.UserReplicationRetry copies whatever a failure left queued. Reads that span teams
+(the task list, a user's teams and invites) query every shard concurrently
+and merge the results.
+
+Usage: ``python sharding.py sync-users`` copies all users from shard 0 to
+the other shards (run once after adding a shard).
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import sys
+import uuid
+from collections import OrderedDict
+
+from db import SHARD_COUNT, get_db
+
+SHARD_LEGACY_FALLBACK = os.getenv("SHARD_LEGACY_FALLBACK", "true").strip().lower() in {"1", "true", "yes", "on"}
+SHARD_LOCATE_CACHE_SIZE = int(os.getenv("SHARD_LOCATE_CACHE_SIZE", "10000"))
+SHARD_SYNC_BATCH_SIZE = 1000
+
+_LOCATE_QUERIES = {
+    "team": "SELECT EXISTS (SELECT 1 FROM teams WHERE id = $1::uuid)",
+    "task": """
+        SELECT EXISTS (SELECT 1 FROM tasks WHERE id = $1::uuid)
+            OR EXISTS (SELECT 1 FROM tasks_archive WHERE id = $1::uuid)
+    """,
+    "comment": "SELECT EXISTS (SELECT 1 FROM task_comments WHERE id = $1::uuid)",
+    "invite": "SELECT EXISTS (SELECT 1 FROM team_invites WHERE id = $1::uuid)",
+}
+
+UPSERT_USERS_QUERY = """
+    INSERT INTO users (id, email, name, created_at)
+    SELECT * FROM unnest($1::uuid[], $2::text[], $3::text[], $4::timestamptz[])
+    ON CONFLICT (id) DO UPDATE SET
+        email = EXCLUDED.email,
+        name = EXCLUDED.name
+"""
+
+_located: OrderedDict[tuple[str, str], int] = OrderedDict()
+
+
+def sharded() -> bool:
+    return SHARD_COUNT > 1
+
+
+def _as_uuid(value) -> uuid.UUID | None:
+    try:
+        return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def shard_of(value) -> int:
+    """Shard named by an id from new_id(); 0 for ids it cannot name."""
+    parsed = _as_uuid(value)
+    if parsed is None:
+        return 0
+    shard = parsed.int & 0xFF
+    return shard if shard < SHARD_COUNT else 0
+
+
+def new_id(shard: int) -> uuid.UUID:
+    """A random UUID whose last byte is ``shard``."""
+    return uuid.UUID(int=(uuid.uuid4().int & ~0xFF) | shard)
+
+
+def pick_shard() -> int:
+    """Shard for a new team."""
+    return random.randrange(SHARD_COUNT)
+
+
+def user_shard(user_id) -> int:
+    """Shard for a user's personal (team-less) tasks."""
+    parsed = _as_uuid(user_id)
+    return parsed.int % SHARD_COUNT if parsed is not None else 0
+
+
+def candidate_shards(value) -> list[int]:
+    shard = shard_of(value)
+    if shard and SHARD_LEGACY_FALLBACK:
+        return [shard, 0]
+    return [shard]
+
+
+async def locate(kind: str, value) -> int:
+    """Shard holding the team/task/comment/invite ``value``.
+
+    Without a legacy fallback this is shard_of() and costs nothing. Unknown
+    ids resolve to their first candidate so the route answers 404/403 there.
+    """
+    shards = candidate_shards(value)
+    if len(shards) == 1:
+        return shards[0]
+
+    key = (kind, str(value))
+    if key in _located:
+        _located.move_to_end(key)
+        return _located[key]
+
+    for shard in shards:
+        db = await get_db(shard=shard)
+        try:
+            found = await db.fetchval(_LOCATE_QUERIES[kind], str(value))
+        finally:
+            await db.close()
+        if found:
+            _located[key] = shard
+            if len(_located) > SHARD_LOCATE_CACHE_SIZE:
+                _located.popitem(last=False)
+            return shard
+    return shards[0]
+
+
+async def fan_out(method: str, query: str, *args, read_only: bool = False) -> list:
+    """Run ``db.<method>(query, *args)`` on every shard concurrently.
+
+    Results come back in shard order.
+    """
+    async def run(shard: int):
+        db = await get_db(read_only=read_only, shard=shard)
+        try:
+            return await getattr(db, method)(query, *args)
+        finally:
+            await db.close()
+
+    return await asyncio.gather(*(run(shard) for shard in range(SHARD_COUNT)))
+
+
+def merge_rows(results: list, key: str, descending: bool = False,
+               limit: int | None = None, offset: int = 0) -> list:
+    """Merge per-shard row lists, each already sorted by ``key``."""
+    merged = heapq.merge(*results, key=lambda row: row[key], reverse=descending)
+    stop = None if limit is None else offset + limit
+    return list(itertools.islice(merged, offset, stop))
+
+
+async def _upsert_users(shard: int, rows):
+    db = await get_db(shard=shard)
+    try:
+        await db.execute(
+            UPSERT_USERS_QUERY,
+            [row["id"] for row in rows],
+            [row["email"] for row in rows],
+            [row["name"] for row in rows],
+            [row["created_at"] for row in rows],
+        )
+    finally:
+        await db.close()
+
+
+async def queue_replication(db, user_ids: list):
+    """Queue users rows written through ``db`` for replicate_users; run it in
+    the same transaction as the write."""
+    if not sharded() or not user_ids:
+        return
+    await db.execute("""
+        INSERT INTO user_replication_queue AS q (user_id)
+        SELECT DISTINCT unnest($1::uuid[])
+        ON CONFLICT (user_id) DO UPDATE SET
+            version = q.version + 1,
+            attempts = 0,
+            next_attempt_at = NOW()
+    """, [str(user_id) for user_id in user_ids])
+
+
+async def replicate_users(user_ids: list, source: int = 0, db=None) -> bool:
+    """Copy the given users rows from ``source`` to every other shard and
+    clear their queue rows; ``db`` is a connection to ``source`` to use
+    instead of borrowing one.
+
+    Returns False if a shard could not be written; the rows then stay queued
+    for maintenance.UserReplicationRetry.
+    """
+    if not sharded() or not user_ids:
+        return True
+    rows = await _on_shard(db, source, "fetch", """
+        SELECT u.id, u.email, u.name, u.created_at, q.version
+        FROM users u
+        LEFT JOIN user_replication_queue q ON q.user_id = u.id
+        WHERE u.id = ANY($1::uuid[])
+    """, [str(user_id) for user_id in user_ids])
+    if not rows:
+        return True
+
+    results = await asyncio.gather(*(
+        _upsert_users(shard, rows) for shard in range(SHARD_COUNT) if shard != source
+    ), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        print(f"User replication from shard {source} failed, left queued: {errors[0]}")
+        return False
+
+    queued = [row for row in rows if row["version"] is not None]
+    if queued:
+        # Only the versions copied above; a newer write stays queued.
+        await _on_shard(db, source, "execute", """
+            DELETE FROM user_replication_queue q
+            USING unnest($1::uuid[], $2::bigint[]) AS copied(user_id, version)
+            WHERE q.user_id = copied.user_id
+              AND q.version = copied.version
+        """, [row["id"] for row in queued], [row["version"] for row in queued])
+    return True
+
+
+async def _on_shard(db, shard: int, method: str, query: str, *args):
+    if db is not None:
+        return await getattr(db, method)(query, *args)
+    db = await get_db(shard=shard)
+    try:
+        return await getattr(db, method)(query, *args)
+    finally:
+        await db.close()
+
+
+async def sync_users() -> int:
+    """Copy every users row from shard 0 to the other shards."""
+    copied = 0
+    after = uuid.UUID(int=0)
+    while True:
+        db = await get_db()
+        try:
+            rows = await db.fetch("""
+                SELECT id, email, name, created_at
+                FROM users
+                WHERE id > $1
+                ORDER BY id
+                LIMIT $2
+            """, after, SHARD_SYNC_BATCH_SIZE)
+        finally:
+            await db.close()
+        if not rows:
+            return copied
+        await asyncio.gather(*(_upsert_users(shard, rows) for shard in range(1, SHARD_COUNT)))
+        copied += len(rows)
+        after = rows[-1]["id"]
+
+
+async def _main(argv: list[str]):
+    if argv[:1] != ["sync-users"]:
+        print("Usage: python sharding.py sync-users")
+        return
+    print(f"Copied {await sync_users()} user(s) to {SHARD_COUNT - 1} shard(s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
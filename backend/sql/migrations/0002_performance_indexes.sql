@@ -0,0 +1,16 @@
+-- migrate:no-transaction
+-- Taskflow performance indexes, built without blocking writes.
+-- If a concurrent build fails it leaves an INVALID index behind; drop it
+-- and re-run the migrations.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_team_created_at
+ON tasks (team_id, created_at DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_assigned_to
+ON tasks (assigned_to);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_team_members_user_team
+ON team_members (user_id, team_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_team_members_team_user
+ON team_members (team_id, user_id);
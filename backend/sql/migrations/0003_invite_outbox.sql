@@ -0,0 +1,30 @@
+-- Invites to people without an account are stored by email and their
+-- invite email is dispatched from invite_outbox by outbox.py, instead of
+-- calling the auth provider inside the request.
+
+ALTER TABLE team_invites ALTER COLUMN invited_user_id DROP NOT NULL;
+ALTER TABLE team_invites ADD COLUMN IF NOT EXISTS invited_email TEXT;
+ALTER TABLE team_invites DROP CONSTRAINT IF EXISTS team_invites_target_check;
+ALTER TABLE team_invites ADD CONSTRAINT team_invites_target_check
+    CHECK (invited_user_id IS NOT NULL OR invited_email IS NOT NULL);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_team_invites_pending_email_unique
+ON team_invites (team_id, invited_email)
+WHERE status = 'pending' AND invited_user_id IS NULL;
+
+CREATE TABLE IF NOT EXISTS invite_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    invite_id UUID NOT NULL REFERENCES team_invites(id) ON DELETE CASCADE,
+    email TEXT NOT NULL,
+    redirect_to TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sent', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    sent_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_invite_outbox_due
+ON invite_outbox (next_attempt_at)
+WHERE status = 'pending';
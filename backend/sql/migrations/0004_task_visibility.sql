@@ -0,0 +1,112 @@
+-- One row per (user, task) the user may see: tasks they created plus every
+-- task of the teams they belong to. Kept in sync by the triggers below so
+-- task reads become a single index lookup instead of
+-- "created_by = $1 OR team_id IN (...)".
+
+CREATE TABLE IF NOT EXISTS task_visibility (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    task_id UUID NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, task_id)
+);
+
+-- Task listing: newest first for one user, index-only.
+CREATE INDEX IF NOT EXISTS idx_task_visibility_user_created
+ON task_visibility (user_id, created_at DESC, task_id);
+
+-- Cascades from tasks and membership removals.
+CREATE INDEX IF NOT EXISTS idx_task_visibility_task
+ON task_visibility (task_id);
+
+CREATE OR REPLACE FUNCTION task_visibility_sync_task() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM task_visibility WHERE task_id = NEW.id;
+    END IF;
+
+    INSERT INTO task_visibility (user_id, task_id, created_at)
+    SELECT NEW.created_by, NEW.id, NEW.created_at
+    WHERE NEW.created_by IS NOT NULL
+    UNION
+    SELECT tm.user_id, NEW.id, NEW.created_at
+    FROM team_members tm
+    WHERE tm.team_id = NEW.team_id
+    ON CONFLICT DO NOTHING;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_task_visibility_task_insert ON tasks;
+CREATE TRIGGER trg_task_visibility_task_insert
+AFTER INSERT ON tasks
+FOR EACH ROW EXECUTE FUNCTION task_visibility_sync_task();
+
+DROP TRIGGER IF EXISTS trg_task_visibility_task_update ON tasks;
+CREATE TRIGGER trg_task_visibility_task_update
+AFTER UPDATE OF team_id, created_by, created_at ON tasks
+FOR EACH ROW
+WHEN (
+    OLD.team_id IS DISTINCT FROM NEW.team_id
+    OR OLD.created_by IS DISTINCT FROM NEW.created_by
+    OR OLD.created_at IS DISTINCT FROM NEW.created_at
+)
+EXECUTE FUNCTION task_visibility_sync_task();
+
+CREATE OR REPLACE FUNCTION task_visibility_sync_member() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        -- Keep rows the user still sees as creator or via another
+        -- membership row for the same team.
+        DELETE FROM task_visibility v
+        USING tasks t
+        WHERE v.user_id = OLD.user_id
+          AND v.task_id = t.id
+          AND t.team_id = OLD.team_id
+          AND t.created_by IS DISTINCT FROM OLD.user_id
+          AND NOT EXISTS (
+              SELECT 1
+              FROM team_members tm
+              WHERE tm.team_id = OLD.team_id
+                AND tm.user_id = OLD.user_id
+          );
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO task_visibility (user_id, task_id, created_at)
+        SELECT NEW.user_id, t.id, t.created_at
+        FROM tasks t
+        WHERE t.team_id = NEW.team_id
+        ON CONFLICT DO NOTHING;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_task_visibility_member_insert ON team_members;
+CREATE TRIGGER trg_task_visibility_member_insert
+AFTER INSERT ON team_members
+FOR EACH ROW EXECUTE FUNCTION task_visibility_sync_member();
+
+DROP TRIGGER IF EXISTS trg_task_visibility_member_delete ON team_members;
+CREATE TRIGGER trg_task_visibility_member_delete
+AFTER DELETE ON team_members
+FOR EACH ROW EXECUTE FUNCTION task_visibility_sync_member();
+
+DROP TRIGGER IF EXISTS trg_task_visibility_member_update ON team_members;
+CREATE TRIGGER trg_task_visibility_member_update
+AFTER UPDATE OF user_id, team_id ON team_members
+FOR EACH ROW
+WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id OR OLD.team_id IS DISTINCT FROM NEW.team_id)
+EXECUTE FUNCTION task_visibility_sync_member();
+
+INSERT INTO task_visibility (user_id, task_id, created_at)
+SELECT t.created_by, t.id, t.created_at
+FROM tasks t
+WHERE t.created_by IS NOT NULL
+UNION
+SELECT tm.user_id, t.id, t.created_at
+FROM tasks t
+JOIN team_members tm ON tm.team_id = t.team_id
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,77 @@
+-- Cold storage for completed tasks. maintenance.TaskArchiver moves done
+-- tasks older than ARCHIVE_AFTER_DAYS out of the hot tables in small
+-- batches; reads only look here when asked for include_archived.
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS completed_at TIMESTAMPTZ;
+
+CREATE OR REPLACE FUNCTION tasks_set_completed_at() RETURNS trigger AS $$
+BEGIN
+    IF NEW.status = 'done' THEN
+        IF TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'done' THEN
+            NEW.completed_at := COALESCE(NEW.completed_at, NOW());
+        END IF;
+    ELSE
+        NEW.completed_at := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tasks_completed_at ON tasks;
+CREATE TRIGGER trg_tasks_completed_at
+BEFORE INSERT OR UPDATE OF status ON tasks
+FOR EACH ROW EXECUTE FUNCTION tasks_set_completed_at();
+
+-- The real completion time of existing done tasks is unknown; start their
+-- clock now rather than archiving something finished yesterday. Called by
+-- 0020 outside a transaction, which also builds the archiver's index: it
+-- commits after every ``batch_size`` tasks (in id order), so no batch holds
+-- row locks for long.
+CREATE OR REPLACE PROCEDURE backfill_task_completed_at(batch_size INTEGER) AS $$
+DECLARE
+    last_id UUID := '00000000-0000-0000-0000-000000000000';
+    batch_end UUID;
+BEGIN
+    LOOP
+        WITH batch AS (
+            SELECT id
+            FROM tasks
+            WHERE id > last_id
+            ORDER BY id
+            LIMIT batch_size
+        ),
+        updated AS (
+            UPDATE tasks t
+            SET completed_at = NOW()
+            FROM batch b
+            WHERE t.id = b.id
+              AND t.status = 'done'
+              AND t.completed_at IS NULL
+        )
+        SELECT id INTO batch_end FROM batch ORDER BY id DESC LIMIT 1;
+        EXIT WHEN batch_end IS NULL;
+
+        last_id := batch_end;
+        COMMIT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- data holds the task row as jsonb (read back with
+-- jsonb_populate_record(NULL::tasks, data)), comments its comment rows.
+CREATE TABLE IF NOT EXISTS tasks_archive (
+    id UUID PRIMARY KEY,
+    team_id UUID,
+    created_by UUID NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL,
+    completed_at TIMESTAMPTZ,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    data JSONB NOT NULL,
+    comments JSONB NOT NULL DEFAULT '[]'::jsonb
+);
+
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_created_by_created_at
+ON tasks_archive (created_by, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_team_created_at
+ON tasks_archive (team_id, created_at DESC);
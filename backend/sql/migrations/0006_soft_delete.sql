@@ -0,0 +1,149 @@
+-- Deleting a team or task marks it deleted_at and queues a deletion job;
+-- maintenance.Purger then removes the dependent rows in small batches.
+-- Reads go through the active_* views below, which hide deleted teams.
+
+ALTER TABLE teams ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_teams_deleted
+ON teams (id)
+WHERE deleted_at IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS deletion_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL CHECK (kind IN ('team', 'task')),
+    target_id UUID NOT NULL,
+    requested_by UUID,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done')),
+    step TEXT,
+    rows_deleted BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_deletion_jobs_open
+ON deletion_jobs (id)
+WHERE status <> 'done';
+
+-- Memberships of live teams only.
+CREATE OR REPLACE VIEW active_team_members AS
+SELECT tm.*
+FROM team_members tm
+JOIN teams t ON t.id = tm.team_id
+WHERE t.deleted_at IS NULL;
+
+-- task_visibility carries team_id so rows of a deleted team can be hidden
+-- with an anti-join against the (small) set of deleted teams, without
+-- touching every row at delete time.
+ALTER TABLE task_visibility ADD COLUMN IF NOT EXISTS team_id UUID;
+
+-- team_id for rows written before this migration (the trigger below fills
+-- it for new ones). Called by 0021 outside a transaction, which also
+-- builds the index the task list walks: it commits after every
+-- ``batch_size`` tasks (in id order), so no batch holds row locks for long.
+CREATE OR REPLACE PROCEDURE backfill_task_visibility_team(batch_size INTEGER) AS $$
+DECLARE
+    last_id UUID := '00000000-0000-0000-0000-000000000000';
+    batch_end UUID;
+BEGIN
+    LOOP
+        WITH batch AS (
+            SELECT id, team_id
+            FROM tasks
+            WHERE id > last_id
+            ORDER BY id
+            LIMIT batch_size
+        ),
+        updated AS (
+            UPDATE task_visibility v
+            SET team_id = b.team_id
+            FROM batch b
+            WHERE v.task_id = b.id
+              AND b.team_id IS NOT NULL
+              AND v.team_id IS NULL
+        )
+        SELECT id INTO batch_end FROM batch ORDER BY id DESC LIMIT 1;
+        EXIT WHEN batch_end IS NULL;
+
+        last_id := batch_end;
+        COMMIT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE VIEW active_task_visibility AS
+SELECT v.*
+FROM task_visibility v
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM teams d
+    WHERE d.id = v.team_id
+      AND d.deleted_at IS NOT NULL
+);
+
+-- Same as 0004, plus team_id and skipping deleted tasks.
+CREATE OR REPLACE FUNCTION task_visibility_sync_task() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM task_visibility WHERE task_id = NEW.id;
+    END IF;
+
+    IF NEW.deleted_at IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO task_visibility (user_id, task_id, created_at, team_id)
+    SELECT NEW.created_by, NEW.id, NEW.created_at, NEW.team_id
+    WHERE NEW.created_by IS NOT NULL
+    UNION
+    SELECT tm.user_id, NEW.id, NEW.created_at, NEW.team_id
+    FROM team_members tm
+    WHERE tm.team_id = NEW.team_id
+    ON CONFLICT DO NOTHING;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_task_visibility_task_update ON tasks;
+CREATE TRIGGER trg_task_visibility_task_update
+AFTER UPDATE OF team_id, created_by, created_at, deleted_at ON tasks
+FOR EACH ROW
+WHEN (
+    OLD.team_id IS DISTINCT FROM NEW.team_id
+    OR OLD.created_by IS DISTINCT FROM NEW.created_by
+    OR OLD.created_at IS DISTINCT FROM NEW.created_at
+    OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at
+)
+EXECUTE FUNCTION task_visibility_sync_task();
+
+CREATE OR REPLACE FUNCTION task_visibility_sync_member() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        DELETE FROM task_visibility v
+        USING tasks t
+        WHERE v.user_id = OLD.user_id
+          AND v.task_id = t.id
+          AND t.team_id = OLD.team_id
+          AND t.created_by IS DISTINCT FROM OLD.user_id
+          AND NOT EXISTS (
+              SELECT 1
+              FROM team_members tm
+              WHERE tm.team_id = OLD.team_id
+                AND tm.user_id = OLD.user_id
+          );
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO task_visibility (user_id, task_id, created_at, team_id)
+        SELECT NEW.user_id, t.id, t.created_at, t.team_id
+        FROM tasks t
+        WHERE t.team_id = NEW.team_id
+          AND t.deleted_at IS NULL
+        ON CONFLICT DO NOTHING;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
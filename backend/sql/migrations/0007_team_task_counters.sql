@@ -0,0 +1,98 @@
+-- Per-team task counts by (assignee, status, priority), maintained by a
+-- trigger on tasks so team analytics read O(groups) rows instead of
+-- counting tasks. Unassigned tasks use the nil UUID as assigned_to so the
+-- key can be a primary key. Archived tasks stay counted (the archiver sets
+-- taskflow.archiving); soft-deleted tasks do not.
+-- maintenance.CounterRepair recomputes them from scratch periodically.
+-- No FK to teams: the trigger runs while tasks are cascade-deleted, so the
+-- purger removes a team's counters itself.
+
+CREATE TABLE IF NOT EXISTS team_task_counters (
+    team_id UUID NOT NULL,
+    assigned_to UUID NOT NULL,
+    status TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    task_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (team_id, assigned_to, status, priority)
+);
+
+CREATE OR REPLACE FUNCTION team_task_counters_apply() RETURNS trigger AS $$
+BEGIN
+    -- One upsert with rows in key order, so concurrent updates lock
+    -- counter rows in the same order.
+    INSERT INTO team_task_counters AS c (team_id, assigned_to, status, priority, task_count)
+    SELECT d.team_id, d.assigned_to, d.status, d.priority, SUM(d.delta)
+    FROM (
+        SELECT OLD.team_id AS team_id,
+               COALESCE(OLD.assigned_to, '00000000-0000-0000-0000-000000000000'::uuid) AS assigned_to,
+               OLD.status AS status,
+               OLD.priority AS priority,
+               -1 AS delta
+        WHERE TG_OP IN ('UPDATE', 'DELETE')
+          AND OLD.team_id IS NOT NULL
+          AND OLD.deleted_at IS NULL
+          AND NOT (TG_OP = 'DELETE' AND current_setting('taskflow.archiving', true) = 'on')
+        UNION ALL
+        SELECT NEW.team_id,
+               COALESCE(NEW.assigned_to, '00000000-0000-0000-0000-000000000000'::uuid),
+               NEW.status,
+               NEW.priority,
+               1
+        WHERE TG_OP IN ('INSERT', 'UPDATE')
+          AND NEW.team_id IS NOT NULL
+          AND NEW.deleted_at IS NULL
+    ) AS d
+    GROUP BY d.team_id, d.assigned_to, d.status, d.priority
+    HAVING SUM(d.delta) <> 0
+    ORDER BY d.team_id, d.assigned_to, d.status, d.priority
+    ON CONFLICT (team_id, assigned_to, status, priority) DO UPDATE
+    SET task_count = c.task_count + EXCLUDED.task_count;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_team_task_counters_insert ON tasks;
+CREATE TRIGGER trg_team_task_counters_insert
+AFTER INSERT ON tasks
+FOR EACH ROW EXECUTE FUNCTION team_task_counters_apply();
+
+DROP TRIGGER IF EXISTS trg_team_task_counters_delete ON tasks;
+CREATE TRIGGER trg_team_task_counters_delete
+AFTER DELETE ON tasks
+FOR EACH ROW EXECUTE FUNCTION team_task_counters_apply();
+
+DROP TRIGGER IF EXISTS trg_team_task_counters_update ON tasks;
+CREATE TRIGGER trg_team_task_counters_update
+AFTER UPDATE OF team_id, assigned_to, status, priority, deleted_at ON tasks
+FOR EACH ROW
+WHEN (
+    OLD.team_id IS DISTINCT FROM NEW.team_id
+    OR OLD.assigned_to IS DISTINCT FROM NEW.assigned_to
+    OR OLD.status IS DISTINCT FROM NEW.status
+    OR OLD.priority IS DISTINCT FROM NEW.priority
+    OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at
+)
+EXECUTE FUNCTION team_task_counters_apply();
+
+INSERT INTO team_task_counters (team_id, assigned_to, status, priority, task_count)
+SELECT team_id, assigned_to, status, priority, COUNT(*)
+FROM (
+    SELECT t.team_id,
+           COALESCE(t.assigned_to, '00000000-0000-0000-0000-000000000000'::uuid) AS assigned_to,
+           t.status,
+           t.priority
+    FROM tasks t
+    JOIN teams te ON te.id = t.team_id
+    WHERE t.deleted_at IS NULL
+    UNION ALL
+    SELECT a.team_id,
+           COALESCE((a.data->>'assigned_to')::uuid, '00000000-0000-0000-0000-000000000000'::uuid),
+           a.data->>'status',
+           a.data->>'priority'
+    FROM tasks_archive a
+    JOIN teams te ON te.id = a.team_id
+) AS counted
+GROUP BY team_id, assigned_to, status, priority
+ON CONFLICT (team_id, assigned_to, status, priority) DO UPDATE
+SET task_count = EXCLUDED.task_count;
@@ -0,0 +1,80 @@
+-- Append-only status history for team flow metrics. A trigger on tasks
+-- records creation (from_status NULL), every status change, soft deletes
+-- and moves out of a team (to_status NULL). Archiving keeps the history.
+
+CREATE TABLE IF NOT EXISTS task_status_events (
+    id BIGSERIAL PRIMARY KEY,
+    task_id UUID NOT NULL,
+    team_id UUID,
+    from_status TEXT,
+    to_status TEXT,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Rows arrive in time order, so a BRIN index covers time-range scans
+-- across all teams (retention, exports) at a tiny fraction of a btree.
+CREATE INDEX IF NOT EXISTS idx_task_status_events_changed_at_brin
+ON task_status_events USING BRIN (changed_at);
+
+-- Per-team flow queries and per-task start/creation lookups.
+CREATE INDEX IF NOT EXISTS idx_task_status_events_team_changed_at
+ON task_status_events (team_id, changed_at);
+
+CREATE INDEX IF NOT EXISTS idx_task_status_events_task_changed_at
+ON task_status_events (task_id, changed_at);
+
+CREATE OR REPLACE FUNCTION task_status_events_record() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.deleted_at IS NULL THEN
+            INSERT INTO task_status_events (task_id, team_id, from_status, to_status)
+            VALUES (NEW.id, NEW.team_id, NULL, NEW.status);
+        END IF;
+        RETURN NULL;
+    END IF;
+
+    IF OLD.deleted_at IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF NEW.deleted_at IS NOT NULL THEN
+        INSERT INTO task_status_events (task_id, team_id, from_status, to_status)
+        VALUES (NEW.id, OLD.team_id, OLD.status, NULL);
+    ELSIF OLD.team_id IS DISTINCT FROM NEW.team_id THEN
+        INSERT INTO task_status_events (task_id, team_id, from_status, to_status)
+        VALUES (NEW.id, OLD.team_id, OLD.status, NULL),
+               (NEW.id, NEW.team_id, NULL, NEW.status);
+    ELSE
+        INSERT INTO task_status_events (task_id, team_id, from_status, to_status)
+        VALUES (NEW.id, NEW.team_id, OLD.status, NEW.status);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_task_status_events_insert ON tasks;
+CREATE TRIGGER trg_task_status_events_insert
+AFTER INSERT ON tasks
+FOR EACH ROW EXECUTE FUNCTION task_status_events_record();
+
+DROP TRIGGER IF EXISTS trg_task_status_events_update ON tasks;
+CREATE TRIGGER trg_task_status_events_update
+AFTER UPDATE OF status, team_id, deleted_at ON tasks
+FOR EACH ROW
+WHEN (
+    OLD.status IS DISTINCT FROM NEW.status
+    OR OLD.team_id IS DISTINCT FROM NEW.team_id
+    OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at
+)
+EXECUTE FUNCTION task_status_events_record();
+
+-- Earlier history is unknown: seed one creation event per existing task
+-- with its current status.
+INSERT INTO task_status_events (task_id, team_id, from_status, to_status, changed_at)
+SELECT id, team_id, NULL, status, created_at
+FROM tasks
+WHERE deleted_at IS NULL
+UNION ALL
+SELECT id, team_id, NULL, data->>'status', created_at
+FROM tasks_archive
+ORDER BY 5;
@@ -0,0 +1,16 @@
+-- Comment activity on tasks, so task lists can show it without a query
+-- per task. Kept up to date by the comment create/delete handlers in the
+-- same statement as the comment write.
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS comment_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS last_comment_at TIMESTAMPTZ;
+
+UPDATE tasks t
+SET comment_count = c.comment_count,
+    last_comment_at = c.last_comment_at
+FROM (
+    SELECT task_id, COUNT(*) AS comment_count, MAX(created_at) AS last_comment_at
+    FROM task_comments
+    GROUP BY task_id
+) AS c
+WHERE c.task_id = t.id;
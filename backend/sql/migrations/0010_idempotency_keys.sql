@@ -0,0 +1,17 @@
+-- Stored outcomes of POST requests sent with an Idempotency-Key header,
+-- scoped per user. A row with a NULL response is an in-flight claim; once
+-- the request succeeds the encoded response is kept so retries are replayed
+-- from here. maintenance.IdempotencyKeyPurger removes expired rows.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id UUID NOT NULL,
+    key TEXT NOT NULL,
+    request_hash BYTEA NOT NULL,
+    status_code SMALLINT,
+    response BYTEA,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at
+ON idempotency_keys (created_at);
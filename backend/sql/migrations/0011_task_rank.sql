@@ -0,0 +1,53 @@
+-- Manual order of team tasks within a board column (team_id, status).
+-- rank holds fractional keys from ranking.py; the "C" collation makes them
+-- sort byte-wise. Personal and deleted tasks have no rank.
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS rank TEXT COLLATE "C";
+
+-- Existing tasks keep their newest-first order: evenly spaced 4-digit
+-- base-62 keys per column (ranking.spread), trailing "0" digits trimmed.
+-- Called by 0018 outside a transaction: it commits after every
+-- ``batch_size`` teams, so no batch holds row locks for long.
+CREATE OR REPLACE PROCEDURE backfill_task_ranks(batch_size INTEGER) AS $$
+DECLARE
+    last_team UUID := '00000000-0000-0000-0000-000000000000';
+    batch UUID[];
+BEGIN
+    LOOP
+        SELECT array_agg(id ORDER BY id) INTO batch
+        FROM (
+            SELECT id
+            FROM teams
+            WHERE id > last_team
+            ORDER BY id
+            LIMIT batch_size
+        ) AS next_teams;
+        EXIT WHEN batch IS NULL;
+
+        WITH numbered AS (
+            SELECT
+                id,
+                ROW_NUMBER() OVER w * (14776336 / (COUNT(*) OVER (PARTITION BY team_id, status) + 1)) AS position
+            FROM tasks
+            WHERE team_id = ANY(batch)
+              AND deleted_at IS NULL
+              AND rank IS NULL
+            WINDOW w AS (PARTITION BY team_id, status ORDER BY created_at DESC, id)
+        )
+        UPDATE tasks t
+        SET rank = rtrim(
+            substr(d.digits, (n.position / 238328 % 62)::int + 1, 1)
+            || substr(d.digits, (n.position / 3844 % 62)::int + 1, 1)
+            || substr(d.digits, (n.position / 62 % 62)::int + 1, 1)
+            || substr(d.digits, (n.position % 62)::int + 1, 1),
+            '0'
+        )
+        FROM numbered n,
+             (SELECT '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'::text COLLATE "C" AS digits) AS d
+        WHERE t.id = n.id;
+
+        last_team := batch[array_length(batch, 1)];
+        COMMIT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
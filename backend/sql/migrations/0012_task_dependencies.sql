@@ -0,0 +1,22 @@
+-- "Blocked by" edges between tasks of one team: task_id cannot finish
+-- before blocked_by. Edges never form a cycle; the insert path checks
+-- reachability under a lock on the team row. Removing either task (purge or
+-- archive) removes the edge.
+
+CREATE TABLE IF NOT EXISTS task_dependencies (
+    task_id UUID NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    blocked_by UUID NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    team_id UUID NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+    created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (task_id, blocked_by),
+    CHECK (task_id <> blocked_by)
+);
+
+-- The primary key walks upstream (a task's blockers); this one walks
+-- downstream (what a task blocks).
+CREATE INDEX IF NOT EXISTS idx_task_dependencies_blocked_by
+ON task_dependencies (blocked_by, task_id);
+
+CREATE INDEX IF NOT EXISTS idx_task_dependencies_team
+ON task_dependencies (team_id);
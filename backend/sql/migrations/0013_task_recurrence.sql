@@ -0,0 +1,24 @@
+-- Recurring tasks (see recurrence.py). A series is one tasks row whose
+-- recurrence rule is anchored at its due_date; occurrences are expanded
+-- per request. Only occurrences that were completed, edited, moved or
+-- skipped get a task_occurrences row, keyed by their original slot.
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS recurrence TEXT;
+
+CREATE TABLE IF NOT EXISTS task_occurrences (
+    task_id UUID NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    occurs_at TIMESTAMPTZ NOT NULL,
+    status TEXT NOT NULL DEFAULT 'todo',
+    title TEXT,
+    due_date TIMESTAMPTZ,
+    skipped BOOLEAN NOT NULL DEFAULT FALSE,
+    completed_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (task_id, occurs_at)
+);
+
+-- Calendar reads: a user's one-off tasks by due date come from
+-- task_visibility; this finds the exceptions moved into a window.
+CREATE INDEX IF NOT EXISTS idx_task_occurrences_due_date
+ON task_occurrences (task_id, due_date)
+WHERE due_date IS NOT NULL;
@@ -0,0 +1,8 @@
+-- migrate:no-transaction
+-- Email lookups (GET /check-email, invites by email, bulk invites) match on
+-- LOWER(email), which a plain index on email cannot serve.
+-- If the concurrent build fails it leaves an INVALID index behind; drop it
+-- and re-run the migrations.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_lower_email
+ON users (LOWER(email));
@@ -0,0 +1,89 @@
+-- The task_visibility triggers read the other table (tasks read
+-- team_members and vice versa) under READ COMMITTED. Two concurrent writes
+-- to the same team could each miss the other: a new member never got a
+-- row for a task inserted at the same moment, and a task inserted while a
+-- member was removed still got a row for that member. Both triggers now
+-- serialize per team with a transaction-level advisory lock first, so
+-- whichever runs second sees the first one's committed rows.
+-- maintenance.VisibilityRepair diffs task_visibility against tasks and
+-- team_members to fix rows written before this migration.
+
+-- Locks the given teams until the end of the transaction, lowest id first
+-- so writers that touch two teams cannot deadlock. Two-key form, so team
+-- locks never collide with the single-key session locks of the
+-- maintenance jobs and the migrator.
+CREATE OR REPLACE FUNCTION lock_team_writes(VARIADIC teams UUID[]) RETURNS void AS $$
+DECLARE
+    team UUID;
+BEGIN
+    FOR team IN SELECT DISTINCT t FROM unnest(teams) AS t WHERE t IS NOT NULL ORDER BY t LOOP
+        PERFORM pg_advisory_xact_lock(720114000, hashtext(team::text));
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Same as 0006, plus the team lock.
+CREATE OR REPLACE FUNCTION task_visibility_sync_task() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM lock_team_writes(OLD.team_id, NEW.team_id);
+        DELETE FROM task_visibility WHERE task_id = NEW.id;
+    ELSE
+        PERFORM lock_team_writes(NEW.team_id);
+    END IF;
+
+    IF NEW.deleted_at IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO task_visibility (user_id, task_id, created_at, team_id)
+    SELECT NEW.created_by, NEW.id, NEW.created_at, NEW.team_id
+    WHERE NEW.created_by IS NOT NULL
+    UNION
+    SELECT tm.user_id, NEW.id, NEW.created_at, NEW.team_id
+    FROM team_members tm
+    WHERE tm.team_id = NEW.team_id
+    ON CONFLICT DO NOTHING;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Same as 0006, plus the team lock.
+CREATE OR REPLACE FUNCTION task_visibility_sync_member() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM lock_team_writes(NEW.team_id);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM lock_team_writes(OLD.team_id);
+    ELSE
+        PERFORM lock_team_writes(OLD.team_id, NEW.team_id);
+    END IF;
+
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        DELETE FROM task_visibility v
+        USING tasks t
+        WHERE v.user_id = OLD.user_id
+          AND v.task_id = t.id
+          AND t.team_id = OLD.team_id
+          AND t.created_by IS DISTINCT FROM OLD.user_id
+          AND NOT EXISTS (
+              SELECT 1
+              FROM team_members tm
+              WHERE tm.team_id = OLD.team_id
+                AND tm.user_id = OLD.user_id
+          );
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO task_visibility (user_id, task_id, created_at, team_id)
+        SELECT NEW.user_id, t.id, t.created_at, t.team_id
+        FROM tasks t
+        WHERE t.team_id = NEW.team_id
+          AND t.deleted_at IS NULL
+        ON CONFLICT DO NOTHING;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,50 @@
+-- maintenance.rebuild_team_counters used to lock all of team_task_counters
+-- while it recounted one team, stalling task writes of every team on each
+-- CounterRepair step. The counter trigger now takes the per-team lock from
+-- 0015 before applying its delta, and the repair takes the same lock, so a
+-- recount only waits for (and holds up) writes to its own team.
+
+-- Same as 0007, plus the team lock for the teams it changes counts of.
+CREATE OR REPLACE FUNCTION team_task_counters_apply() RETURNS trigger AS $$
+DECLARE
+    old_team UUID;
+    new_team UUID;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE')
+       AND OLD.deleted_at IS NULL
+       AND NOT (TG_OP = 'DELETE' AND current_setting('taskflow.archiving', true) = 'on') THEN
+        old_team := OLD.team_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.deleted_at IS NULL THEN
+        new_team := NEW.team_id;
+    END IF;
+    PERFORM lock_team_writes(old_team, new_team);
+
+    -- One upsert with rows in key order, so concurrent updates lock
+    -- counter rows in the same order.
+    INSERT INTO team_task_counters AS c (team_id, assigned_to, status, priority, task_count)
+    SELECT d.team_id, d.assigned_to, d.status, d.priority, SUM(d.delta)
+    FROM (
+        SELECT old_team AS team_id,
+               COALESCE(OLD.assigned_to, '00000000-0000-0000-0000-000000000000'::uuid) AS assigned_to,
+               OLD.status AS status,
+               OLD.priority AS priority,
+               -1 AS delta
+        WHERE old_team IS NOT NULL
+        UNION ALL
+        SELECT new_team,
+               COALESCE(NEW.assigned_to, '00000000-0000-0000-0000-000000000000'::uuid),
+               NEW.status,
+               NEW.priority,
+               1
+        WHERE new_team IS NOT NULL
+    ) AS d
+    GROUP BY d.team_id, d.assigned_to, d.status, d.priority
+    HAVING SUM(d.delta) <> 0
+    ORDER BY d.team_id, d.assigned_to, d.status, d.priority
+    ON CONFLICT (team_id, assigned_to, status, priority) DO UPDATE
+    SET task_count = c.task_count + EXCLUDED.task_count;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,17 @@
+-- users rows written on one shard that still have to be copied to the
+-- others. The write that changes a user queues (or bumps) its row here in
+-- the same transaction; sharding.replicate_users removes it once every other
+-- shard has the row, and maintenance.UserReplicationRetry retries whatever
+-- is left (a shard was down, or the worker died before copying).
+-- ``version`` grows on every write, so a copy of an older version never
+-- clears the row of a newer one.
+
+CREATE TABLE IF NOT EXISTS user_replication_queue (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 1,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_replication_queue_due
+ON user_replication_queue (next_attempt_at);
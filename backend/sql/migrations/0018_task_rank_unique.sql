@@ -0,0 +1,21 @@
+-- migrate:no-transaction
+-- Ranks for tasks that predate 0011, then one key per column, without
+-- holding a lock on tasks for the whole backfill or index build: the
+-- backfill commits per batch of teams, the index is built concurrently and
+-- the constraint takes it over. The constraint is dropped first so a re-run
+-- after a failure part-way starts over.
+-- If the concurrent build fails it leaves an INVALID index behind; drop it
+-- and re-run the migrations.
+
+CALL backfill_task_ranks(500);
+
+ALTER TABLE tasks DROP CONSTRAINT IF EXISTS tasks_team_status_rank_key;
+
+-- Also the index behind column reads. Deferrable so the rebalancer can
+-- respace a column in one statement.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS tasks_team_status_rank_key
+ON tasks (team_id, status, rank);
+
+ALTER TABLE tasks
+ADD CONSTRAINT tasks_team_status_rank_key UNIQUE USING INDEX tasks_team_status_rank_key
+DEFERRABLE INITIALLY IMMEDIATE;
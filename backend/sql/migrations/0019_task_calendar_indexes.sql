@@ -0,0 +1,21 @@
+-- migrate:no-transaction
+-- The calendar read every series a user ever started, ended or not, and
+-- matched one-off tasks by due date without an index. recurrence_ends_at
+-- is the last slot of a bounded series (recurrence.series_end, written with
+-- the rule and due date); NULL means it never ends. Series written before
+-- this migration keep NULL until their next edit, which only costs the
+-- filter, not correctness.
+-- If a concurrent build fails it leaves an INVALID index behind; drop it
+-- and re-run the migrations.
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS recurrence_ends_at TIMESTAMPTZ;
+
+-- One-off tasks (and series starting) in a window.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_due_date
+ON tasks (due_date)
+WHERE deleted_at IS NULL AND due_date IS NOT NULL;
+
+-- Series still running at the start of a window.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_series_end
+ON tasks (recurrence_ends_at, due_date)
+WHERE deleted_at IS NULL AND recurrence IS NOT NULL;
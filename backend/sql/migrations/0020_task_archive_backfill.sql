@@ -0,0 +1,13 @@
+-- migrate:no-transaction
+-- completed_at for done tasks that predate 0005, then the archiver's
+-- index, without holding a lock on tasks for the whole backfill or index
+-- build: the backfill commits per batch, the index is built concurrently.
+-- If the concurrent build fails it leaves an INVALID index behind; drop it
+-- and re-run the migrations.
+
+CALL backfill_task_completed_at(1000);
+
+-- Archiver candidates only; stays as small as the set of done tasks.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_done_completed_at
+ON tasks (completed_at)
+WHERE status = 'done';
@@ -0,0 +1,15 @@
+-- migrate:no-transaction
+-- task_visibility.team_id for rows that predate 0006, then the task list
+-- index that carries it, without holding a lock on task_visibility for the
+-- whole backfill or index build: the backfill commits per batch, the index
+-- is built concurrently, and the index it replaces is dropped only once
+-- the new one is in place.
+-- If the concurrent build fails it leaves an INVALID index behind; drop it
+-- and re-run the migrations.
+
+CALL backfill_task_visibility_team(1000);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_task_visibility_user_created_team
+ON task_visibility (user_id, created_at DESC, task_id) INCLUDE (team_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_task_visibility_user_created;
@@ -0,0 +1,9 @@
+-- migrate:no-transaction
+-- Overdue depends on the clock, so team analytics (see 0007) count it live
+-- from this index. Built concurrently so tasks stay writable meanwhile.
+-- If the build fails it leaves an INVALID index behind; drop it and re-run
+-- the migrations.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_open_due
+ON tasks (team_id, due_date)
+WHERE status <> 'done' AND deleted_at IS NULL AND due_date IS NOT NULL;
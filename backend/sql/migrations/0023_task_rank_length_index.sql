@@ -0,0 +1,10 @@
+-- migrate:no-transaction
+-- Lets maintenance.RankRebalancer find the longest rank key with a short
+-- backward index scan instead of scanning tasks. On length(rank) rather
+-- than partial on RANK_MAX_LENGTH, which is a setting.
+-- If the concurrent build fails it leaves an INVALID index behind; drop it
+-- and re-run the migrations.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_rank_length
+ON tasks ((length(rank)))
+WHERE rank IS NOT NULL;
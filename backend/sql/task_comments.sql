@@ -1,14 +0,0 @@
-CREATE TABLE IF NOT EXISTS task_comments (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-    task_id UUID NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
-    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    content TEXT NOT NULL CHECK (length(trim(content)) > 0),
-    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-);
-
-CREATE INDEX IF NOT EXISTS idx_task_comments_task_id_created_at
-    ON task_comments (task_id, created_at DESC);
-
-CREATE INDEX IF NOT EXISTS idx_task_comments_user_id
-    ON task_comments (user_id);
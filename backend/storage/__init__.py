@@ -0,0 +1,24 @@
+"""Storage backend selected by STORAGE_BACKEND.
+
+``postgres`` (default) is the production backend. ``memory`` keeps
+everything in the worker process, for profiling the HTTP stack without a
+database and for fast API tests; it needs no DATABASE_URL.
+"""
+import os
+
+from storage.base import Storage
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres").strip().lower()
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "memory":
+        from storage.memory import MemoryStorage
+        return MemoryStorage()
+    if backend == "postgres":
+        from storage.postgres import PostgresStorage
+        return PostgresStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+storage = create_storage()
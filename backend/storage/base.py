@@ -0,0 +1,290 @@
+"""Repository interfaces behind the route handlers.
+
+Handlers keep validation, error messages, response caching and HTTP; a
+Storage owns every read and write, one repository per aggregate. Rows are
+mappings (asyncpg Records or dicts) with the columns of the Postgres schema
+plus the joined display names the routes return.
+
+Every backend honours the same visibility rules:
+
+* a task is visible to its creator and to the members of its team, unless
+  the task or the team is deleted;
+* team reads and writes need a membership (admin where noted) of a team
+  that is not deleted;
+* comments follow the visibility of their task.
+"""
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import HTTPException
+
+from ranking import key_between
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def get(self, user_id) -> Mapping | None:
+        """id, email, name, created_at of one user."""
+
+    @abstractmethod
+    async def find(self, user_ids: list, emails: list[str]) -> list[Mapping]:
+        """id and lower-cased email of users matching any id or email."""
+
+    @abstractmethod
+    async def email_exists(self, email: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def upsert(self, user_id, email: str, name: str) -> Mapping:
+        ...
+
+    @abstractmethod
+    async def rename(self, user_id, name: str) -> Mapping | None:
+        ...
+
+
+class TaskRepository(ABC):
+    @abstractmethod
+    async def list_for_user(self, user_id, limit: int, offset: int,
+                            include_archived: bool = False) -> tuple[list[Mapping], int]:
+        """Visible tasks, newest first, and their total count."""
+
+    @abstractmethod
+    async def get(self, task_id, user_id, include_archived: bool = False) -> Mapping | None:
+        """A visible task with created_by_name, team_name and assigned_to_name."""
+
+    @abstractmethod
+    async def create(self, user_id, task: dict) -> Mapping | None:
+        """Insert ``task`` (title, description, status, priority, team_id,
+        due_date, assigned_to, recurrence); None if the user is not in its
+        team."""
+
+    @abstractmethod
+    async def assignee_in_team(self, task_id, member_id) -> bool:
+        """Whether team member ``member_id`` belongs to the task's team."""
+
+    @abstractmethod
+    async def update(self, task_id, user_id, changes: dict) -> Mapping | None:
+        """Apply ``changes`` to a visible task; None if there is none. A new
+        rule or due date for a series re-keys its task_occurrences rows
+        (recurrence.carry_over)."""
+
+    @abstractmethod
+    async def delete(self, task_id, user_id) -> bool:
+        """Soft-delete a visible task."""
+
+    @abstractmethod
+    async def get_full(self, task_id, user_id, comments_before: tuple, comments_limit: int) -> tuple[Mapping, list[Mapping], list[Mapping]] | None:
+        """A visible task with a page of its comments (as
+        CommentRepository.list_for_task returns them) and its team's members
+        (with name and email; empty for personal tasks or unless the user is
+        an active member); None if it is not visible."""
+
+    @abstractmethod
+    async def column(self, team_id, status: str, after: str, limit: int) -> list[Mapping]:
+        """Team tasks in one board column ranked after ``after``, in board
+        order, with created_by_name and assigned_to_name."""
+
+    @abstractmethod
+    async def calendar(self, user_id, start: datetime, end: datetime) -> tuple[list[Mapping], list[Mapping]]:
+        """Visible one-off tasks due in [start, end) and recurring series
+        due before ``end`` that have not ended (recurrence_ends_at) or been
+        finished before ``start``, or have an occurrence moved into the
+        window (id, title, status, priority, team_id,
+        assigned_to, due_date, recurrence, completed_at), plus the
+        task_occurrences rows of those series with occurs_at or due_date
+        in the window."""
+
+    @abstractmethod
+    async def save_occurrence(self, task_id, occurs_at: datetime, changes: dict) -> Mapping:
+        """Materialise one occurrence of a series with ``changes`` (status,
+        title, due_date, skipped) applied on top of any earlier ones."""
+
+    @abstractmethod
+    async def move(self, task_id, user_id, status: str | None, before_id, after_id) -> Mapping | None:
+        """Give a visible team task a rank between ``before_id`` (above it)
+        and ``after_id`` (below it), moving it to ``status`` if given; top of
+        the column when both are None. Writes only the moved task."""
+
+
+def move_rank(task: Mapping, status: str, neighbours: Mapping, before_id, after_id,
+              top_rank: str | None) -> str:
+    """New rank for ``task`` in column ``status``.
+
+    ``neighbours`` maps the ids of the requested neighbours to their rows;
+    they must be live tasks of the same column.
+    """
+    if task["team_id"] is None:
+        raise HTTPException(status_code=400, detail="Only team tasks can be reordered")
+
+    ranks = []
+    for neighbour_id in (before_id, after_id):
+        if neighbour_id is None:
+            ranks.append(None)
+            continue
+        neighbour = neighbours.get(UUID(str(neighbour_id)))
+        if (
+            neighbour is None
+            or neighbour["id"] == task["id"]
+            or neighbour["team_id"] != task["team_id"]
+            or neighbour["status"] != status
+            or neighbour["rank"] is None
+        ):
+            raise HTTPException(status_code=409, detail="The column has changed; reload it and retry")
+        ranks.append(neighbour["rank"])
+
+    before, after = ranks
+    if before is None and after is None:
+        after = top_rank
+    try:
+        return key_between(before, after)
+    except ValueError:
+        raise HTTPException(status_code=409, detail="The column has changed; reload it and retry")
+
+
+class DependencyRepository(ABC):
+    @abstractmethod
+    async def add(self, task_id, blocked_by, user_id) -> Mapping | None:
+        """Record that visible task ``task_id`` is blocked by visible task
+        ``blocked_by``; None if either is not visible. Raises 409 for a
+        duplicate or an edge that would close a cycle."""
+
+    @abstractmethod
+    async def remove(self, task_id, blocked_by, user_id) -> bool:
+        ...
+
+    @abstractmethod
+    async def graph(self, task_id, user_id, upstream_depth: int, downstream_depth: int,
+                    max_nodes: int) -> tuple[list[Mapping], list[Mapping], bool] | None:
+        """Nodes, edges and whether a direction was cut at ``max_nodes``.
+
+        Nodes are the visible task (direction 'root') and the live tasks
+        within ``upstream_depth`` blocker hops ('upstream') or
+        ``downstream_depth`` blocked hops ('downstream') of it, nearest
+        first, each with its depth and open_blockers count. Edges are the
+        (task_id, blocked_by) pairs among them. None if the task is not
+        visible.
+        """
+
+
+def dependency_team(task: Mapping, blocker: Mapping):
+    """Team of the edge ``task`` blocked by ``blocker``."""
+    if task["id"] == blocker["id"]:
+        raise HTTPException(status_code=400, detail="A task cannot depend on itself")
+    if task["team_id"] is None or task["team_id"] != blocker["team_id"]:
+        raise HTTPException(status_code=400, detail="Dependencies must link tasks of the same team")
+    return task["team_id"]
+
+
+class CommentRepository(ABC):
+    @abstractmethod
+    async def list_for_task(self, task_id, user_id, before: tuple[datetime, UUID], limit: int,
+                            include_archived: bool = False) -> list[Mapping] | None:
+        """Comments older than the ``before`` (created_at, id) cursor, newest
+        first, with author_name and author_email; None without access."""
+
+    @abstractmethod
+    async def create(self, task_id, user_id, content: str) -> Mapping | None:
+        """Add a comment and bump the task's counters; None without access."""
+
+    @abstractmethod
+    async def delete(self, comment_id, user_id) -> bool:
+        """Delete the user's own comment."""
+
+
+class TeamRepository(ABC):
+    @abstractmethod
+    async def list_for_user(self, user_id) -> list[Mapping]:
+        """id, name, created_at and role of the user's teams, by name."""
+
+    @abstractmethod
+    async def get(self, team_id) -> Mapping | None:
+        ...
+
+    @abstractmethod
+    async def is_member(self, team_id, user_id, admin: bool = False) -> bool:
+        ...
+
+    @abstractmethod
+    async def create(self, user_id, name: str) -> Mapping:
+        """Create a team with the user as its admin."""
+
+    @abstractmethod
+    async def rename(self, team_id, name: str) -> Mapping | None:
+        ...
+
+    @abstractmethod
+    async def delete(self, team_id, user_id) -> bool:
+        """Soft-delete the team; its rows are purged later."""
+
+    @abstractmethod
+    async def analytics(self, team_id) -> tuple[list[Mapping], list[Mapping]]:
+        """(status, priority, task_count) totals and per-assignee workload
+        (member_id, user_id, name, todo, in_progress, done, overdue)."""
+
+    @abstractmethod
+    async def flow(self, team_id, window_days: int,
+                   statuses: list[str]) -> tuple[Mapping, list[Mapping], list[Mapping]]:
+        """Cycle/lead time percentiles, weekly throughput (week, done) and
+        daily (day, status, task_count) cumulative flow."""
+
+
+class MemberRepository(ABC):
+    @abstractmethod
+    async def list_for_team(self, team_id) -> list[Mapping]:
+        """Members with name and email."""
+
+    @abstractmethod
+    async def remove(self, team_id, member_id) -> Mapping | None:
+        ...
+
+    @abstractmethod
+    async def blocked(self, team_id, user_ids: list, emails: list[str]) -> list[Mapping]:
+        """(user_id, email, reason) for targets that are already members
+        ('already_member') or have a pending invite ('already_invited')."""
+
+
+class InviteRepository(ABC):
+    @abstractmethod
+    async def create(self, team_id, inviter_id, target_user_id, email: str | None,
+                     role: str, redirect_to: str) -> Mapping:
+        """Check and invite in one go. Returns is_admin, target_id,
+        already_member and pending_invite plus the invite columns (None when
+        a check failed). Invites by email are queued for the outbox."""
+
+    @abstractmethod
+    async def create_many(self, team_id, inviter_id, role: str, user_ids: list,
+                          emails: list, redirect_to: str) -> list[Mapping] | None:
+        """One invite per (user_id, email) pair, skipping pending duplicates;
+        returns id, invited_user_id and invited_email of those created, or
+        None if the inviter is not an admin of the team."""
+
+    @abstractmethod
+    async def list_for_user(self, user_id) -> list[Mapping]:
+        """Pending invites with team_name, invited_by_name and
+        invited_by_email, newest first."""
+
+    @abstractmethod
+    async def accept(self, invite_id, user_id) -> Mapping | None:
+        """Accept a pending invite and join its team."""
+
+    @abstractmethod
+    async def decline(self, invite_id, user_id) -> Mapping | None:
+        ...
+
+
+class Storage:
+    """One repository per aggregate, plus lifecycle hooks for the app."""
+
+    # Whether the app needs migrations, pools and the background workers.
+    uses_database = True
+
+    users: UserRepository
+    tasks: TaskRepository
+    dependencies: DependencyRepository
+    comments: CommentRepository
+    teams: TeamRepository
+    members: MemberRepository
+    invites: InviteRepository
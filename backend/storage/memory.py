@@ -0,0 +1,942 @@
+"""In-memory storage for profiling the HTTP stack and fast API tests.
+
+Rows live in per-process dicts with the indexes the routes need (a user's
+teams, a team's members and tasks, a task's comments in keyset order).
+Every method runs without awaiting, so each one is atomic on the event loop
+the way a single Postgres statement is. Visibility, soft deletes,
+completed_at and the comment counters follow the Postgres triggers.
+
+Board columns keep their rank keys in sorted lists and are respaced in
+place as soon as a key outgrows RANK_MAX_LENGTH. Dependencies are kept as
+adjacency sets in both directions. Calendar reads scan the user's visible
+tasks.
+
+Not covered: archived tasks (nothing is ever archived), the invite email
+outbox, and Idempotency-Key, which still needs Postgres.
+"""
+import bisect
+import math
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+from ranking import RANK_MAX_LENGTH, key_between, spread
+from recurrence import carry_over, series_end
+from storage.base import (
+    CommentRepository,
+    DependencyRepository,
+    InviteRepository,
+    MemberRepository,
+    Storage,
+    TaskRepository,
+    TeamRepository,
+    UserRepository,
+    dependency_team,
+    move_rank,
+)
+
+_INVITE_COLUMNS = (
+    "id", "team_id", "invited_user_id", "invited_by", "role",
+    "status", "created_at", "responded_at", "invited_email",
+)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _uuid(value) -> uuid.UUID | None:
+    if value is None or isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _timestamp(value: datetime | None) -> datetime | None:
+    # timestamptz reads naive values as UTC (the server's timezone).
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _percentiles(values: list[float], fractions=(0.5, 0.85, 0.95)) -> list[float] | None:
+    """percentile_cont: linear interpolation between the closest ranks."""
+    if not values:
+        return None
+    values = sorted(values)
+    result = []
+    for fraction in fractions:
+        position = fraction * (len(values) - 1)
+        low, high = math.floor(position), math.ceil(position)
+        result.append(values[low] + (values[high] - values[low]) * (position - low))
+    return result
+
+
+def _week(moment: datetime) -> datetime:
+    start = moment.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start - timedelta(days=start.weekday())
+
+
+class _State:
+    def __init__(self):
+        self.users: dict[uuid.UUID, dict] = {}
+        self.teams: dict[uuid.UUID, dict] = {}
+        self.members: dict[uuid.UUID, dict] = {}
+        self.tasks: dict[uuid.UUID, dict] = {}
+        self.comments: dict[uuid.UUID, dict] = {}
+        self.invites: dict[uuid.UUID, dict] = {}
+
+        # lower(email) -> user ids, like idx_users_lower_email
+        self.user_emails: dict[str, set[uuid.UUID]] = defaultdict(set)
+
+        # team_id -> user_id -> member id
+        self.team_members: dict[uuid.UUID, dict[uuid.UUID, uuid.UUID]] = defaultdict(dict)
+        self.user_teams: dict[uuid.UUID, set[uuid.UUID]] = defaultdict(set)
+        self.creator_tasks: dict[uuid.UUID, set[uuid.UUID]] = defaultdict(set)
+        self.team_tasks: dict[uuid.UUID, set[uuid.UUID]] = defaultdict(set)
+        # task_id -> sorted [(created_at, id)]
+        self.task_comments: dict[uuid.UUID, list[tuple]] = defaultdict(list)
+        self.team_invites: dict[uuid.UUID, set[uuid.UUID]] = defaultdict(set)
+        self.user_invites: dict[uuid.UUID, set[uuid.UUID]] = defaultdict(set)
+        # (team_id, status) -> sorted [(rank, id)]
+        self.columns: dict[tuple, list[tuple]] = defaultdict(list)
+        # (task_id, blocked_by) -> edge, and both adjacency directions
+        self.dependencies: dict[tuple, dict] = {}
+        self.blockers: dict[uuid.UUID, set[uuid.UUID]] = defaultdict(set)
+        self.blocking: dict[uuid.UUID, set[uuid.UUID]] = defaultdict(set)
+        # (task_id, occurs_at) -> materialised occurrence
+        self.occurrences: dict[tuple, dict] = {}
+        self.team_events: dict[uuid.UUID, list[dict]] = defaultdict(list)
+        self.task_events: dict[uuid.UUID, list[dict]] = defaultdict(list)
+
+    def active_team(self, team_id) -> dict | None:
+        team = self.teams.get(team_id)
+        return team if team is not None and team["deleted_at"] is None else None
+
+    def member(self, team_id, user_id, admin: bool = False) -> dict | None:
+        if self.active_team(team_id) is None:
+            return None
+        member = self.members.get(self.team_members[team_id].get(user_id))
+        if member is None or (admin and member["role"] != "admin"):
+            return None
+        return member
+
+    def visible(self, task: dict | None, user_id) -> bool:
+        if task is None or task["deleted_at"] is not None:
+            return False
+        if task["team_id"] is not None:
+            if self.active_team(task["team_id"]) is None:
+                return False
+            if user_id in self.team_members[task["team_id"]]:
+                return True
+        return task["created_by"] == user_id
+
+    def task_row(self, task: dict) -> dict:
+        creator = self.users.get(task["created_by"])
+        team = self.teams.get(task["team_id"])
+        assignee = self.members.get(task["assigned_to"])
+        assignee_user = self.users.get(assignee["user_id"]) if assignee else None
+        return {
+            **task,
+            "created_by_name": creator["name"] if creator else None,
+            "team_name": team["name"] if team else None,
+            "assigned_to_name": assignee_user["name"] if assignee_user else None,
+        }
+
+    def member_row(self, member: dict) -> dict:
+        user = self.users[member["user_id"]]
+        return {**member, "name": user["name"], "email": user["email"]}
+
+    def comment_row(self, comment: dict) -> dict:
+        author = self.users[comment["user_id"]]
+        return {**comment, "author_name": author["name"], "author_email": author["email"]}
+
+    def add_member(self, team_id, user_id, role: str) -> dict:
+        member = {"id": uuid.uuid4(), "user_id": user_id, "team_id": team_id, "role": role}
+        self.members[member["id"]] = member
+        self.team_members[team_id][user_id] = member["id"]
+        self.user_teams[user_id].add(team_id)
+        return member
+
+    def record_status(self, task: dict, team_id, from_status, to_status):
+        event = {
+            "task_id": task["id"],
+            "team_id": team_id,
+            "from_status": from_status,
+            "to_status": to_status,
+            "changed_at": _now(),
+        }
+        self.task_events[task["id"]].append(event)
+        if team_id is not None:
+            self.team_events[team_id].append(event)
+
+    def top_rank(self, team_id, status: str, exclude=None) -> str | None:
+        return next((rank for rank, task_id in self.columns[(team_id, status)] if task_id != exclude), None)
+
+    def unplace(self, task: dict):
+        if task["rank"] is not None:
+            self.columns[(task["team_id"], task["status"])].remove((task["rank"], task["id"]))
+            task["rank"] = None
+
+    def place(self, task: dict, rank: str):
+        """Put ``task`` into its current column at ``rank``."""
+        self.unplace(task)
+        column = self.columns[(task["team_id"], task["status"])]
+        task["rank"] = rank
+        bisect.insort(column, (rank, task["id"]))
+        if len(rank) > RANK_MAX_LENGTH:
+            column[:] = [(new, task_id) for new, (_, task_id) in zip(spread(len(column)), column)]
+            for new, task_id in column:
+                self.tasks[task_id]["rank"] = new
+
+    def reschedule(self, task: dict, recurrence: str, due_date: datetime):
+        """Re-key the occurrences of ``task`` after its rule or due date
+        changed from ``recurrence`` and ``due_date``."""
+        slots = [occurs_at for task_id, occurs_at in self.occurrences if task_id == task["id"]]
+        rows = {slot: self.occurrences.pop((task["id"], slot)) for slot in slots}
+        moved = carry_over(recurrence, due_date, task["recurrence"], task["due_date"], slots)
+        for slot, new_slot in moved.items():
+            self.occurrences[(task["id"], new_slot)] = {**rows[slot], "occurs_at": new_slot, "updated_at": _now()}
+
+    def comment_page(self, task_id, before: tuple, limit: int) -> list[dict]:
+        keys = self.task_comments.get(task_id, [])
+        end = bisect.bisect_left(keys, before)
+        return [self.comment_row(self.comments[key[1]]) for key in reversed(keys[max(end - limit, 0):end])]
+
+
+class MemoryUsers(UserRepository):
+    def __init__(self, state: _State):
+        self._state = state
+
+    async def get(self, user_id):
+        user = self._state.users.get(_uuid(user_id))
+        return dict(user) if user else None
+
+    async def find(self, user_ids, emails):
+        state = self._state
+        ids = {_uuid(user_id) for user_id in user_ids} & state.users.keys()
+        for email in set(emails):
+            ids |= state.user_emails.get(email, set())
+        return [{"id": user_id, "email": state.users[user_id]["email"].lower()} for user_id in ids]
+
+    async def email_exists(self, email):
+        return bool(self._state.user_emails.get(email))
+
+    async def upsert(self, user_id, email, name):
+        user_id = _uuid(user_id)
+        user = self._state.users.setdefault(user_id, {"id": user_id, "created_at": _now()})
+        if "email" in user:
+            self._state.user_emails[user["email"].lower()].discard(user_id)
+        user.update(email=email, name=name)
+        self._state.user_emails[email.lower()].add(user_id)
+        return dict(user)
+
+    async def rename(self, user_id, name):
+        user = self._state.users.get(_uuid(user_id))
+        if user is None:
+            return None
+        user["name"] = name
+        return dict(user)
+
+
+class MemoryTasks(TaskRepository):
+    def __init__(self, state: _State):
+        self._state = state
+
+    async def list_for_user(self, user_id, limit, offset, include_archived=False):
+        state = self._state
+        user_id = _uuid(user_id)
+        candidates = set(state.creator_tasks.get(user_id, ()))
+        for team_id in state.user_teams.get(user_id, ()):
+            candidates |= state.team_tasks.get(team_id, set())
+        visible = [state.tasks[task_id] for task_id in candidates if state.visible(state.tasks[task_id], user_id)]
+        visible.sort(key=lambda task: (task["created_at"], task["id"]), reverse=True)
+        extra = {"archived": False} if include_archived else {}
+        rows = [{**state.task_row(task), **extra} for task in visible[offset:offset + limit]]
+        return rows, len(visible)
+
+    async def get(self, task_id, user_id, include_archived=False):
+        task = self._state.tasks.get(_uuid(task_id))
+        if not self._state.visible(task, _uuid(user_id)):
+            return None
+        return self._state.task_row(task)
+
+    async def create(self, user_id, task):
+        state = self._state
+        user_id = _uuid(user_id)
+        team_id = _uuid(task["team_id"])
+        if team_id is not None and state.member(team_id, user_id) is None:
+            return None
+
+        row = {
+            "id": uuid.uuid4(),
+            "title": task["title"],
+            "description": task["description"],
+            "status": task["status"],
+            "priority": task["priority"],
+            "team_id": team_id,
+            "created_by": user_id,
+            "assigned_to": _uuid(task["assigned_to"]),
+            "created_at": _now(),
+            "due_date": _timestamp(task["due_date"]),
+            "completed_at": None,
+            "deleted_at": None,
+            "comment_count": 0,
+            "last_comment_at": None,
+            "rank": None,
+            "recurrence": task["recurrence"],
+            "recurrence_ends_at": series_end(task["recurrence"], task["due_date"]),
+        }
+        if row["status"] == "done":
+            row["completed_at"] = row["created_at"]
+        state.tasks[row["id"]] = row
+        state.creator_tasks[user_id].add(row["id"])
+        if team_id is not None:
+            state.team_tasks[team_id].add(row["id"])
+            # New team tasks go to the top of their column.
+            state.place(row, key_between(None, state.top_rank(team_id, row["status"])))
+        state.record_status(row, team_id, None, row["status"])
+        return dict(row)
+
+    async def assignee_in_team(self, task_id, member_id):
+        task = self._state.tasks.get(_uuid(task_id))
+        member = self._state.members.get(_uuid(member_id))
+        return bool(task and member and task["team_id"] == member["team_id"])
+
+    async def update(self, task_id, user_id, changes):
+        state = self._state
+        task = state.tasks.get(_uuid(task_id))
+        if not state.visible(task, _uuid(user_id)):
+            return None
+
+        changes = dict(changes)
+        if "due_date" in changes:
+            changes["due_date"] = _timestamp(changes["due_date"])
+        if "assigned_to" in changes:
+            changes["assigned_to"] = _uuid(changes["assigned_to"])
+            if changes["assigned_to"] is not None and changes["assigned_to"] not in state.members:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Invalid assignee. Use a team member ID from /teams/{team_id}/members."
+                )
+
+        if "due_date" in changes or "recurrence" in changes:
+            changes["recurrence_ends_at"] = series_end(
+                changes.get("recurrence", task["recurrence"]),
+                changes.get("due_date", task["due_date"]),
+            )
+        old_recurrence, old_due_date = task["recurrence"], task["due_date"]
+
+        old_status = task["status"]
+        if task["team_id"] is not None and changes.get("status", old_status) != old_status:
+            # A task changing column goes to the top of the new one.
+            state.unplace(task)
+            task.update(changes)
+            state.place(task, key_between(None, state.top_rank(task["team_id"], task["status"])))
+        else:
+            task.update(changes)
+        if task["status"] != old_status:
+            task["completed_at"] = _now() if task["status"] == "done" else None
+            state.record_status(task, task["team_id"], old_status, task["status"])
+        if old_recurrence is not None and (task["recurrence"], task["due_date"]) != (old_recurrence, old_due_date):
+            state.reschedule(task, old_recurrence, old_due_date)
+        return dict(task)
+
+    async def delete(self, task_id, user_id):
+        task = self._state.tasks.get(_uuid(task_id))
+        if not self._state.visible(task, _uuid(user_id)):
+            return False
+        self._state.unplace(task)
+        task["deleted_at"] = _now()
+        self._state.record_status(task, task["team_id"], task["status"], None)
+        return True
+
+    async def get_full(self, task_id, user_id, comments_before, comments_limit):
+        state = self._state
+        task = state.tasks.get(_uuid(task_id))
+        if not state.visible(task, _uuid(user_id)):
+            return None
+        comments = state.comment_page(task["id"], comments_before, comments_limit)
+        members = []
+        team_id = task["team_id"]
+        if team_id is not None and state.member(team_id, _uuid(user_id)) is not None:
+            members = [state.member_row(state.members[member_id]) for member_id in state.team_members[team_id].values()]
+        return state.task_row(task), comments, members
+
+    async def column(self, team_id, status, after, limit):
+        state = self._state
+        column = state.columns.get((_uuid(team_id), status), [])
+        start = bisect.bisect_right(column, (after, uuid.UUID(int=(1 << 128) - 1)))
+        rows = []
+        for _, task_id in column[start:start + limit]:
+            row = state.task_row(state.tasks[task_id])
+            del row["team_name"]
+            rows.append(row)
+        return rows
+
+    async def calendar(self, user_id, start, end):
+        state = self._state
+        user_id = _uuid(user_id)
+        candidates = set(state.creator_tasks.get(user_id, ()))
+        for team_id in state.user_teams.get(user_id, ()):
+            candidates |= state.team_tasks.get(team_id, set())
+
+        tasks = []
+        for task_id in candidates:
+            task = state.tasks[task_id]
+            due_date = task["due_date"]
+            if (
+                state.visible(task, user_id)
+                and due_date is not None
+                and due_date < end
+                and (due_date >= start or self._series_in(task, start, end))
+            ):
+                tasks.append({column: task[column] for column in (
+                    "id", "title", "status", "priority", "team_id", "assigned_to",
+                    "due_date", "recurrence", "completed_at",
+                )})
+
+        series = {task["id"] for task in tasks if task["recurrence"] is not None}
+        exceptions = [
+            dict(row) for (task_id, occurs_at), row in state.occurrences.items()
+            if task_id in series and (
+                start <= occurs_at < end
+                or (row["due_date"] is not None and start <= row["due_date"] < end)
+            )
+        ]
+        return tasks, exceptions
+
+    def _series_in(self, task: dict, start: datetime, end: datetime) -> bool:
+        """Whether a series started before ``start`` may have occurrences
+        in the window; the filter of TASK_CALENDAR_QUERY."""
+        if task["recurrence"] is None:
+            return False
+        ends_at = task["recurrence_ends_at"]
+        finished = task["status"] == "done" and task["completed_at"] is not None and task["completed_at"] < start
+        if (ends_at is None or ends_at >= start) and not finished:
+            return True
+        return any(
+            task_id == task["id"] and row["due_date"] is not None and start <= row["due_date"] < end
+            for (task_id, _), row in self._state.occurrences.items()
+        )
+
+    async def save_occurrence(self, task_id, occurs_at, changes):
+        key = (_uuid(task_id), _timestamp(occurs_at))
+        row = self._state.occurrences.get(key)
+        if row is None:
+            row = self._state.occurrences[key] = {
+                "task_id": key[0],
+                "occurs_at": key[1],
+                "status": "todo",
+                "title": None,
+                "due_date": None,
+                "skipped": False,
+                "completed_at": None,
+            }
+        changes = dict(changes)
+        if "due_date" in changes:
+            changes["due_date"] = _timestamp(changes["due_date"])
+        if "status" in changes:
+            done = changes["status"] == "done"
+            changes["completed_at"] = (row["completed_at"] or _now()) if done else None
+        row.update(changes, updated_at=_now())
+        return dict(row)
+
+    async def move(self, task_id, user_id, status, before_id, after_id):
+        state = self._state
+        task = state.tasks.get(_uuid(task_id))
+        if not state.visible(task, _uuid(user_id)):
+            return None
+
+        status = status or task["status"]
+        neighbours = {}
+        for neighbour_id in (before_id, after_id):
+            neighbour = state.tasks.get(_uuid(neighbour_id))
+            if neighbour is not None and neighbour["deleted_at"] is None:
+                neighbours[neighbour["id"]] = neighbour
+        top = None
+        if before_id is None and after_id is None and task["team_id"] is not None:
+            top = state.top_rank(task["team_id"], status, exclude=task["id"])
+        rank = move_rank(task, status, neighbours, before_id, after_id, top)
+
+        old_status = task["status"]
+        state.unplace(task)
+        task["status"] = status
+        state.place(task, rank)
+        if status != old_status:
+            task["completed_at"] = _now() if status == "done" else None
+            state.record_status(task, task["team_id"], old_status, status)
+        return dict(task)
+
+
+class MemoryDependencies(DependencyRepository):
+    def __init__(self, state: _State):
+        self._state = state
+
+    def _walk(self, start, adjacency: dict, max_depth: int) -> list[tuple]:
+        """(task_id, depth) of live tasks within ``max_depth`` hops, nearest first."""
+        tasks = self._state.tasks
+        depths = {start: 0}
+        frontier = [start]
+        for depth in range(1, max_depth + 1):
+            following = []
+            for task_id in frontier:
+                for other in adjacency.get(task_id, ()):
+                    if other not in depths and tasks[other]["deleted_at"] is None:
+                        depths[other] = depth
+                        following.append(other)
+            frontier = following
+        del depths[start]
+        return sorted(depths.items(), key=lambda item: (item[1], item[0]))
+
+    def _reaches(self, start, target) -> bool:
+        seen, stack = {start}, [start]
+        while stack:
+            task_id = stack.pop()
+            if task_id == target:
+                return True
+            for other in self._state.blockers.get(task_id, ()):
+                if other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+        return False
+
+    async def add(self, task_id, blocked_by, user_id):
+        state = self._state
+        user_id = _uuid(user_id)
+        task, blocker = state.tasks.get(_uuid(task_id)), state.tasks.get(_uuid(blocked_by))
+        if not state.visible(task, user_id) or not state.visible(blocker, user_id):
+            return None
+        team_id = dependency_team(task, blocker)
+        if self._reaches(blocker["id"], task["id"]):
+            raise HTTPException(status_code=409, detail="This dependency would create a cycle")
+        key = (task["id"], blocker["id"])
+        if key in state.dependencies:
+            raise HTTPException(status_code=409, detail="This dependency already exists")
+
+        row = {
+            "task_id": task["id"],
+            "blocked_by": blocker["id"],
+            "team_id": team_id,
+            "created_by": user_id,
+            "created_at": _now(),
+        }
+        state.dependencies[key] = row
+        state.blockers[task["id"]].add(blocker["id"])
+        state.blocking[blocker["id"]].add(task["id"])
+        return dict(row)
+
+    async def remove(self, task_id, blocked_by, user_id):
+        state = self._state
+        task = state.tasks.get(_uuid(task_id))
+        key = (_uuid(task_id), _uuid(blocked_by))
+        if not state.visible(task, _uuid(user_id)) or key not in state.dependencies:
+            return False
+        del state.dependencies[key]
+        state.blockers[key[0]].discard(key[1])
+        state.blocking[key[1]].discard(key[0])
+        return True
+
+    async def graph(self, task_id, user_id, upstream_depth, downstream_depth, max_nodes):
+        state = self._state
+        task = state.tasks.get(_uuid(task_id))
+        if not state.visible(task, _uuid(user_id)):
+            return None
+
+        upstream = self._walk(task["id"], state.blockers, upstream_depth)
+        downstream = self._walk(task["id"], state.blocking, downstream_depth)
+        reached = [(task["id"], "root", 0)]
+        reached += [(node_id, "upstream", depth) for node_id, depth in upstream[:max_nodes]]
+        reached += [(node_id, "downstream", depth) for node_id, depth in downstream[:max_nodes]]
+        reached.sort(key=lambda item: (item[2], item[1], item[0]))
+
+        nodes = []
+        for node_id, direction, depth in reached:
+            node = state.tasks[node_id]
+            nodes.append({
+                "direction": direction,
+                "depth": depth,
+                **{column: node[column] for column in (
+                    "id", "title", "status", "priority", "due_date", "assigned_to", "completed_at",
+                )},
+                "open_blockers": sum(
+                    1 for blocker_id in state.blockers.get(node_id, ())
+                    if state.tasks[blocker_id]["status"] != "done" and state.tasks[blocker_id]["deleted_at"] is None
+                ),
+            })
+        ids = {node["id"] for node in nodes}
+        edges = [
+            {"task_id": node_id, "blocked_by": blocker_id}
+            for node_id in ids
+            for blocker_id in state.blockers.get(node_id, ())
+            if blocker_id in ids
+        ]
+        return nodes, edges, len(upstream) > max_nodes or len(downstream) > max_nodes
+
+
+class MemoryComments(CommentRepository):
+    def __init__(self, state: _State):
+        self._state = state
+
+    async def list_for_task(self, task_id, user_id, before, limit, include_archived=False):
+        task_id = _uuid(task_id)
+        if not self._state.visible(self._state.tasks.get(task_id), _uuid(user_id)):
+            return None
+        return self._state.comment_page(task_id, before, limit)
+
+    async def create(self, task_id, user_id, content):
+        state = self._state
+        user_id = _uuid(user_id)
+        task = state.tasks.get(_uuid(task_id))
+        if not state.visible(task, user_id):
+            return None
+
+        created_at = _now()
+        comment = {
+            "id": uuid.uuid4(),
+            "task_id": task["id"],
+            "user_id": user_id,
+            "content": content,
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+        state.comments[comment["id"]] = comment
+        bisect.insort(state.task_comments[task["id"]], (created_at, comment["id"]))
+        task["comment_count"] += 1
+        task["last_comment_at"] = max(filter(None, (task["last_comment_at"], created_at)))
+        return state.comment_row(comment)
+
+    async def delete(self, comment_id, user_id):
+        state = self._state
+        comment = state.comments.get(_uuid(comment_id))
+        if comment is None or comment["user_id"] != _uuid(user_id):
+            return False
+
+        del state.comments[comment["id"]]
+        keys = state.task_comments[comment["task_id"]]
+        keys.remove((comment["created_at"], comment["id"]))
+        task = state.tasks.get(comment["task_id"])
+        if task is not None:
+            task["comment_count"] = max(task["comment_count"] - 1, 0)
+            task["last_comment_at"] = max((key[0] for key in keys), default=None)
+        return True
+
+
+class MemoryTeams(TeamRepository):
+    def __init__(self, state: _State):
+        self._state = state
+
+    async def list_for_user(self, user_id):
+        state = self._state
+        user_id = _uuid(user_id)
+        rows = []
+        for team_id in state.user_teams.get(user_id, ()):
+            team = state.active_team(team_id)
+            if team is not None:
+                role = state.members[state.team_members[team_id][user_id]]["role"]
+                rows.append({"id": team["id"], "name": team["name"], "created_at": team["created_at"], "role": role})
+        return sorted(rows, key=lambda row: row["name"])
+
+    async def get(self, team_id):
+        team = self._state.teams.get(_uuid(team_id))
+        return dict(team) if team else None
+
+    async def is_member(self, team_id, user_id, admin=False):
+        return self._state.member(_uuid(team_id), _uuid(user_id), admin=admin) is not None
+
+    async def create(self, user_id, name):
+        user_id = _uuid(user_id)
+        team = {"id": uuid.uuid4(), "name": name, "owner_id": user_id, "created_at": _now(), "deleted_at": None}
+        self._state.teams[team["id"]] = team
+        self._state.add_member(team["id"], user_id, "admin")
+        return {"id": team["id"], "name": team["name"], "created_at": team["created_at"]}
+
+    async def rename(self, team_id, name):
+        team = self._state.active_team(_uuid(team_id))
+        if team is None:
+            return None
+        team["name"] = name
+        return dict(team)
+
+    async def delete(self, team_id, user_id):
+        team = self._state.active_team(_uuid(team_id))
+        if team is None:
+            return False
+        team["deleted_at"] = _now()
+        return True
+
+    async def analytics(self, team_id):
+        state = self._state
+        team_id = _uuid(team_id)
+        now = _now()
+        totals = defaultdict(int)
+        workload = {}
+        for task_id in state.team_tasks.get(team_id, ()):
+            task = state.tasks[task_id]
+            if task["deleted_at"] is not None:
+                continue
+            totals[(task["status"], task["priority"])] += 1
+            counts = workload.setdefault(task["assigned_to"], defaultdict(int))
+            counts[task["status"]] += 1
+            if task["status"] != "done" and task["due_date"] is not None and task["due_date"] < now:
+                counts["overdue"] += 1
+
+        workload_rows = []
+        for member_id, counts in workload.items():
+            member = state.members.get(member_id)
+            user = state.users.get(member["user_id"]) if member else None
+            workload_rows.append({
+                "member_id": member_id,
+                "user_id": member["user_id"] if member else None,
+                "name": user["name"] if user else None,
+                "todo": counts["todo"],
+                "in_progress": counts["in_progress"],
+                "done": counts["done"],
+                "overdue": counts["overdue"],
+            })
+        workload_rows.sort(key=lambda row: (row["name"] is None, row["name"] or ""))
+
+        total_rows = [
+            {"status": status, "priority": priority, "task_count": count}
+            for (status, priority), count in totals.items()
+        ]
+        return total_rows, workload_rows
+
+    async def flow(self, team_id, window_days, statuses):
+        state = self._state
+        events = state.team_events.get(_uuid(team_id), [])
+        now = _now()
+        window_start = now - timedelta(days=window_days)
+
+        cycle_hours, lead_hours = [], []
+        done_by_week = defaultdict(int)
+        for event in events:
+            if event["to_status"] != "done" or event["changed_at"] < window_start:
+                continue
+            done_at = event["changed_at"]
+            done_by_week[_week(done_at)] += 1
+            history = state.task_events[event["task_id"]]
+            started = [e["changed_at"] for e in history if e["to_status"] == "in_progress" and e["changed_at"] <= done_at]
+            created = [e["changed_at"] for e in history if e["from_status"] is None]
+            if started:
+                cycle_hours.append((done_at - min(started)).total_seconds() / 3600)
+            if created:
+                lead_hours.append((done_at - min(created)).total_seconds() / 3600)
+
+        durations = {
+            "cycle_count": len(cycle_hours),
+            "cycle_percentiles": _percentiles(cycle_hours),
+            "lead_count": len(lead_hours),
+            "lead_percentiles": _percentiles(lead_hours),
+        }
+
+        throughput = []
+        week = _week(window_start)
+        while week <= _week(now):
+            throughput.append({"week": week, "done": done_by_week.get(week, 0)})
+            week += timedelta(weeks=1)
+
+        last_day = now.date()
+        first_day = last_day - timedelta(days=window_days)
+
+        # Walk back from today's totals through the window's events only.
+        running = defaultdict(int)
+        for task_id in state.team_tasks.get(_uuid(team_id), ()):
+            task = state.tasks[task_id]
+            if task["deleted_at"] is None:
+                running[task["status"]] += 1
+        daily = defaultdict(int)
+        for event in reversed(events):
+            day = event["changed_at"].astimezone(timezone.utc).date()
+            if day < first_day:
+                break
+            if event["to_status"] is not None:
+                daily[(day, event["to_status"])] += 1
+                running[event["to_status"]] -= 1
+            if event["from_status"] is not None:
+                daily[(day, event["from_status"])] -= 1
+                running[event["from_status"]] += 1
+
+        flow = []
+        for offset in range(window_days + 1):
+            day = first_day + timedelta(days=offset)
+            for status in statuses:
+                running[status] += daily.get((day, status), 0)
+                flow.append({"day": day, "status": status, "task_count": running[status]})
+        return durations, throughput, flow
+
+
+class MemoryMembers(MemberRepository):
+    def __init__(self, state: _State):
+        self._state = state
+
+    async def list_for_team(self, team_id):
+        state = self._state
+        return [state.member_row(state.members[member_id]) for member_id in state.team_members[_uuid(team_id)].values()]
+
+    async def remove(self, team_id, member_id):
+        state = self._state
+        member = state.members.get(_uuid(member_id))
+        if member is None or member["team_id"] != _uuid(team_id):
+            return None
+
+        del state.members[member["id"]]
+        state.team_members[member["team_id"]].pop(member["user_id"], None)
+        state.user_teams[member["user_id"]].discard(member["team_id"])
+        for task_id in state.team_tasks.get(member["team_id"], ()):
+            task = state.tasks[task_id]
+            if task["assigned_to"] == member["id"]:
+                task["assigned_to"] = None
+        return dict(member)
+
+    async def blocked(self, team_id, user_ids, emails):
+        state = self._state
+        team_id = _uuid(team_id)
+        user_ids = {_uuid(user_id) for user_id in user_ids}
+        emails = set(emails)
+        rows = [
+            {"user_id": user_id, "email": None, "reason": "already_member"}
+            for user_id in user_ids
+            if user_id in state.team_members[team_id]
+        ]
+        for invite_id in state.team_invites.get(team_id, ()):
+            invite = state.invites[invite_id]
+            if invite["status"] == "pending" and (
+                invite["invited_user_id"] in user_ids or invite["invited_email"] in emails
+            ):
+                rows.append({
+                    "user_id": invite["invited_user_id"],
+                    "email": invite["invited_email"],
+                    "reason": "already_invited",
+                })
+        return rows
+
+
+class MemoryInvites(InviteRepository):
+    def __init__(self, state: _State):
+        self._state = state
+
+    def _pending(self, team_id, user_id, email) -> bool:
+        for invite_id in self._state.team_invites.get(team_id, ()):
+            invite = self._state.invites[invite_id]
+            if invite["status"] != "pending":
+                continue
+            if user_id is not None and invite["invited_user_id"] == user_id:
+                return True
+            if user_id is None and invite["invited_user_id"] is None and invite["invited_email"] == email:
+                return True
+        return False
+
+    def _insert(self, team_id, inviter_id, user_id, email, role) -> dict:
+        invite = {
+            "id": uuid.uuid4(),
+            "team_id": team_id,
+            "invited_user_id": user_id,
+            "invited_by": inviter_id,
+            "role": role,
+            "status": "pending",
+            "created_at": _now(),
+            "responded_at": None,
+            "invited_email": email,
+        }
+        self._state.invites[invite["id"]] = invite
+        self._state.team_invites[team_id].add(invite["id"])
+        if user_id is not None:
+            self._state.user_invites[user_id].add(invite["id"])
+        return invite
+
+    async def create(self, team_id, inviter_id, target_user_id, email, role, redirect_to):
+        state = self._state
+        team_id, inviter_id, target_user_id = _uuid(team_id), _uuid(inviter_id), _uuid(target_user_id)
+
+        if target_user_id is not None:
+            target_id = target_user_id if target_user_id in state.users else None
+        else:
+            target_id = next(iter(state.user_emails.get(email, ())), None)
+
+        checks = {
+            "is_admin": state.member(team_id, inviter_id, admin=True) is not None,
+            "target_id": target_id,
+            "already_member": target_id in state.team_members[team_id],
+            "pending_invite": self._pending(team_id, target_id, email),
+        }
+        invite = dict.fromkeys(_INVITE_COLUMNS)
+        if (
+            checks["is_admin"]
+            and not checks["already_member"]
+            and not checks["pending_invite"]
+            and (target_id is not None or (target_user_id is None and email is not None))
+            and target_id != inviter_id
+        ):
+            invite = dict(self._insert(team_id, inviter_id, target_id, None if target_id else email, role))
+        return {**checks, **invite}
+
+    async def create_many(self, team_id, inviter_id, role, user_ids, emails, redirect_to):
+        team_id, inviter_id = _uuid(team_id), _uuid(inviter_id)
+        if self._state.member(team_id, inviter_id, admin=True) is None:
+            return None
+        rows = []
+        for user_id, email in zip(user_ids, emails):
+            user_id = _uuid(user_id)
+            if self._pending(team_id, user_id, email):
+                continue
+            invite = self._insert(team_id, inviter_id, user_id, email, role)
+            rows.append({key: invite[key] for key in ("id", "invited_user_id", "invited_email")})
+        return rows
+
+    async def list_for_user(self, user_id):
+        state = self._state
+        rows = []
+        for invite_id in state.user_invites.get(_uuid(user_id), ()):
+            invite = state.invites[invite_id]
+            team = state.active_team(invite["team_id"])
+            if invite["status"] != "pending" or team is None:
+                continue
+            inviter = state.users[invite["invited_by"]]
+            rows.append({
+                **invite,
+                "team_name": team["name"],
+                "invited_by_name": inviter["name"],
+                "invited_by_email": inviter["email"],
+            })
+        return sorted(rows, key=lambda row: row["created_at"], reverse=True)
+
+    def _respond(self, invite_id, user_id, status: str) -> dict | None:
+        invite = self._state.invites.get(_uuid(invite_id))
+        if invite is None or invite["invited_user_id"] != _uuid(user_id) or invite["status"] != "pending":
+            return None
+        invite.update(status=status, responded_at=_now())
+        return invite
+
+    async def accept(self, invite_id, user_id):
+        invite = self._state.invites.get(_uuid(invite_id))
+        if invite is None or self._state.active_team(invite["team_id"]) is None:
+            return None
+        invite = self._respond(invite_id, user_id, "accepted")
+        if invite is None:
+            return None
+        if invite["invited_user_id"] not in self._state.team_members[invite["team_id"]]:
+            self._state.add_member(invite["team_id"], invite["invited_user_id"], invite["role"])
+        return dict(invite)
+
+    async def decline(self, invite_id, user_id):
+        invite = self._respond(invite_id, user_id, "declined")
+        return dict(invite) if invite else None
+
+
+class MemoryStorage(Storage):
+    uses_database = False
+
+    def __init__(self):
+        state = _State()
+        self.users = MemoryUsers(state)
+        self.tasks = MemoryTasks(state)
+        self.dependencies = MemoryDependencies(state)
+        self.comments = MemoryComments(state)
+        self.teams = MemoryTeams(state)
+        self.members = MemoryMembers(state)
+        self.invites = MemoryInvites(state)
@@ -0,0 +1,1450 @@
+"""Postgres storage: the asyncpg queries behind the routes.
+
+Every method resolves the shard it needs (see sharding.py) and borrows a
+pooled connection for its own statements; cross-team reads fan out to all
+shards and merge.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from uuid import UUID
+
+import asyncpg
+from fastapi import HTTPException
+
+from db import SHARD_COUNT, get_db
+from sharding import fan_out, locate, merge_rows, new_id, pick_shard, queue_replication, replicate_users, sharded, user_shard
+from ranking import key_between
+from recurrence import carry_over, series_end
+from storage.base import (
+    CommentRepository,
+    DependencyRepository,
+    InviteRepository,
+    MemberRepository,
+    Storage,
+    TaskRepository,
+    TeamRepository,
+    UserRepository,
+    dependency_team,
+    move_rank,
+)
+
+# A concurrent write can take the rank picked for a new or re-columned
+# task; it is then recomputed.
+RANK_RETRIES = 3
+
+# Hot read queries, shared with the startup warm-up so each pooled
+# connection has them parsed and prepared before it serves traffic.
+# Visibility (creator or team member) comes from task_visibility, which
+# triggers keep in sync with tasks and team_members; the active_* views
+# hide soft-deleted teams until the purger removes their rows.
+TASK_COUNT_QUERY = """
+    SELECT COUNT(*)
+    FROM active_task_visibility
+    WHERE user_id = $1
+"""
+
+TASK_LIST_QUERY = """
+    SELECT
+        t.*,
+        u.name AS created_by_name,
+        te.name AS team_name,
+        au.name AS assigned_to_name
+    FROM active_task_visibility v
+    JOIN tasks t ON t.id = v.task_id
+    LEFT JOIN users u ON u.id = t.created_by
+    LEFT JOIN teams te ON te.id = t.team_id
+    LEFT JOIN team_members atm ON atm.id = t.assigned_to
+    LEFT JOIN users au ON au.id = atm.user_id
+    WHERE v.user_id = $1
+    ORDER BY v.created_at DESC
+    LIMIT $2
+    OFFSET $3
+"""
+
+TASK_DETAIL_QUERY = """
+    SELECT
+        t.*,
+        u.name AS created_by_name,
+        te.name AS team_name,
+        au.name AS assigned_to_name
+    FROM active_task_visibility v
+    JOIN tasks t ON t.id = v.task_id
+    LEFT JOIN users u ON u.id = t.created_by
+    LEFT JOIN teams te ON te.id = t.team_id
+    LEFT JOIN team_members atm ON atm.id = t.assigned_to
+    LEFT JOIN users au ON au.id = atm.user_id
+    WHERE v.task_id = $1
+      AND v.user_id = $2
+"""
+
+# Archived (cold) tasks, read only when the caller passes include_archived.
+# Rows come back in the tasks row shape via jsonb_populate_record.
+ARCHIVED_TASK_COUNT_QUERY = """
+    SELECT COUNT(*)
+    FROM tasks_archive a
+    WHERE (
+            a.created_by = $1
+            OR a.team_id IN (
+                SELECT team_id FROM active_team_members WHERE user_id = $1
+            )
+       )
+      AND NOT EXISTS (
+            SELECT 1 FROM teams d WHERE d.id = a.team_id AND d.deleted_at IS NOT NULL
+      )
+"""
+
+# Top (limit + offset) rows of each side, merged and paged.
+TASK_LIST_WITH_ARCHIVED_QUERY = """
+    WITH active AS (
+        SELECT t.*, FALSE AS archived
+        FROM active_task_visibility v
+        JOIN tasks t ON t.id = v.task_id
+        WHERE v.user_id = $1
+        ORDER BY v.created_at DESC
+        LIMIT $2::int + $3::int
+    ),
+    archived AS (
+        SELECT r.*, TRUE AS archived
+        FROM tasks_archive a
+        CROSS JOIN LATERAL jsonb_populate_record(NULL::tasks, a.data) AS r
+        WHERE (
+                a.created_by = $1
+                OR a.team_id IN (
+                    SELECT team_id FROM active_team_members WHERE user_id = $1
+                )
+           )
+          AND NOT EXISTS (
+                SELECT 1 FROM teams d WHERE d.id = a.team_id AND d.deleted_at IS NOT NULL
+          )
+        ORDER BY a.created_at DESC
+        LIMIT $2::int + $3::int
+    ),
+    merged AS (
+        SELECT * FROM active
+        UNION ALL
+        SELECT * FROM archived
+    )
+    SELECT
+        t.*,
+        u.name AS created_by_name,
+        te.name AS team_name,
+        au.name AS assigned_to_name
+    FROM merged t
+    LEFT JOIN users u ON u.id = t.created_by
+    LEFT JOIN teams te ON te.id = t.team_id
+    LEFT JOIN team_members atm ON atm.id = t.assigned_to
+    LEFT JOIN users au ON au.id = atm.user_id
+    ORDER BY t.created_at DESC
+    LIMIT $2
+    OFFSET $3
+"""
+
+ARCHIVED_TASK_DETAIL_QUERY = """
+    SELECT
+        t.*,
+        TRUE AS archived,
+        u.name AS created_by_name,
+        te.name AS team_name,
+        au.name AS assigned_to_name
+    FROM tasks_archive a
+    CROSS JOIN LATERAL jsonb_populate_record(NULL::tasks, a.data) AS t
+    LEFT JOIN users u ON u.id = t.created_by
+    LEFT JOIN teams te ON te.id = t.team_id
+    LEFT JOIN team_members atm ON atm.id = t.assigned_to
+    LEFT JOIN users au ON au.id = atm.user_id
+    WHERE a.id = $1
+      AND (
+          a.created_by = $2
+          OR a.team_id IN (
+                SELECT team_id FROM active_team_members WHERE user_id = $2
+          )
+      )
+      AND NOT EXISTS (
+          SELECT 1 FROM teams d WHERE d.id = a.team_id AND d.deleted_at IS NOT NULL
+      )
+"""
+
+ARCHIVED_TASK_ACCESS_QUERY = """
+    SELECT EXISTS (
+        SELECT 1
+        FROM tasks_archive a
+        WHERE a.id = $1
+          AND (
+              a.created_by = $2
+              OR a.team_id IN (
+                    SELECT team_id FROM active_team_members WHERE user_id = $2
+              )
+          )
+          AND NOT EXISTS (
+              SELECT 1 FROM teams d WHERE d.id = a.team_id AND d.deleted_at IS NOT NULL
+          )
+    )
+"""
+
+ARCHIVED_TASK_COMMENTS_QUERY = """
+    SELECT
+        c.*,
+        u.name AS author_name,
+        u.email AS author_email
+    FROM tasks_archive a
+    CROSS JOIN LATERAL jsonb_populate_recordset(NULL::task_comments, a.comments) AS c
+    JOIN users u ON u.id = c.user_id
+    WHERE a.id = $1
+      AND (c.created_at, c.id) < ($2, $3)
+    ORDER BY c.created_at DESC, c.id DESC
+    LIMIT $4
+"""
+
+# Keyset page of a task's comments, newest first, on
+# idx_task_comments_task_id_created_at. The first page uses the
+# (infinity, max uuid) cursor so there is one plan for every page.
+TASK_COMMENTS_QUERY = """
+    SELECT
+        c.*,
+        u.name AS author_name,
+        u.email AS author_email
+    FROM task_comments c
+    JOIN users u ON u.id = c.user_id
+    WHERE c.task_id = $1
+      AND (c.created_at, c.id) < ($2, $3)
+    ORDER BY c.created_at DESC, c.id DESC
+    LIMIT $4
+"""
+
+# Roster of a task's team for the task drawer; empty unless the user is
+# still an active member of that team.
+TASK_TEAM_ROSTER_QUERY = """
+    SELECT tm.*, u.name, u.email
+    FROM team_members tm
+    JOIN users u ON tm.user_id = u.id
+    WHERE tm.team_id = $1
+      AND EXISTS (
+          SELECT 1
+          FROM active_team_members
+          WHERE team_id = $1
+            AND user_id = $2
+      )
+"""
+
+
+# One board column in rank order: a range scan of the
+# tasks_team_status_rank_key index. ``after`` is the last rank of the
+# previous page ("" for the first).
+TASK_COLUMN_QUERY = """
+    SELECT
+        t.*,
+        u.name AS created_by_name,
+        au.name AS assigned_to_name
+    FROM tasks t
+    LEFT JOIN users u ON u.id = t.created_by
+    LEFT JOIN team_members atm ON atm.id = t.assigned_to
+    LEFT JOIN users au ON au.id = atm.user_id
+    WHERE t.team_id = $1
+      AND t.status = $2
+      AND t.rank > $3
+      AND t.deleted_at IS NULL
+    ORDER BY t.rank
+    LIMIT $4
+"""
+
+# The current top of a column, share-locked so the rebalancer cannot respace
+# it before the caller's transaction writes a key above it.
+TOP_RANK_QUERY = """
+    SELECT rank
+    FROM tasks
+    WHERE team_id = $1
+      AND status = $2
+      AND rank IS NOT NULL
+      AND id IS DISTINCT FROM $3::uuid
+    ORDER BY rank
+    LIMIT 1
+    FOR SHARE
+"""
+
+# A user's calendar window [$2, $3) (expanded by recurrence.py): tasks and
+# series due in it, plus the series started before it that still run into
+# it, were not finished before it, or have an occurrence moved into it.
+TASK_CALENDAR_QUERY = """
+    SELECT
+        t.id,
+        t.title,
+        t.status,
+        t.priority,
+        t.team_id,
+        t.assigned_to,
+        t.due_date,
+        t.recurrence,
+        t.completed_at
+    FROM active_task_visibility v
+    JOIN tasks t ON t.id = v.task_id
+    WHERE v.user_id = $1
+      AND t.deleted_at IS NULL
+      AND t.due_date >= $2
+      AND t.due_date < $3
+    UNION ALL
+    SELECT
+        t.id,
+        t.title,
+        t.status,
+        t.priority,
+        t.team_id,
+        t.assigned_to,
+        t.due_date,
+        t.recurrence,
+        t.completed_at
+    FROM active_task_visibility v
+    JOIN tasks t ON t.id = v.task_id
+    WHERE v.user_id = $1
+      AND t.deleted_at IS NULL
+      AND t.recurrence IS NOT NULL
+      AND t.due_date < $2
+      AND (
+            (
+                (t.recurrence_ends_at IS NULL OR t.recurrence_ends_at >= $2)
+                AND NOT (t.status = 'done' AND t.completed_at < $2)
+            )
+            OR EXISTS (
+                SELECT 1
+                FROM task_occurrences o
+                WHERE o.task_id = t.id
+                  AND o.due_date >= $2
+                  AND o.due_date < $3
+            )
+      )
+"""
+
+TASK_OCCURRENCES_QUERY = """
+    SELECT *
+    FROM task_occurrences
+    WHERE task_id = ANY($1::uuid[])
+      AND (
+            (occurs_at >= $2 AND occurs_at < $3)
+            OR (due_date >= $2 AND due_date < $3)
+      )
+"""
+
+# Whether $1 is reachable by walking blockers up from $2, i.e. whether
+# "$1 blocked by $2" would close a cycle. UNION drops visited tasks and
+# EXISTS stops the walk at the first hit.
+DEPENDENCY_CYCLE_QUERY = """
+    WITH RECURSIVE upstream(id) AS (
+        SELECT $2::uuid
+        UNION
+        SELECT d.blocked_by
+        FROM upstream u
+        JOIN task_dependencies d ON d.task_id = u.id
+    )
+    SELECT EXISTS (SELECT 1 FROM upstream WHERE id = $1)
+"""
+
+# Breadth-first walks up ($2 hops) and down ($3 hops) from task $1 over live
+# tasks. Rows are unique per (task, depth), so the work is bounded by tasks
+# times depth however many paths lead to a task; each direction keeps its
+# $4 nearest tasks.
+DEPENDENCY_GRAPH_QUERY = """
+    WITH RECURSIVE upstream(id, depth) AS (
+        SELECT $1::uuid, 0
+        UNION
+        SELECT d.blocked_by, u.depth + 1
+        FROM upstream u
+        JOIN task_dependencies d ON d.task_id = u.id
+        JOIN tasks t ON t.id = d.blocked_by AND t.deleted_at IS NULL
+        WHERE u.depth < $2
+    ),
+    downstream(id, depth) AS (
+        SELECT $1::uuid, 0
+        UNION
+        SELECT d.task_id, w.depth + 1
+        FROM downstream w
+        JOIN task_dependencies d ON d.blocked_by = w.id
+        JOIN tasks t ON t.id = d.task_id AND t.deleted_at IS NULL
+        WHERE w.depth < $3
+    ),
+    reached AS (
+        SELECT $1::uuid AS id, 'root' AS direction, 0 AS depth
+        UNION ALL
+        (
+            SELECT id, 'upstream', MIN(depth)
+            FROM upstream
+            WHERE depth > 0
+            GROUP BY id
+            ORDER BY MIN(depth), id
+            LIMIT $4
+        )
+        UNION ALL
+        (
+            SELECT id, 'downstream', MIN(depth)
+            FROM downstream
+            WHERE depth > 0
+            GROUP BY id
+            ORDER BY MIN(depth), id
+            LIMIT $4
+        )
+    )
+    SELECT
+        r.direction,
+        r.depth,
+        t.id,
+        t.title,
+        t.status,
+        t.priority,
+        t.due_date,
+        t.assigned_to,
+        t.completed_at,
+        (
+            SELECT COUNT(*)
+            FROM task_dependencies d
+            JOIN tasks b ON b.id = d.blocked_by
+            WHERE d.task_id = t.id
+              AND b.status <> 'done'
+              AND b.deleted_at IS NULL
+        ) AS open_blockers
+    FROM reached r
+    JOIN tasks t ON t.id = r.id
+    ORDER BY r.depth, r.direction, t.id
+"""
+
+DEPENDENCY_EDGES_QUERY = """
+    SELECT task_id, blocked_by
+    FROM task_dependencies
+    WHERE task_id = ANY($1::uuid[])
+      AND blocked_by = ANY($1::uuid[])
+"""
+
+_NIL_UUID = "00000000-0000-0000-0000-000000000000"
+_HOT_STATEMENTS = (
+    (TASK_COUNT_QUERY, (_NIL_UUID,)),
+    (TASK_LIST_QUERY, (_NIL_UUID, 1, 0)),
+    (TASK_DETAIL_QUERY, (_NIL_UUID, _NIL_UUID)),
+)
+
+
+async def prepare_hot_statements(connection) -> None:
+    """Run the hot queries once against the nil UUID (matches no rows).
+
+    asyncpg keeps the server-side prepared statement in the connection's
+    statement cache, so later requests skip parse/plan.
+    """
+    for query, args in _HOT_STATEMENTS:
+        await connection.fetch(query, *args)
+
+
+TASK_ACCESS_QUERY = """
+    SELECT EXISTS (
+        SELECT 1
+        FROM active_task_visibility
+        WHERE task_id = $1
+          AND user_id = $2
+    )
+"""
+
+TEAM_MEMBER_QUERY = """
+    SELECT EXISTS(
+        SELECT 1 FROM active_team_members
+        WHERE team_id = $1 AND user_id = $2
+    )
+"""
+
+TEAM_ADMIN_QUERY = """
+    SELECT EXISTS(
+        SELECT 1 FROM active_team_members
+        WHERE team_id = $1 AND user_id = $2 AND role = 'admin'
+    )
+"""
+
+
+@asynccontextmanager
+async def _connection(read_only: bool = False, shard: int = 0):
+    db = await get_db(read_only=read_only, shard=shard)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def _comments_table_missing() -> HTTPException:
+    return HTTPException(status_code=500, detail="Comments table is missing. Restart backend to initialize schema.")
+
+
+def _invites_table_missing() -> HTTPException:
+    return HTTPException(status_code=500, detail="Invites table is missing. Restart backend to initialize schema.")
+
+
+class PostgresUsers(UserRepository):
+    async def get(self, user_id):
+        async with _connection() as db:
+            return await db.fetchrow("""
+                SELECT id, email, name, created_at
+                FROM users
+                WHERE id = $1
+            """, user_id)
+
+    async def find(self, user_ids, emails):
+        async with _connection() as db:
+            return await db.fetch("""
+                SELECT id, LOWER(email) AS email
+                FROM users
+                WHERE id = ANY($1::uuid[])
+                   OR LOWER(email) = ANY($2::text[])
+            """, user_ids, emails)
+
+    async def email_exists(self, email):
+        async with _connection() as db:
+            return await db.fetchval("""
+                SELECT EXISTS (
+                    SELECT 1
+                    FROM users
+                    WHERE LOWER(email) = $1
+                )
+            """, email)
+
+    async def upsert(self, user_id, email, name):
+        async with _connection() as db:
+            async with db.transaction():
+                row = await db.fetchrow("""
+                    INSERT INTO users (id, email, name)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (id) DO UPDATE SET
+                        email = EXCLUDED.email,
+                        name = EXCLUDED.name
+                    RETURNING *
+                """, user_id, email, name)
+                await queue_replication(db, [user_id])
+        await replicate_users([user_id])
+        return row
+
+    async def rename(self, user_id, name):
+        async with _connection() as db:
+            async with db.transaction():
+                row = await db.fetchrow("""
+                    UPDATE users
+                    SET name = $1
+                    WHERE id = $2
+                    RETURNING id, email, name, created_at
+                """, name, user_id)
+                if row:
+                    await queue_replication(db, [user_id])
+        if row:
+            await replicate_users([user_id])
+        return row
+
+
+async def _reschedule_occurrences(db, before, after):
+    """Re-key a series' task_occurrences rows after its rule or due date
+    changed; rows that do not carry over (see recurrence.carry_over) go."""
+    if (after["recurrence"], after["due_date"]) == (before["recurrence"], before["due_date"]):
+        return
+    slots = [row["occurs_at"] for row in await db.fetch("""
+        SELECT occurs_at FROM task_occurrences WHERE task_id = $1
+    """, after["id"])]
+    if not slots:
+        return
+    moved = carry_over(before["recurrence"], before["due_date"], after["recurrence"], after["due_date"], slots)
+    await db.execute("""
+        WITH old AS (
+            DELETE FROM task_occurrences
+            WHERE task_id = $1
+            RETURNING *
+        )
+        INSERT INTO task_occurrences (task_id, occurs_at, status, title, due_date, skipped, completed_at)
+        SELECT old.task_id, m.new_slot, old.status, old.title, old.due_date, old.skipped, old.completed_at
+        FROM old
+        JOIN unnest($2::timestamptz[], $3::timestamptz[]) AS m(old_slot, new_slot)
+          ON m.old_slot = old.occurs_at
+    """, after["id"], list(moved), list(moved.values()))
+
+
+class PostgresTasks(TaskRepository):
+    async def list_for_user(self, user_id, limit, offset, include_archived=False):
+        count_queries = [TASK_COUNT_QUERY] + ([ARCHIVED_TASK_COUNT_QUERY] if include_archived else [])
+        list_query = TASK_LIST_WITH_ARCHIVED_QUERY if include_archived else TASK_LIST_QUERY
+
+        if sharded():
+            # Each shard returns its newest (limit + offset) rows; merged here.
+            *counts, shard_rows = await asyncio.gather(
+                *(fan_out("fetchval", query, user_id, read_only=True) for query in count_queries),
+                fan_out("fetch", list_query, user_id, limit + offset, 0, read_only=True),
+            )
+            rows = merge_rows(shard_rows, "created_at", descending=True, limit=limit, offset=offset)
+            return rows, sum(map(sum, counts))
+
+        async with _connection(read_only=True) as db:
+            total = 0
+            for query in count_queries:
+                total += await db.fetchval(query, user_id)
+            rows = await db.fetch(list_query, user_id, limit, offset)
+        return rows, total
+
+    async def get(self, task_id, user_id, include_archived=False):
+        async with _connection(read_only=True, shard=await locate("task", task_id)) as db:
+            row = await db.fetchrow(TASK_DETAIL_QUERY, task_id, user_id)
+            if row is None and include_archived:
+                row = await db.fetchrow(ARCHIVED_TASK_DETAIL_QUERY, task_id, user_id)
+        return row
+
+    async def create(self, user_id, task):
+        shard = await locate("team", task["team_id"]) if task["team_id"] else user_shard(user_id)
+        async with _connection(shard=shard) as db:
+            for attempt in range(RANK_RETRIES):
+                try:
+                    async with db.transaction():
+                        # New team tasks go to the top of their column.
+                        rank = None
+                        if task["team_id"]:
+                            top = await db.fetchval(TOP_RANK_QUERY, task["team_id"], task["status"], None)
+                            rank = key_between(None, top)
+                        # Membership check and insert in one statement: no row
+                        # back means the user is not a member of the team.
+                        return await db.fetchrow("""
+                            INSERT INTO tasks (
+                                id,
+                                title,
+                                description,
+                                status,
+                                priority,
+                                team_id,
+                                due_date,
+                                created_by,
+                                assigned_to,
+                                rank,
+                                recurrence,
+                                recurrence_ends_at
+                            )
+                            SELECT $9::uuid, $1, $2, $3, $4, $5::uuid, $6::timestamptz, $7::uuid, $8::uuid, $10, $11, $12
+                            WHERE $5::uuid IS NULL
+                               OR EXISTS (
+                                   SELECT 1
+                                   FROM active_team_members
+                                   WHERE team_id = $5::uuid
+                                     AND user_id = $7::uuid
+                               )
+                            RETURNING *
+                        """,
+                            task["title"],
+                            task["description"],
+                            task["status"],
+                            task["priority"],
+                            task["team_id"],
+                            task["due_date"],
+                            user_id,
+                            task["assigned_to"],
+                            new_id(shard),
+                            rank,
+                            task["recurrence"],
+                            series_end(task["recurrence"], task["due_date"]),
+                        )
+                except asyncpg.UniqueViolationError:
+                    # A concurrent insert took the same top rank.
+                    if attempt == RANK_RETRIES - 1:
+                        raise HTTPException(status_code=409, detail="The column is busy; retry")
+
+    async def assignee_in_team(self, task_id, member_id):
+        async with _connection(shard=await locate("task", task_id)) as db:
+            return await db.fetchval("""
+                SELECT EXISTS (
+                    SELECT 1
+                    FROM tasks t
+                    JOIN team_members tm ON tm.team_id = t.team_id
+                    WHERE t.id = $1
+                      AND tm.id = $2
+                )
+            """, task_id, member_id)
+
+    async def update(self, task_id, user_id, changes):
+        async with _connection(shard=await locate("task", task_id)) as db:
+            for attempt in range(RANK_RETRIES):
+                try:
+                    async with db.transaction():
+                        values = dict(changes)
+                        current = None
+                        if changes.keys() & {"status", "due_date", "recurrence"}:
+                            current = await db.fetchrow("""
+                                SELECT team_id, status, due_date, recurrence
+                                FROM tasks
+                                WHERE id = $1
+                                FOR NO KEY UPDATE
+                            """, task_id)
+                        if current and "status" in changes:
+                            # A task changing column goes to the top of the new one.
+                            if current["team_id"] and current["status"] != changes["status"]:
+                                top = await db.fetchval(TOP_RANK_QUERY, current["team_id"], changes["status"], None)
+                                values["rank"] = key_between(None, top)
+                        if current and changes.keys() & {"due_date", "recurrence"}:
+                            values["recurrence_ends_at"] = series_end(
+                                changes.get("recurrence", current["recurrence"]),
+                                changes.get("due_date", current["due_date"]),
+                            )
+
+                        set_clauses = []
+                        args = []
+                        for column, value in values.items():
+                            args.append(value)
+                            set_clauses.append(f"{column} = ${len(args)}")
+
+                        args.extend([task_id, user_id])
+                        task_id_idx = len(args) - 1
+                        user_id_idx = len(args)
+
+                        query = f"""
+                            UPDATE tasks
+                            SET {", ".join(set_clauses)}
+                            WHERE id = ${task_id_idx}
+                              AND EXISTS (
+                                  SELECT 1 FROM active_task_visibility
+                                  WHERE user_id = ${user_id_idx} AND task_id = ${task_id_idx}
+                              )
+                            RETURNING *
+                        """
+
+                        row = await db.fetchrow(query, *args)
+                        if row and current and current["recurrence"] is not None:
+                            await _reschedule_occurrences(db, current, row)
+                        return row
+                except asyncpg.ForeignKeyViolationError:
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Invalid assignee. Use a team member ID from /teams/{team_id}/members."
+                    )
+                except asyncpg.UniqueViolationError:
+                    if attempt == RANK_RETRIES - 1:
+                        raise HTTPException(status_code=409, detail="The column is busy; retry")
+
+    async def delete(self, task_id, user_id):
+        async with _connection(shard=await locate("task", task_id)) as db:
+            # Hide the task now (freeing its rank); the purger removes its
+            # comments in batches.
+            row = await db.fetchrow("""
+                WITH marked AS (
+                    UPDATE tasks
+                    SET deleted_at = NOW(), rank = NULL
+                    WHERE id = $1
+                      AND EXISTS (
+                          SELECT 1 FROM active_task_visibility
+                          WHERE user_id = $2 AND task_id = $1
+                      )
+                    RETURNING id
+                ),
+                job AS (
+                    INSERT INTO deletion_jobs (kind, target_id, requested_by)
+                    SELECT 'task', id, $2 FROM marked
+                )
+                SELECT id FROM marked
+            """, task_id, user_id)
+        return row is not None
+
+    async def get_full(self, task_id, user_id, comments_before, comments_limit):
+        # One connection for all three reads: the task's comments and its
+        # team live on the task's shard.
+        async with _connection(read_only=True, shard=await locate("task", task_id)) as db:
+            task = await db.fetchrow(TASK_DETAIL_QUERY, task_id, user_id)
+            if task is None:
+                return None
+            comments = await db.fetch(TASK_COMMENTS_QUERY, task_id, *comments_before, comments_limit)
+            members = []
+            if task["team_id"] is not None:
+                members = await db.fetch(TASK_TEAM_ROSTER_QUERY, task["team_id"], user_id)
+        return task, comments, members
+
+    async def column(self, team_id, status, after, limit):
+        async with _connection(read_only=True, shard=await locate("team", team_id)) as db:
+            return await db.fetch(TASK_COLUMN_QUERY, team_id, status, after, limit)
+
+    async def calendar(self, user_id, start, end):
+        async def read(shard: int):
+            async with _connection(read_only=True, shard=shard) as db:
+                tasks = await db.fetch(TASK_CALENDAR_QUERY, user_id, start, end)
+                series = [task["id"] for task in tasks if task["recurrence"] is not None]
+                exceptions = await db.fetch(TASK_OCCURRENCES_QUERY, series, start, end) if series else []
+                return tasks, exceptions
+
+        results = await asyncio.gather(*(read(shard) for shard in range(SHARD_COUNT)))
+        return (
+            [task for tasks, _ in results for task in tasks],
+            [exception for _, exceptions in results for exception in exceptions],
+        )
+
+    async def save_occurrence(self, task_id, occurs_at, changes):
+        values = dict(changes)
+        assignments = [f"{column} = EXCLUDED.{column}" for column in changes]
+        if "status" in changes:
+            values["completed_at"] = datetime.now(timezone.utc) if changes["status"] == "done" else None
+            assignments.append("""
+                completed_at = CASE
+                    WHEN EXCLUDED.status = 'done'
+                    THEN COALESCE(task_occurrences.completed_at, EXCLUDED.completed_at)
+                END
+            """)
+        assignments.append("updated_at = NOW()")
+        columns = ["task_id", "occurs_at", *values]
+        placeholders = [f"${index}" for index in range(1, len(columns) + 1)]
+
+        async with _connection(shard=await locate("task", task_id)) as db:
+            return await db.fetchrow(f"""
+                INSERT INTO task_occurrences ({", ".join(columns)})
+                VALUES ({", ".join(placeholders)})
+                ON CONFLICT (task_id, occurs_at) DO UPDATE SET {", ".join(assignments)}
+                RETURNING *
+            """, task_id, occurs_at, *values.values())
+
+    async def move(self, task_id, user_id, status, before_id, after_id):
+        neighbour_ids = [neighbour for neighbour in (before_id, after_id) if neighbour is not None]
+        async with _connection(shard=await locate("task", task_id)) as db:
+            # The neighbours (or the column top) stay share-locked until the
+            # new rank is written, so the rebalancer cannot respace them in
+            # between. Racing moves end in a unique violation or a deadlock.
+            try:
+                async with db.transaction():
+                    task = await db.fetchrow("""
+                        SELECT t.id, t.team_id, t.status, t.rank
+                        FROM active_task_visibility v
+                        JOIN tasks t ON t.id = v.task_id
+                        WHERE v.task_id = $1
+                          AND v.user_id = $2
+                        FOR NO KEY UPDATE OF t
+                    """, task_id, user_id)
+                    if task is None:
+                        return None
+
+                    status = status or task["status"]
+                    neighbours = {}
+                    if neighbour_ids:
+                        rows = await db.fetch("""
+                            SELECT id, team_id, status, rank
+                            FROM tasks
+                            WHERE id = ANY($1::uuid[])
+                              AND deleted_at IS NULL
+                            ORDER BY id
+                            FOR SHARE
+                        """, neighbour_ids)
+                        neighbours = {row["id"]: row for row in rows}
+
+                    top = None
+                    if before_id is None and after_id is None and task["team_id"] is not None:
+                        top = await db.fetchval(TOP_RANK_QUERY, task["team_id"], status, task["id"])
+                    rank = move_rank(task, status, neighbours, before_id, after_id, top)
+
+                    return await db.fetchrow("""
+                        UPDATE tasks
+                        SET rank = $2, status = $3
+                        WHERE id = $1
+                          AND deleted_at IS NULL
+                        RETURNING *
+                    """, task_id, rank, status)
+            except (asyncpg.UniqueViolationError, asyncpg.DeadlockDetectedError):
+                raise HTTPException(status_code=409, detail="The column has changed; reload it and retry")
+
+
+class PostgresDependencies(DependencyRepository):
+    async def add(self, task_id, blocked_by, user_id):
+        async with _connection(shard=await locate("task", task_id)) as db:
+            async with db.transaction():
+                rows = await db.fetch("""
+                    SELECT t.id, t.team_id
+                    FROM active_task_visibility v
+                    JOIN tasks t ON t.id = v.task_id
+                    WHERE v.task_id = ANY($1::uuid[])
+                      AND v.user_id = $2
+                """, [task_id, blocked_by], user_id)
+                tasks = {row["id"]: row for row in rows}
+                task, blocker = tasks.get(UUID(str(task_id))), tasks.get(UUID(str(blocked_by)))
+                if task is None or blocker is None:
+                    return None
+                team_id = dependency_team(task, blocker)
+
+                # One dependency write per team at a time, so two edges that
+                # only close a cycle together cannot both pass the check.
+                await db.execute("SELECT 1 FROM teams WHERE id = $1 FOR NO KEY UPDATE", team_id)
+                if await db.fetchval(DEPENDENCY_CYCLE_QUERY, task["id"], blocker["id"]):
+                    raise HTTPException(status_code=409, detail="This dependency would create a cycle")
+
+                row = await db.fetchrow("""
+                    INSERT INTO task_dependencies (task_id, blocked_by, team_id, created_by)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (task_id, blocked_by) DO NOTHING
+                    RETURNING *
+                """, task["id"], blocker["id"], team_id, user_id)
+                if row is None:
+                    raise HTTPException(status_code=409, detail="This dependency already exists")
+                return row
+
+    async def remove(self, task_id, blocked_by, user_id):
+        async with _connection(shard=await locate("task", task_id)) as db:
+            deleted = await db.fetchval("""
+                DELETE FROM task_dependencies d
+                USING active_task_visibility v
+                WHERE d.task_id = $1
+                  AND d.blocked_by = $2
+                  AND v.task_id = d.task_id
+                  AND v.user_id = $3
+                RETURNING d.task_id
+            """, task_id, blocked_by, user_id)
+            return deleted is not None
+
+    async def graph(self, task_id, user_id, upstream_depth, downstream_depth, max_nodes):
+        async with _connection(read_only=True, shard=await locate("task", task_id)) as db:
+            if not await db.fetchval(TASK_ACCESS_QUERY, task_id, user_id):
+                return None
+            nodes = await db.fetch(DEPENDENCY_GRAPH_QUERY, task_id, upstream_depth, downstream_depth, max_nodes + 1)
+            counts = {"upstream": 0, "downstream": 0}
+            kept = []
+            for node in nodes:
+                if node["direction"] in counts:
+                    counts[node["direction"]] += 1
+                    if counts[node["direction"]] > max_nodes:
+                        continue
+                kept.append(node)
+            edges = await db.fetch(DEPENDENCY_EDGES_QUERY, [node["id"] for node in kept])
+            return kept, edges, max(counts.values()) > max_nodes
+
+
+class PostgresComments(CommentRepository):
+    async def list_for_task(self, task_id, user_id, before, limit, include_archived=False):
+        async with _connection(read_only=True, shard=await locate("task", task_id)) as db:
+            has_access = await db.fetchval(TASK_ACCESS_QUERY, task_id, user_id)
+
+            if not has_access and include_archived:
+                if await db.fetchval(ARCHIVED_TASK_ACCESS_QUERY, task_id, user_id):
+                    return await db.fetch(ARCHIVED_TASK_COMMENTS_QUERY, task_id, *before, limit)
+
+            if not has_access:
+                return None
+
+            try:
+                return await db.fetch(TASK_COMMENTS_QUERY, task_id, *before, limit)
+            except asyncpg.UndefinedTableError:
+                raise _comments_table_missing()
+
+    async def create(self, task_id, user_id, content):
+        shard = await locate("task", task_id)
+        async with _connection(shard=shard) as db:
+            # Access check, insert, counter update and author lookup in one
+            # statement: no row back means the task is not visible to the user.
+            try:
+                return await db.fetchrow("""
+                    WITH inserted AS (
+                        INSERT INTO task_comments (id, task_id, user_id, content)
+                        SELECT $4::uuid, $1::uuid, $2::uuid, $3
+                        WHERE EXISTS (
+                            SELECT 1
+                            FROM active_task_visibility
+                            WHERE task_id = $1::uuid
+                              AND user_id = $2::uuid
+                        )
+                        RETURNING *
+                    ),
+                    counted AS (
+                        UPDATE tasks t
+                        SET comment_count = t.comment_count + 1,
+                            last_comment_at = GREATEST(t.last_comment_at, i.created_at)
+                        FROM inserted i
+                        WHERE t.id = i.task_id
+                    )
+                    SELECT
+                        i.*,
+                        u.name AS author_name,
+                        u.email AS author_email
+                    FROM inserted i
+                    JOIN users u ON u.id = i.user_id
+                """, task_id, user_id, content, new_id(shard))
+            except asyncpg.UndefinedTableError:
+                raise _comments_table_missing()
+
+    async def delete(self, comment_id, user_id):
+        async with _connection(shard=await locate("comment", comment_id)) as db:
+            try:
+                # The subquery still sees the deleted comment (same snapshot),
+                # so it is excluded by id when recomputing last_comment_at.
+                row = await db.fetchrow("""
+                    WITH deleted AS (
+                        DELETE FROM task_comments c
+                        WHERE c.id = $1
+                          AND c.user_id = $2
+                        RETURNING c.*
+                    ),
+                    counted AS (
+                        UPDATE tasks t
+                        SET comment_count = GREATEST(t.comment_count - 1, 0),
+                            last_comment_at = (
+                                SELECT MAX(c.created_at)
+                                FROM task_comments c
+                                WHERE c.task_id = d.task_id
+                                  AND c.id <> d.id
+                            )
+                        FROM deleted d
+                        WHERE t.id = d.task_id
+                    )
+                    SELECT * FROM deleted
+                """, comment_id, user_id)
+            except asyncpg.UndefinedTableError:
+                raise _comments_table_missing()
+        return row is not None
+
+
+class PostgresTeams(TeamRepository):
+    async def list_for_user(self, user_id):
+        shard_rows = await fan_out("fetch", """
+            SELECT t.id, t.name, t.created_at, tm.role
+            FROM teams t
+            JOIN team_members tm ON t.id = tm.team_id
+            WHERE tm.user_id = $1
+              AND t.deleted_at IS NULL
+            ORDER BY t.name
+        """, user_id)
+        return merge_rows(shard_rows, "name")
+
+    async def get(self, team_id):
+        async with _connection(shard=await locate("team", team_id)) as db:
+            return await db.fetchrow("""
+                SELECT * FROM teams WHERE id = $1
+            """, team_id)
+
+    async def is_member(self, team_id, user_id, admin=False):
+        async with _connection(shard=await locate("team", team_id)) as db:
+            return await db.fetchval(TEAM_ADMIN_QUERY if admin else TEAM_MEMBER_QUERY, team_id, user_id)
+
+    async def create(self, user_id, name):
+        shard = pick_shard()
+        async with _connection(shard=shard) as db:
+            try:
+                return await db.fetchrow("""
+                    WITH created AS (
+                        INSERT INTO teams (id, name, owner_id)
+                        VALUES ($3, $1, $2)
+                        RETURNING *
+                    ),
+                    admin AS (
+                        INSERT INTO team_members (user_id, team_id, role)
+                        SELECT owner_id, id, 'admin'
+                        FROM created
+                    )
+                    SELECT id, name, created_at FROM created
+                """, name, user_id, new_id(shard))
+            except asyncpg.PostgresError as e:
+                print(f"Create team error: {e}")
+                raise HTTPException(status_code=500, detail="Failed to create team")
+
+    async def rename(self, team_id, name):
+        async with _connection(shard=await locate("team", team_id)) as db:
+            return await db.fetchrow("""
+                UPDATE teams
+                SET name = $1
+                WHERE id = $2
+                  AND deleted_at IS NULL
+                RETURNING *
+            """, name, team_id)
+
+    async def delete(self, team_id, user_id):
+        async with _connection(shard=await locate("team", team_id)) as db:
+            # Hide the team now; the purger removes its tasks, comments,
+            # members and invites in batches.
+            row = await db.fetchrow("""
+                WITH marked AS (
+                    UPDATE teams
+                    SET deleted_at = NOW()
+                    WHERE id = $1
+                      AND deleted_at IS NULL
+                    RETURNING id
+                ),
+                job AS (
+                    INSERT INTO deletion_jobs (kind, target_id, requested_by)
+                    SELECT 'team', id, $2 FROM marked
+                )
+                SELECT id FROM marked
+            """, team_id, user_id)
+        return row is not None
+
+    async def analytics(self, team_id):
+        async with _connection(read_only=True, shard=await locate("team", team_id)) as db:
+            totals = await db.fetch("""
+                SELECT status, priority, SUM(task_count) AS task_count
+                FROM team_task_counters
+                WHERE team_id = $1
+                GROUP BY status, priority
+                HAVING SUM(task_count) <> 0
+            """, team_id)
+
+            # Overdue depends on the clock, so it is counted live from the
+            # partial idx_tasks_open_due index.
+            workload = await db.fetch("""
+                WITH counts AS (
+                    SELECT assigned_to, status, SUM(task_count) AS task_count
+                    FROM team_task_counters
+                    WHERE team_id = $1
+                    GROUP BY assigned_to, status
+                    HAVING SUM(task_count) <> 0
+                ),
+                overdue AS (
+                    SELECT COALESCE(assigned_to, $2::uuid) AS assigned_to, COUNT(*) AS overdue
+                    FROM tasks
+                    WHERE team_id = $1
+                      AND status <> 'done'
+                      AND deleted_at IS NULL
+                      AND due_date IS NOT NULL
+                      AND due_date < NOW()
+                    GROUP BY 1
+                ),
+                assignees AS (
+                    SELECT assigned_to FROM counts
+                    UNION
+                    SELECT assigned_to FROM overdue
+                )
+                SELECT
+                    NULLIF(a.assigned_to, $2::uuid) AS member_id,
+                    tm.user_id,
+                    u.name,
+                    COALESCE(SUM(c.task_count) FILTER (WHERE c.status = 'todo'), 0) AS todo,
+                    COALESCE(SUM(c.task_count) FILTER (WHERE c.status = 'in_progress'), 0) AS in_progress,
+                    COALESCE(SUM(c.task_count) FILTER (WHERE c.status = 'done'), 0) AS done,
+                    COALESCE(MAX(o.overdue), 0) AS overdue
+                FROM assignees a
+                LEFT JOIN counts c ON c.assigned_to = a.assigned_to
+                LEFT JOIN overdue o ON o.assigned_to = a.assigned_to
+                LEFT JOIN team_members tm ON tm.id = a.assigned_to
+                LEFT JOIN users u ON u.id = tm.user_id
+                GROUP BY a.assigned_to, tm.user_id, u.name
+                ORDER BY u.name NULLS LAST
+            """, team_id, _NIL_UUID)
+        return totals, workload
+
+    async def flow(self, team_id, window_days, statuses):
+        async with _connection(shard=await locate("team", team_id)) as db:
+            # Each completion in the window, timed from the task's first
+            # in_progress (cycle) and from its creation (lead).
+            durations = await db.fetchrow("""
+                WITH done AS (
+                    SELECT task_id, changed_at AS done_at
+                    FROM task_status_events
+                    WHERE team_id = $1
+                      AND changed_at >= NOW() - make_interval(days => $2)
+                      AND to_status = 'done'
+                ),
+                timed AS (
+                    SELECT
+                        EXTRACT(EPOCH FROM d.done_at - (
+                            SELECT MIN(s.changed_at)
+                            FROM task_status_events s
+                            WHERE s.task_id = d.task_id
+                              AND s.to_status = 'in_progress'
+                              AND s.changed_at <= d.done_at
+                        ))::float8 / 3600 AS cycle_hours,
+                        EXTRACT(EPOCH FROM d.done_at - (
+                            SELECT MIN(s.changed_at)
+                            FROM task_status_events s
+                            WHERE s.task_id = d.task_id
+                              AND s.from_status IS NULL
+                        ))::float8 / 3600 AS lead_hours
+                    FROM done d
+                )
+                SELECT
+                    COUNT(cycle_hours) AS cycle_count,
+                    percentile_cont(ARRAY[0.5, 0.85, 0.95]) WITHIN GROUP (ORDER BY cycle_hours) AS cycle_percentiles,
+                    COUNT(lead_hours) AS lead_count,
+                    percentile_cont(ARRAY[0.5, 0.85, 0.95]) WITHIN GROUP (ORDER BY lead_hours) AS lead_percentiles
+                FROM timed
+            """, team_id, window_days)
+
+            throughput = await db.fetch("""
+                WITH weeks AS (
+                    SELECT generate_series(
+                        date_trunc('week', NOW() - make_interval(days => $2)),
+                        date_trunc('week', NOW()),
+                        interval '1 week'
+                    ) AS week
+                ),
+                done AS (
+                    SELECT date_trunc('week', changed_at) AS week, COUNT(*) AS done
+                    FROM task_status_events
+                    WHERE team_id = $1
+                      AND changed_at >= NOW() - make_interval(days => $2)
+                      AND to_status = 'done'
+                    GROUP BY 1
+                )
+                SELECT w.week, COALESCE(d.done, 0) AS done
+                FROM weeks w
+                LEFT JOIN done d ON d.week = w.week
+                ORDER BY w.week
+            """, team_id, window_days)
+
+            # Daily +1/-1 per status inside the window only. The counters hold
+            # today's totals (same rules as the events: archived tasks count,
+            # deleted ones do not), so the window's first day starts from
+            # those totals minus everything that moved since.
+            flow = await db.fetch("""
+                WITH bounds AS (
+                    SELECT (NOW() AT TIME ZONE 'UTC')::date AS last_day,
+                           (NOW() AT TIME ZONE 'UTC')::date - $2::int AS first_day
+                ),
+                deltas AS (
+                    SELECT (e.changed_at AT TIME ZONE 'UTC')::date AS day, e.to_status AS status, 1 AS delta
+                    FROM task_status_events e, bounds b
+                    WHERE e.team_id = $1
+                      AND e.changed_at >= b.first_day::timestamp AT TIME ZONE 'UTC'
+                      AND e.to_status IS NOT NULL
+                    UNION ALL
+                    SELECT (e.changed_at AT TIME ZONE 'UTC')::date, e.from_status, -1
+                    FROM task_status_events e, bounds b
+                    WHERE e.team_id = $1
+                      AND e.changed_at >= b.first_day::timestamp AT TIME ZONE 'UTC'
+                      AND e.from_status IS NOT NULL
+                ),
+                daily AS (
+                    SELECT day, status, SUM(delta) AS delta
+                    FROM deltas
+                    GROUP BY day, status
+                ),
+                current AS (
+                    SELECT status, SUM(task_count) AS total
+                    FROM team_task_counters
+                    WHERE team_id = $1
+                    GROUP BY status
+                ),
+                baseline AS (
+                    SELECT s.status,
+                           COALESCE(c.total, 0) - COALESCE((
+                               SELECT SUM(d.delta) FROM daily d WHERE d.status = s.status
+                           ), 0) AS total
+                    FROM unnest($3::text[]) AS s(status)
+                    LEFT JOIN current c ON c.status = s.status
+                ),
+                grid AS (
+                    SELECT day::date AS day, status
+                    FROM bounds b,
+                         generate_series(b.first_day, b.last_day, interval '1 day') AS day,
+                         unnest($3::text[]) AS status
+                )
+                SELECT
+                    g.day,
+                    g.status,
+                    (bl.total
+                        + SUM(COALESCE(d.delta, 0)) OVER (PARTITION BY g.status ORDER BY g.day))::bigint AS task_count
+                FROM grid g
+                LEFT JOIN daily d ON d.day = g.day AND d.status = g.status
+                JOIN baseline bl ON bl.status = g.status
+                ORDER BY g.day
+            """, team_id, window_days, statuses)
+        return durations, throughput, flow
+
+
+class PostgresMembers(MemberRepository):
+    async def list_for_team(self, team_id):
+        async with _connection(shard=await locate("team", team_id)) as db:
+            return await db.fetch("""
+                SELECT tm.*, u.name, u.email
+                FROM team_members tm
+                JOIN users u ON tm.user_id = u.id
+                WHERE tm.team_id = $1
+            """, team_id)
+
+    async def remove(self, team_id, member_id):
+        async with _connection(shard=await locate("team", team_id)) as db:
+            return await db.fetchrow("""
+                DELETE FROM team_members
+                WHERE id = $1 AND team_id = $2
+                RETURNING *
+            """, member_id, team_id)
+
+    async def blocked(self, team_id, user_ids, emails):
+        async with _connection(shard=await locate("team", team_id)) as db:
+            try:
+                return await db.fetch("""
+                    SELECT tm.user_id, NULL::text AS email, 'already_member' AS reason
+                    FROM team_members tm
+                    WHERE tm.team_id = $1
+                      AND tm.user_id = ANY($2::uuid[])
+                    UNION ALL
+                    SELECT ti.invited_user_id, ti.invited_email, 'already_invited'
+                    FROM team_invites ti
+                    WHERE ti.team_id = $1
+                      AND ti.status = 'pending'
+                      AND (ti.invited_user_id = ANY($2::uuid[]) OR ti.invited_email = ANY($3::text[]))
+                """, team_id, user_ids, emails)
+            except asyncpg.UndefinedTableError:
+                raise _invites_table_missing()
+
+
+class PostgresInvites(InviteRepository):
+    async def create(self, team_id, inviter_id, target_user_id, email, role, redirect_to):
+        shard = await locate("team", team_id)
+        async with _connection(shard=shard) as db:
+            # Permission, target lookup, duplicate checks and the invite (plus
+            # its outbox row when the email has no account yet) in one
+            # statement. The invite email itself is sent by the outbox worker.
+            try:
+                return await db.fetchrow("""
+                    WITH state AS (
+                        SELECT
+                            EXISTS (
+                                SELECT 1 FROM active_team_members
+                                WHERE team_id = $1 AND user_id = $2 AND role = 'admin'
+                            ) AS is_admin,
+                            (
+                                SELECT id FROM (
+                                    SELECT id FROM users WHERE id = $3::uuid
+                                    UNION ALL
+                                    SELECT id FROM users WHERE $3::uuid IS NULL AND LOWER(email) = $4::text
+                                ) AS target
+                                LIMIT 1
+                            ) AS target_id
+                    ),
+                    checks AS (
+                        SELECT
+                            s.*,
+                            EXISTS (
+                                SELECT 1
+                                FROM team_members tm
+                                WHERE tm.team_id = $1
+                                  AND tm.user_id = s.target_id
+                            ) AS already_member,
+                            EXISTS (
+                                SELECT 1
+                                FROM team_invites ti
+                                WHERE ti.team_id = $1
+                                  AND ti.status = 'pending'
+                                  AND (
+                                      ti.invited_user_id = s.target_id
+                                      OR (s.target_id IS NULL AND ti.invited_email = $4::text)
+                                  )
+                            ) AS pending_invite
+                        FROM state s
+                    ),
+                    invite AS (
+                        INSERT INTO team_invites (id, team_id, invited_user_id, invited_email, invited_by, role)
+                        SELECT $7::uuid, $1, c.target_id, CASE WHEN c.target_id IS NULL THEN $4::text END, $2, $5
+                        FROM checks c
+                        WHERE c.is_admin
+                          AND NOT c.already_member
+                          AND NOT c.pending_invite
+                          AND (c.target_id IS NOT NULL OR ($3::uuid IS NULL AND $4::text IS NOT NULL))
+                          AND c.target_id IS DISTINCT FROM $2::uuid
+                        RETURNING *
+                    ),
+                    queued AS (
+                        INSERT INTO invite_outbox (invite_id, email, redirect_to)
+                        SELECT i.id, i.invited_email, $6
+                        FROM invite i
+                        WHERE i.invited_user_id IS NULL
+                    )
+                    SELECT c.is_admin, c.target_id, c.already_member, c.pending_invite, i.*
+                    FROM checks c
+                    LEFT JOIN invite i ON TRUE
+                """, team_id, inviter_id, target_user_id, email, role, redirect_to, new_id(shard))
+            except asyncpg.UniqueViolationError:
+                raise HTTPException(status_code=409, detail="An invite is already pending for this user")
+            except asyncpg.UndefinedTableError:
+                raise _invites_table_missing()
+
+    async def create_many(self, team_id, inviter_id, role, user_ids, emails, redirect_to):
+        shard = await locate("team", team_id)
+        async with _connection(shard=shard) as db:
+            # Permission check and inserts in one statement; the first row
+            # always carries is_admin, invites (if any) follow in the rest.
+            try:
+                rows = await db.fetch("""
+                    WITH allowed AS (
+                        SELECT EXISTS (
+                            SELECT 1 FROM active_team_members
+                            WHERE team_id = $1 AND user_id = $2 AND role = 'admin'
+                        ) AS is_admin
+                    ),
+                    invite AS (
+                        INSERT INTO team_invites (id, team_id, invited_user_id, invited_email, invited_by, role)
+                        SELECT target.id, $1, target.user_id, target.email, $2, $3
+                        FROM unnest($4::uuid[], $5::text[], $7::uuid[]) AS target(user_id, email, id)
+                        WHERE (SELECT is_admin FROM allowed)
+                        ON CONFLICT DO NOTHING
+                        RETURNING *
+                    ),
+                    queued AS (
+                        INSERT INTO invite_outbox (invite_id, email, redirect_to)
+                        SELECT i.id, i.invited_email, $6
+                        FROM invite i
+                        WHERE i.invited_user_id IS NULL
+                    )
+                    SELECT a.is_admin, i.id, i.invited_user_id, i.invited_email
+                    FROM allowed a
+                    LEFT JOIN invite i ON TRUE
+                """, team_id, inviter_id, role, user_ids, emails, redirect_to,
+                    [new_id(shard) for _ in user_ids])
+            except asyncpg.UndefinedTableError:
+                raise _invites_table_missing()
+        if not rows[0]["is_admin"]:
+            return None
+        return [row for row in rows if row["id"] is not None]
+
+    async def list_for_user(self, user_id):
+        try:
+            shard_rows = await fan_out("fetch", """
+                SELECT
+                    ti.*,
+                    t.name AS team_name,
+                    u.name AS invited_by_name,
+                    u.email AS invited_by_email
+                FROM team_invites ti
+                JOIN teams t ON t.id = ti.team_id
+                JOIN users u ON u.id = ti.invited_by
+                WHERE ti.invited_user_id = $1
+                  AND ti.status = 'pending'
+                  AND t.deleted_at IS NULL
+                ORDER BY ti.created_at DESC
+            """, user_id, read_only=True)
+        except asyncpg.UndefinedTableError:
+            raise _invites_table_missing()
+        return merge_rows(shard_rows, "created_at", descending=True)
+
+    async def accept(self, invite_id, user_id):
+        async with _connection(shard=await locate("invite", invite_id)) as db:
+            try:
+                # Accepting and joining happen in one statement; only one
+                # accept of a pending invite can win, so the membership insert
+                # cannot race.
+                return await db.fetchrow("""
+                    WITH accepted AS (
+                        UPDATE team_invites
+                        SET status = 'accepted', responded_at = NOW()
+                        WHERE id = $1
+                          AND invited_user_id = $2
+                          AND status = 'pending'
+                          AND team_id IN (SELECT id FROM teams WHERE deleted_at IS NULL)
+                        RETURNING *
+                    ),
+                    joined AS (
+                        INSERT INTO team_members (user_id, team_id, role)
+                        SELECT a.invited_user_id, a.team_id, a.role
+                        FROM accepted a
+                        WHERE NOT EXISTS (
+                            SELECT 1
+                            FROM team_members tm
+                            WHERE tm.team_id = a.team_id
+                              AND tm.user_id = a.invited_user_id
+                        )
+                    )
+                    SELECT * FROM accepted
+                """, invite_id, user_id)
+            except asyncpg.UndefinedTableError:
+                raise _invites_table_missing()
+
+    async def decline(self, invite_id, user_id):
+        async with _connection(shard=await locate("invite", invite_id)) as db:
+            try:
+                return await db.fetchrow("""
+                    UPDATE team_invites
+                    SET status = 'declined', responded_at = NOW()
+                    WHERE id = $1
+                      AND invited_user_id = $2
+                      AND status = 'pending'
+                    RETURNING *
+                """, invite_id, user_id)
+            except asyncpg.UndefinedTableError:
+                raise _invites_table_missing()
+
+
+class PostgresStorage(Storage):
+    def __init__(self):
+        self.users = PostgresUsers()
+        self.tasks = PostgresTasks()
+        self.dependencies = PostgresDependencies()
+        self.comments = PostgresComments()
+        self.teams = PostgresTeams()
+        self.members = PostgresMembers()
+        self.invites = PostgresInvites()
@@ -0,0 +1,53 @@
+"""Task dependency graphs ("blocked by" edges within a team).
+
+Storage walks the graph breadth-first from one task, at most
+GRAPH_MAX_NODES tasks per direction; the critical path is then computed
+here in a single topological pass over the upstream part.
+"""
+import os
+from collections import defaultdict, deque
+from collections.abc import Iterable, Mapping
+
+GRAPH_MAX_NODES = int(os.getenv("GRAPH_MAX_NODES", "2000"))
+
+
+def critical_path(root_id, nodes: Mapping, edges: Iterable[tuple]) -> list:
+    """Longest chain of open tasks that ends at ``root_id``, first blocker first.
+
+    ``nodes`` maps task ids to rows with a status; ``edges`` holds
+    (task_id, blocked_by) pairs. Done tasks block nothing, so they (and
+    blockers reached only through them) are left out. Kahn's algorithm keeps
+    this linear in nodes plus edges. Ties go to the blocker with the
+    lowest id, so the answer does not depend on row order.
+    """
+    root = nodes.get(root_id)
+    if root is None or root["status"] == "done":
+        return []
+
+    open_ids = {task_id for task_id, row in nodes.items() if row["status"] != "done"}
+    blocks = defaultdict(list)
+    pending = dict.fromkeys(open_ids, 0)
+    for task_id, blocked_by in edges:
+        if task_id in open_ids and blocked_by in open_ids:
+            blocks[blocked_by].append(task_id)
+            pending[task_id] += 1
+
+    length = dict.fromkeys(open_ids, 1)
+    previous = {}
+    ready = deque(task_id for task_id, count in pending.items() if count == 0)
+    while ready:
+        current = ready.popleft()
+        for task_id in blocks[current]:
+            longer = length[current] + 1
+            if longer > length[task_id] or (longer == length[task_id] and current < previous[task_id]):
+                length[task_id] = longer
+                previous[task_id] = current
+            pending[task_id] -= 1
+            if not pending[task_id]:
+                ready.append(task_id)
+
+    path = [root_id]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+    path.reverse()
+    return path
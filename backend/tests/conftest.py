@@ -0,0 +1,90 @@
+"""Shared setup for the backend tests.
+
+Tests that need Postgres run against TEST_DATABASE_URL and are skipped when
+it is not set. That database is disposable: its public schema is dropped
+and migrated from scratch once per test session, and the tables are
+emptied before every test.
+
+    pip install -r requirements-dev.txt
+    TEST_DATABASE_URL=postgresql://postgres@localhost:5432/taskflow_test pytest
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "").strip()
+
+# Set before the app modules are imported, as they read the environment (and
+# .env, which does not override these) at import time.
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "postgresql://localhost/taskflow_test_unset"
+os.environ["DATABASE_SSL"] = os.getenv("TEST_DATABASE_SSL", "disable")
+os.environ["SHARD_DATABASE_URLS"] = ""
+os.environ["DATABASE_REPLICA_URLS"] = ""
+# No background workers, and every read reaches the database.
+for flag in (
+    "OUTBOX_WORKER_ENABLED",
+    "ARCHIVE_ENABLED",
+    "PURGE_ENABLED",
+    "COUNTER_REPAIR_ENABLED",
+    "VISIBILITY_REPAIR_ENABLED",
+    "IDEMPOTENCY_PURGE_ENABLED",
+    "RANK_REBALANCE_ENABLED",
+    "USER_REPLICATION_ENABLED",
+    "CACHE_ENABLED",
+):
+    os.environ[flag] = "false"
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def run(coro):
+    """Run a test coroutine; the tests use plain connections (no pool), so
+    each one can have its own event loop."""
+    return asyncio.run(coro)
+
+
+async def _reset_schema():
+    import migrations
+    from db import connect
+
+    db = await connect()
+    try:
+        await db.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+        await migrations.migrate(db)
+    finally:
+        await db.close()
+
+
+async def _truncate():
+    from db import connect
+
+    db = await connect()
+    try:
+        tables = await db.fetchval("""
+            SELECT string_agg(quote_ident(tablename), ', ')
+            FROM pg_tables
+            WHERE schemaname = 'public' AND tablename <> 'schema_migrations'
+        """)
+        await db.execute(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+    finally:
+        await db.close()
+
+
+@pytest.fixture(scope="session")
+def migrated_database():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    run(_reset_schema())
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture
+def database(migrated_database):
+    """An empty, fully migrated database at DATABASE_URL."""
+    run(_truncate())
+    return migrated_database
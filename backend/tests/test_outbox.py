@@ -0,0 +1,217 @@
+"""InviteOutboxWorker against a real invite_outbox, with a stub inviter in
+place of the auth provider."""
+import asyncio
+import threading
+import uuid
+
+import pytest
+
+from conftest import run
+
+import outbox
+from db import connect
+from outbox import InviteOutboxWorker, PermanentInviteError
+
+
+NEW_USER = object()
+
+
+class StubInviter:
+    """Records calls; returns a fresh auth user id unless told otherwise."""
+
+    def __init__(self, result=NEW_USER, error=None):
+        self.calls = []
+        self.result = result
+        self.error = error
+        self._lock = threading.Lock()
+
+    def __call__(self, email, redirect_to):
+        with self._lock:
+            self.calls.append((email, redirect_to))
+        if self.error is not None:
+            raise self.error
+        return str(uuid.uuid4()) if self.result is NEW_USER else self.result
+
+
+async def _seed(emails):
+    """An admin, their team, and one email invite plus outbox row per email."""
+    db = await connect()
+    try:
+        admin_id = uuid.uuid4()
+        await db.execute("INSERT INTO users (id, email, name) VALUES ($1, $2, 'Admin')", admin_id, f"{admin_id}@example.com")
+        team_id = await db.fetchval("INSERT INTO teams (name, owner_id) VALUES ('Outbox', $1) RETURNING id", admin_id)
+        for email in emails:
+            invite_id = await db.fetchval("""
+                INSERT INTO team_invites (team_id, invited_email, invited_by, role)
+                VALUES ($1, $2, $3, 'member')
+                RETURNING id
+            """, team_id, email, admin_id)
+            await db.execute("""
+                INSERT INTO invite_outbox (invite_id, email, redirect_to)
+                VALUES ($1, $2, 'http://app.example.com/invites')
+            """, invite_id, email)
+    finally:
+        await db.close()
+
+
+async def _fetch(query, *args):
+    db = await connect()
+    try:
+        return await db.fetch(query, *args)
+    finally:
+        await db.close()
+
+
+async def _outbox():
+    rows = await _fetch("""
+        SELECT email, status, attempts, last_error,
+               EXTRACT(EPOCH FROM next_attempt_at - NOW())::float8 AS due_in
+        FROM invite_outbox
+        ORDER BY id
+    """)
+    return {row["email"]: row for row in rows}
+
+
+async def _make_due():
+    db = await connect()
+    try:
+        await db.execute("UPDATE invite_outbox SET next_attempt_at = NOW() WHERE status = 'pending'")
+    finally:
+        await db.close()
+
+
+def test_claims_due_rows_in_batches(database):
+    async def scenario():
+        await _seed(["a@example.com", "b@example.com", "c@example.com"])
+        inviter = StubInviter()
+        worker = InviteOutboxWorker(inviter=inviter, batch_size=2)
+        assert await worker.run_once() == 2
+        assert await worker.run_once() == 1
+        assert await worker.run_once() == 0
+        return inviter, await _outbox()
+
+    inviter, rows = run(scenario())
+    assert sorted(email for email, _ in inviter.calls) == ["a@example.com", "b@example.com", "c@example.com"]
+    assert {row["status"] for row in rows.values()} == {"sent"}
+    assert {row["attempts"] for row in rows.values()} == {1}
+
+
+def test_concurrent_workers_claim_each_row_once(database):
+    async def scenario():
+        await _seed([f"user{i}@example.com" for i in range(6)])
+        inviter = StubInviter()
+        workers = [InviteOutboxWorker(inviter=inviter, batch_size=4) for _ in range(3)]
+        processed = await asyncio.gather(*(worker.run_once() for worker in workers))
+        return processed, inviter
+
+    processed, inviter = run(scenario())
+    assert sum(processed) == 6
+    assert len(inviter.calls) == 6
+    assert len({email for email, _ in inviter.calls}) == 6
+
+
+def test_abandoned_claim_is_retried_after_the_lease(database, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_LEASE_SECONDS", 1.0)
+    release = threading.Event()
+
+    def hanging_inviter(email, redirect_to):
+        release.wait(10)
+        return str(uuid.uuid4())
+
+    async def scenario():
+        await _seed(["late@example.com"])
+        # A worker that dies after claiming: cancelled while the send is in flight.
+        dead = asyncio.create_task(InviteOutboxWorker(inviter=hanging_inviter).run_once())
+        while (await _outbox())["late@example.com"]["attempts"] == 0:
+            await asyncio.sleep(0.05)
+        dead.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await dead
+        release.set()
+
+        inviter = StubInviter()
+        worker = InviteOutboxWorker(inviter=inviter)
+        during_lease = await worker.run_once()
+        await asyncio.sleep(1.2)
+        after_lease = await worker.run_once()
+        return during_lease, after_lease, inviter, await _outbox()
+
+    during_lease, after_lease, inviter, rows = run(scenario())
+    assert during_lease == 0
+    assert after_lease == 1
+    assert len(inviter.calls) == 1
+    assert rows["late@example.com"]["status"] == "sent"
+    assert rows["late@example.com"]["attempts"] == 2
+
+
+def test_failures_back_off_then_give_up(database, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_BACKOFF_BASE_SECONDS", 10.0)
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 3)
+
+    async def scenario():
+        await _seed(["flaky@example.com"])
+        worker = InviteOutboxWorker(inviter=StubInviter(error=RuntimeError("auth provider unavailable")))
+        seen = []
+        for _ in range(3):
+            assert await worker.run_once() == 1
+            # Not due again until the backoff has passed.
+            assert await worker.run_once() == 0
+            seen.append((await _outbox())["flaky@example.com"])
+            await _make_due()
+        return seen
+
+    first, second, third = run(scenario())
+    assert (first["status"], first["attempts"]) == ("pending", 1)
+    assert 9 < first["due_in"] <= 10
+    assert (second["status"], second["attempts"]) == ("pending", 2)
+    assert 19 < second["due_in"] <= 20
+    assert (third["status"], third["attempts"]) == ("failed", 3)
+    assert third["last_error"] == "auth provider unavailable"
+
+
+def test_permanent_error_fails_at_once(database):
+    async def scenario():
+        await _seed(["bad@example.com"])
+        worker = InviteOutboxWorker(inviter=StubInviter(error=PermanentInviteError("invalid email")))
+        await worker.run_once()
+        return await _outbox()
+
+    row = run(scenario())["bad@example.com"]
+    assert (row["status"], row["attempts"], row["last_error"]) == ("failed", 1, "invalid email")
+
+
+def test_sent_invite_provisions_and_links_the_user(database):
+    user_id = str(uuid.uuid4())
+
+    async def scenario():
+        await _seed(["jane.doe@example.com"])
+        await InviteOutboxWorker(inviter=StubInviter(result=user_id)).run_once()
+        users = await _fetch("SELECT id::text, email, name FROM users WHERE email = 'jane.doe@example.com'")
+        invites = await _fetch("SELECT invited_user_id::text FROM team_invites")
+        return users, invites, await _outbox()
+
+    users, invites, rows = run(scenario())
+    assert [tuple(row) for row in users] == [(user_id, "jane.doe@example.com", "Jane Doe")]
+    assert [row["invited_user_id"] for row in invites] == [user_id]
+    assert rows["jane.doe@example.com"]["status"] == "sent"
+
+
+def test_already_registered_links_the_existing_user(database):
+    user_id = uuid.uuid4()
+
+    async def scenario():
+        await _seed(["known@example.com", "stranger@example.com"])
+        db = await connect()
+        try:
+            await db.execute("INSERT INTO users (id, email, name) VALUES ($1, 'Known@example.com', 'Known')", user_id)
+        finally:
+            await db.close()
+        # None: the auth provider already has both; only one is an app user.
+        await InviteOutboxWorker(inviter=StubInviter(result=None)).run_once()
+        invites = await _fetch("SELECT invited_email, invited_user_id FROM team_invites")
+        return {row["invited_email"]: row["invited_user_id"] for row in invites}, await _outbox()
+
+    linked, rows = run(scenario())
+    assert linked == {"known@example.com": user_id, "stranger@example.com": None}
+    assert rows["known@example.com"]["status"] == "sent"
+    assert rows["stranger@example.com"]["status"] == "failed"
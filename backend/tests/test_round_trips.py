@@ -0,0 +1,144 @@
+"""Statements each hot endpoint sends to Postgres, counted on the real
+connections, so a change that adds a round trip to a request shows up
+here. BEGIN/COMMIT count; the pool's reset on release and the warm-up of
+connections the pool opens mid-request do not."""
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+import asyncpg
+import httpx
+from fastapi import Header
+
+from conftest import run
+
+import auth
+import main
+from db import connect
+
+_uncounted: ContextVar[bool] = ContextVar("uncounted", default=False)
+
+
+def _uncounted_call(function):
+    async def call(*args, **kwargs):
+        token = _uncounted.set(True)
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            _uncounted.reset(token)
+
+    return call
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def install(self, monkeypatch):
+        counter = self
+        for name in ("execute", "executemany", "fetch", "fetchrow", "fetchval"):
+            original = getattr(asyncpg.Connection, name)
+
+            def counted(self, *args, _original=original, **kwargs):
+                if not _uncounted.get():
+                    counter.count += 1
+                return _original(self, *args, **kwargs)
+
+            monkeypatch.setattr(asyncpg.Connection, name, counted)
+
+        monkeypatch.setattr(asyncpg.Connection, "reset", _uncounted_call(asyncpg.Connection.reset))
+        monkeypatch.setattr(main, "prepare_hot_statements", _uncounted_call(main.prepare_hot_statements))
+
+    @contextmanager
+    def measure(self):
+        """Yields a list that holds the count once the block exits."""
+        result = []
+        started = self.count
+        yield result
+        result.append(self.count - started)
+
+
+def _as_user(x_user: str = Header()):
+    return x_user
+
+
+@asynccontextmanager
+async def _client():
+    main.app.dependency_overrides[auth.verify_token] = _as_user
+    try:
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                yield client
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+async def _trips(counter, request) -> int:
+    with counter.measure() as trips:
+        response = await request
+    assert response.status_code < 300, response.text
+    return trips[0]
+
+
+def test_round_trips_per_request(database, monkeypatch):
+    counter = QueryCounter()
+    owner, member = str(uuid.uuid4()), str(uuid.uuid4())
+
+    async def scenario():
+        trips = {}
+        counter.install(monkeypatch)
+        async with _client() as client:
+            own = {"x-user": owner}
+            db = await connect()
+            try:
+                await db.execute("""
+                    INSERT INTO users (id, email, name)
+                    SELECT id, id || '@example.com', 'User'
+                    FROM unnest($1::uuid[]) AS id
+                """, [owner, member])
+            finally:
+                await db.close()
+
+            response = await client.post("/teams", json={"name": "Round trips"}, headers=own)
+            team_id = response.json()["team"]["id"]
+            task = {"title": "Task", "status": "todo", "priority": "low", "team_id": team_id}
+            for _ in range(3):
+                response = await client.post("/tasks", json=task, headers=own)
+            task_id = response.json()["task"]["id"]
+            await client.post(f"/teams/{team_id}/members", json={"user_id": member}, headers=own)
+            invites = await client.get("/users/me/team-invites", headers={"x-user": member})
+            invite_id = invites.json()["invites"][0]["id"]
+
+            trips["create team"] = await _trips(counter, client.post("/teams", json={"name": "Other"}, headers=own))
+            trips["create task"] = await _trips(counter, client.post("/tasks", json=task, headers=own))
+            trips["comment"] = await _trips(
+                counter, client.post(f"/tasks/{task_id}/comments", json={"content": "Hi"}, headers=own)
+            )
+            trips["accept invite"] = await _trips(
+                counter, client.post(f"/users/me/team-invites/{invite_id}/accept", headers={"x-user": member})
+            )
+            trips["task list"] = await _trips(counter, client.get("/tasks", headers=own))
+            trips["task full"] = await _trips(counter, client.get(f"/tasks/{task_id}/full", headers=own))
+            trips["batch"] = await _trips(counter, client.post("/batch", json={"requests": [
+                {"path": "/tasks"},
+                {"path": f"/tasks/{task_id}/full"},
+                {"path": f"/teams/{team_id}/members"},
+                {"path": "/teams"},
+            ]}, headers=own))
+        return trips
+
+    assert run(scenario()) == {
+        # One CTE each.
+        "create team": 1,
+        "comment": 1,
+        "accept invite": 1,
+        # BEGIN, the column's top rank (FOR SHARE), INSERT, COMMIT.
+        "create task": 4,
+        # Total, then the page.
+        "task list": 2,
+        # Task (the access check), comments, roster, on one connection.
+        "task full": 3,
+        # One membership check for the team, then 2 + 3 + 1 + 1.
+        "batch": 8,
+    }
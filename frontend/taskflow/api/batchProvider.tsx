@@ -0,0 +1,21 @@
+import apiClient from "@/api/clientProvider"
+import { ENDPOINTS } from "@/constants/endpoints"
+
+export interface BatchSubRequest {
+  id?: string
+  method?: "GET"
+  path: string
+}
+
+export interface BatchSubResponse<T = unknown> {
+  id?: string | null
+  path: string
+  status: number
+  body: T
+}
+
+// Run several read requests in one round trip; each item carries its own status.
+export const batchGet = async (requests: BatchSubRequest[]): Promise<BatchSubResponse[]> => {
+  const res = await apiClient.post(ENDPOINTS.BATCH, { requests })
+  return Array.isArray(res.data?.responses) ? res.data.responses : []
+}
@@ -16,8 +16,18 @@ export interface CreateCommentData {
   content: string
 }
 
-export const getTaskComments = async (taskId: string) => {
-  const res = await apiClient.get(ENDPOINTS.TASKS.COMMENTS.LIST(taskId))
+export interface CommentPageParams {
+  before?: string | null
+  limit?: number
+}
+
+export const getTaskComments = async (taskId: string, params: CommentPageParams = {}) => {
+  const res = await apiClient.get(ENDPOINTS.TASKS.COMMENTS.LIST(taskId), {
+    params: {
+      ...(params.before ? { before: params.before } : {}),
+      ...(params.limit ? { limit: params.limit } : {}),
+    },
+  })
   return res
 }
 
@@ -20,6 +20,8 @@ export interface Task {
   created_by_name?: string | null;
   team_name?: string | null;
   assigned_to_name?: string | null;
+  comment_count?: number;
+  last_comment_at?: string | null;
 }
 
 export interface CreateTaskData {
@@ -58,6 +60,12 @@ export const getTask = async (taskId: string) => {
   return res;
 };
 
+// Get a task with its first page of comments and its team roster
+export const getTaskFull = async (taskId: string) => {
+  const res = await apiClient.get(ENDPOINTS.TASKS.FULL(taskId));
+  return res;
+};
+
 // Create a new task
 export const createTask = async (taskData: CreateTaskData) => {
   const res = await apiClient.post(ENDPOINTS.TASKS.CREATE, taskData);
@@ -82,7 +82,7 @@ export const columns: ColumnDef<Task>[] = [
             <DropdownMenuItem
               onClick={() => meta?.onOpenComments?.(task)}
             >
-              View comments
+              View comments{task.comment_count ? ` (${task.comment_count})` : ""}
             </DropdownMenuItem>
             <DropdownMenuSub>
               <DropdownMenuSubTrigger
@@ -3,9 +3,11 @@
 import { useCallback, useEffect, useState } from "react"
 import { columns } from "./column"
 import { DataTable } from "./data-table"
-import { Task, createTask, deleteTask, getTasks, updateTask } from "@/api/taskProvider"
+import { Task, createTask, deleteTask, getTaskFull, getTasks, updateTask } from "@/api/taskProvider"
 import { Team, TeamMember, createTeam, getTeamMembers, getTeams } from "@/api/teamProvider"
 import { TaskComment, createTaskComment, deleteTaskComment, getTaskComments } from "@/api/commentProvider"
+import { batchGet } from "@/api/batchProvider"
+import { ENDPOINTS } from "@/constants/endpoints"
 import { BUTTON_PRIMARY, BUTTON_SECONDARY } from "@/lib/buttonStyles"
 import axios from "axios"
 
@@ -25,6 +27,10 @@ interface AssigneeOption {
 }
 
 const PAGE_SIZE = 25
+
+type TasksPayload = Task[] | { tasks?: Task[]; total?: number; max_offset?: number } | null | undefined
+type TeamsPayload = Team[] | { teams?: Team[] } | null | undefined
+
 export default function TasksPage() {
   const [loading, setLoading] = useState(true)
   const [data, setData] = useState<Task[]>([])
@@ -39,6 +45,8 @@ export default function TasksPage() {
   const [selectedTaskForComments, setSelectedTaskForComments] = useState<Task | null>(null)
   const [commentsLoading, setCommentsLoading] = useState(false)
   const [comments, setComments] = useState<TaskComment[]>([])
+  const [commentsCursor, setCommentsCursor] = useState<string | null>(null)
+  const [loadingOlderComments, setLoadingOlderComments] = useState(false)
   const [newComment, setNewComment] = useState("")
   const [creatingComment, setCreatingComment] = useState(false)
   const [deletingCommentId, setDeletingCommentId] = useState<string | null>(null)
@@ -128,72 +136,96 @@ export default function TasksPage() {
     }
   }, [assigneesByTeam, assigneesLoadingByTeam])
 
+  const applyTasksResponse = useCallback((payload: TasksPayload): void => {
+    let tasksArray: Task[] = []
+    if (Array.isArray(payload)) {
+      tasksArray = payload
+    } else if (Array.isArray(payload?.tasks)) {
+      tasksArray = payload.tasks
+    }
+
+    const normalizedTasks = tasksArray.map((task) => ({
+      ...task,
+      created_at: formatDateTime(task.created_at),
+      due_date: formatDueDate(task.due_date),
+      created_by_name: task.created_by_name || "Unknown user",
+      team_name: task.team_name || "Personal",
+      assigned_to_name:
+        task.assigned_to_name ||
+        task.assigned_to ||
+        null,
+    }))
+
+    setData(normalizedTasks)
+    if (typeof payload?.total === "number") {
+      // Pages past the API's max_offset cannot be requested, so stop there.
+      const maxOffset = Array.isArray(payload) ? undefined : payload.max_offset
+      setTotalTasks(
+        typeof maxOffset === "number"
+          ? Math.min(payload.total, maxOffset + PAGE_SIZE)
+          : payload.total
+      )
+    } else {
+      setTotalTasks(normalizedTasks.length)
+    }
+  }, [])
+
+  const applyTeamsResponse = useCallback((payload: TeamsPayload): void => {
+    if (Array.isArray(payload)) {
+      setTeams(payload)
+    } else if (Array.isArray(payload?.teams)) {
+      setTeams(payload.teams)
+    } else {
+      setTeams([])
+    }
+  }, [])
+
   const fetchTasks = useCallback(async (page: number): Promise<void> => {
     try {
       const response = await getTasks({
         limit: PAGE_SIZE,
         offset: page * PAGE_SIZE,
       })
-
-      let tasksArray: Task[] = []
-      if (Array.isArray(response.data)) {
-        tasksArray = response.data
-      } else if (Array.isArray(response.data?.tasks)) {
-        tasksArray = response.data.tasks
-      }
-
-      const normalizedTasks = tasksArray.map((task) => ({
-        ...task,
-        created_at: formatDateTime(task.created_at),
-        due_date: formatDueDate(task.due_date),
-        created_by_name: task.created_by_name || "Unknown user",
-        team_name: task.team_name || "Personal",
-        assigned_to_name:
-          task.assigned_to_name ||
-          task.assigned_to ||
-          null,
-      }))
-
-      setData(normalizedTasks)
-      if (typeof response.data?.total === "number") {
-        setTotalTasks(response.data.total)
-      } else {
-        setTotalTasks(normalizedTasks.length)
-      }
+      applyTasksResponse(response.data)
     } catch (error) {
       console.error("Error fetching tasks:", error)
       setData([])
       setTotalTasks(0)
     }
-  }, [])
+  }, [applyTasksResponse])
 
   const fetchTeams = useCallback(async (): Promise<void> => {
     try {
       const response = await getTeams()
-
-      let allTeams: Team[] = []
-      if (Array.isArray(response.data)) {
-        allTeams = response.data
-      } else if (Array.isArray(response.data?.teams)) {
-        allTeams = response.data.teams
-      }
-
-      setTeams(allTeams)
-
+      applyTeamsResponse(response.data)
     } catch (error) {
       console.error("Error fetching teams:", error)
       setTeams([])
     }
-  }, [])
+  }, [applyTeamsResponse])
 
   useEffect(() => {
+    // Tasks and teams in one batched request; fall back to separate calls.
     const loadInitialData = async (): Promise<void> => {
-      await Promise.all([fetchTasks(0), fetchTeams()])
+      try {
+        const [tasksResult, teamsResult] = await batchGet([
+          { id: "tasks", path: `${ENDPOINTS.TASKS.LIST}?limit=${PAGE_SIZE}&offset=0` },
+          { id: "teams", path: ENDPOINTS.TEAMS.LIST },
+        ])
+        if (tasksResult?.status !== 200 || teamsResult?.status !== 200) {
+          throw new Error("Batch item failed")
+        }
+        applyTasksResponse(tasksResult.body as TasksPayload)
+        applyTeamsResponse(teamsResult.body as TeamsPayload)
+      } catch (error) {
+        console.error("Error fetching initial data in batch:", error)
+        await Promise.all([fetchTasks(0), fetchTeams()])
+      }
       setLoading(false)
     }
 
     void loadInitialData()
-  }, [fetchTasks, fetchTeams])
+  }, [applyTasksResponse, applyTeamsResponse, fetchTasks, fetchTeams])
 
   useEffect(() => {
     if (loading) return
@@ -366,9 +398,56 @@ export default function TasksPage() {
           ? response.data
           : []
       setComments(nextComments)
+      setCommentsCursor(response.data?.next_cursor ?? null)
     } catch (error) {
       console.error("Error fetching comments:", error)
       setComments([])
+      setCommentsCursor(null)
+    } finally {
+      setCommentsLoading(false)
+    }
+  }, [])
+
+  const loadOlderComments = async (): Promise<void> => {
+    if (!selectedTaskForComments || !commentsCursor) return
+    try {
+      setLoadingOlderComments(true)
+      const response = await getTaskComments(selectedTaskForComments.id, { before: commentsCursor })
+      const olderComments: TaskComment[] = Array.isArray(response.data?.comments) ? response.data.comments : []
+      setComments((prev) => [...prev, ...olderComments])
+      setCommentsCursor(response.data?.next_cursor ?? null)
+    } catch (error) {
+      console.error("Error fetching older comments:", error)
+    } finally {
+      setLoadingOlderComments(false)
+    }
+  }
+
+  // One request for the drawer: comments and the team roster come back
+  // with the task instead of in a waterfall.
+  const loadTaskDrawer = useCallback(async (task: Task): Promise<void> => {
+    try {
+      setCommentsLoading(true)
+      const response = await getTaskFull(task.id)
+      setComments(Array.isArray(response.data?.comments) ? response.data.comments : [])
+      setCommentsCursor(response.data?.next_cursor ?? null)
+
+      const members: TeamMember[] = Array.isArray(response.data?.members) ? response.data.members : []
+      if (task.team_id && members.length > 0) {
+        const teamId = task.team_id
+        setAssigneesByTeam((prev) => ({
+          ...prev,
+          [teamId]: members.map((member) => ({
+            member_id: member.id,
+            user_id: member.user_id,
+            name: member.name || member.user_id,
+          })),
+        }))
+      }
+    } catch (error) {
+      console.error("Error fetching task details:", error)
+      setComments([])
+      setCommentsCursor(null)
     } finally {
       setCommentsLoading(false)
     }
@@ -377,8 +456,8 @@ export default function TasksPage() {
   const handleOpenComments = useCallback((task: Task): void => {
     setSelectedTaskForComments(task)
     setShowCommentsModal(true)
-    void loadComments(task.id)
-  }, [loadComments])
+    void loadTaskDrawer(task)
+  }, [loadTaskDrawer])
 
   const handleCreateComment = async (e: React.FormEvent<HTMLFormElement>): Promise<void> => {
     e.preventDefault()
@@ -654,6 +733,7 @@ export default function TasksPage() {
                   setShowCommentsModal(false)
                   setSelectedTaskForComments(null)
                   setComments([])
+                  setCommentsCursor(null)
                   setNewComment("")
                 }}
               >
@@ -702,6 +782,16 @@ export default function TasksPage() {
                   </div>
                 ))
               )}
+              {!commentsLoading && commentsCursor && (
+                <button
+                  type="button"
+                  onClick={() => void loadOlderComments()}
+                  disabled={loadingOlderComments}
+                  className="w-full rounded-md border border-border px-2 py-1 text-xs text-muted-foreground hover:bg-muted disabled:opacity-60"
+                >
+                  {loadingOlderComments ? "Loading..." : "Load older comments"}
+                </button>
+              )}
             </div>
           </div>
         </div>
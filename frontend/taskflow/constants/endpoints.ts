@@ -1,6 +1,7 @@
 export const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL || "http://localhost:8000";
 
 export const ENDPOINTS = {
+  BATCH: "/batch",
   AUTH: {
     LOGIN: "/login",        
     REGISTER: "/register",  
@@ -14,6 +15,7 @@ export const ENDPOINTS = {
     CREATE: "/tasks",
     LIST: "/tasks",
     GET: (taskId: string) => `/tasks/${taskId}`,
+    FULL: (taskId: string) => `/tasks/${taskId}/full`,
     UPDATE: (taskId: string) => `/tasks/${taskId}`,
     DELETE: (taskId: string) => `/tasks/${taskId}`,
     COMMENTS: {